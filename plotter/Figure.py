@@ -1,5 +1,6 @@
 from down_sampling_method import DownSamplingMethod
-from typing import List
+from figure_type import FigureType
+from typing import List, Tuple
 
 
 class Figure:
@@ -16,7 +17,12 @@ class Figure:
                  gradient_threshold: float,
                  down_sampling_method: DownSamplingMethod,
                  include_in_case: List[int],
-                 exclude_in_case: List[int]) -> None:
+                 exclude_in_case: List[int],
+                 recording: str = '',
+                 reference: str = '',
+                 type: FigureType = FigureType.TIME,
+                 windows: List[Tuple[float, float]] = [],
+                 validate: bool = False) -> None:
         self.id = id
         self.title = title
         self.units = units
@@ -29,4 +35,9 @@ class Figure:
         self.gradient_threshold = float(gradient_threshold)
         self.down_sampling_method = down_sampling_method
         self.include_in_case: List[int] = include_in_case
-        self.exclude_in_case: List[int] = exclude_in_case
\ No newline at end of file
+        self.exclude_in_case: List[int] = exclude_in_case
+        self.recording = recording
+        self.reference = reference
+        self.type = type
+        self.windows: List[Tuple[float, float]] = windows  # Time windows of spectrum and harmonics figures
+        self.validate = validate  # EMT and RMS signals are comparable quantities, paired by position in validation
\ No newline at end of file
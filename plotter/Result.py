@@ -1,4 +1,9 @@
+from __future__ import annotations
 from enum import Enum
+from typing import Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from signal_catalog import SignalInfo
 
 
 class ResultType(Enum):
@@ -7,7 +12,8 @@ class ResultType(Enum):
 
 
 class Result:
-    def __init__(self, typ : ResultType, rank : int, projectName : str, bulkname : str, fullpath : str, group : str) -> None:
+    def __init__(self, typ : ResultType, rank : int, projectName : str, bulkname : str, fullpath : str, group : str,
+                 signals : Optional[Dict[str, SignalInfo]] = None) -> None:
         self.typ = typ
         self.rank = rank
         self.projectName = projectName
@@ -15,3 +21,4 @@ class Result:
         self.fullpath = fullpath
         self.group = group
         self.shorthand = f'{group}\\{projectName}'
+        self.signals : Dict[str, SignalInfo] = signals if signals is not None else dict()
@@ -0,0 +1,151 @@
+'''
+Reading result files straight from zip and tar archives. A folder of the simulation data paths may be an archive, or a
+folder inside one, e.g. "..\\study.zip" or "..\\study.zip\\MTB_04092024154118". Files inside are addressed by the archive
+path followed by the member path, so they are listed, identified and loaded like any other file. The member index of an
+archive is read once, and members are streamed from the archive when opened, without extracting the archive.
+Random access within a member (the time index) is cheap for stored zip members and uncompressed tar archives; compressed
+members are decompressed up to the requested position.
+'''
+from __future__ import annotations
+from io import TextIOWrapper
+from os import listdir, stat
+from os.path import isdir
+from threading import Lock
+from typing import IO, Dict, List, Optional, Tuple, Union
+import re
+import tarfile
+import time
+import zipfile
+from local_cache import localCache
+
+ARCHIVE_PATTERN = re.compile(r'^(.*?\.(?:zip|tar|tar\.gz|tgz|tar\.bz2|tar\.xz))(?:[\\/](.*))?$', re.IGNORECASE)
+
+
+class ArchiveIndex:
+    '''
+    The member index of an archive: size and modification time of every file, and the folders.
+    '''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files: Dict[str, Tuple[int, float, Union[zipfile.ZipInfo, tarfile.TarInfo]]] = dict()
+        self.folders: Dict[str, Dict[str, None]] = {'': dict()}  # Children of every folder, in archive order
+        self.zip: Optional[zipfile.ZipFile] = None
+        if zipfile.is_zipfile(path):
+            self.zip = zipfile.ZipFile(path)
+            for info in self.zip.infolist():
+                if not info.is_dir():
+                    self.__register__(info.filename, info.file_size, time.mktime(info.date_time + (0, 0, -1)), info)
+        else:
+            with tarfile.open(path) as tar:
+                for info in tar.getmembers():
+                    if info.isfile():
+                        self.__register__(info.name, info.size, float(info.mtime), info)
+
+    def __register__(self, name: str, size: int, mtime: float, info: Union[zipfile.ZipInfo, tarfile.TarInfo]) -> None:
+        member = normMember(name)
+        self.files[member] = (size, mtime, info)
+        # Register the member and its parent folders with their parents
+        parts = member.split('/')
+        for depth in range(len(parts)):
+            parent, child = '/'.join(parts[:depth]), parts[depth]
+            self.folders.setdefault(parent, dict())[child] = None
+
+    def open(self, member: str) -> IO[bytes]:
+        _, _, info = self.files[member]
+        if self.zip is not None:
+            return self.zip.open(info)  # type: ignore
+        # Tar archives are not safe to share between threads, every member is read through its own handle
+        tar = tarfile.open(self.path)
+        file = tar.extractfile(info)  # type: ignore
+        if file is None:
+            tar.close()
+            raise FileNotFoundError(f'{member} not found in {self.path}.')
+        close = file.close
+
+        def closeAll() -> None:
+            close()
+            tar.close()
+        file.close = closeAll  # type: ignore
+        return file
+
+
+_archives: Dict[str, Tuple[int, float, ArchiveIndex]] = dict()
+_archivesLock = Lock()
+
+
+def normMember(member: str) -> str:
+    return '/'.join(part for part in member.replace('\\', '/').split('/') if part not in ('', '.'))
+
+
+def archiveIndex(path: str) -> ArchiveIndex:
+    '''
+    Returns the member index of the given archive, reading it on first use and whenever the archive has changed.
+    '''
+    archiveStat = stat(path)
+    with _archivesLock:
+        cached = _archives.get(path)
+        if cached is None or cached[0] != archiveStat.st_size or cached[1] != archiveStat.st_mtime:
+            cached = _archives[path] = (archiveStat.st_size, archiveStat.st_mtime, ArchiveIndex(path))
+        return cached[2]
+
+
+def splitArchive(path: str) -> Optional[Tuple[ArchiveIndex, str]]:
+    '''
+    Returns the archive index and member of a path inside an archive, or None for paths outside archives.
+    '''
+    match = ARCHIVE_PATTERN.match(path)
+    if match is None or isdir(match.group(1)):
+        return None
+    try:
+        return archiveIndex(match.group(1)), normMember(match.group(2) or '')
+    except (OSError, zipfile.BadZipFile, tarfile.TarError):
+        return None
+
+
+def listDir(path: str) -> List[str]:
+    '''
+    Lists the given folder, which may be an archive or a folder inside one.
+    '''
+    archive = splitArchive(path)
+    if archive is None:
+        return listdir(path)
+    index, member = archive
+    if member not in index.folders:
+        raise FileNotFoundError(f'Folder {member} not found in {index.path}.')
+    return list(index.folders[member])
+
+
+def fileStat(path: str) -> Tuple[int, float]:
+    '''
+    Returns size and modification time of the given file, which may be inside an archive. Folders in archives have size 0.
+    '''
+    archive = splitArchive(path)
+    if archive is None:
+        pathStat = stat(path)
+        return pathStat.st_size, pathStat.st_mtime
+    index, member = archive
+    if member in index.folders:
+        return 0, 0.0
+    if member not in index.files:
+        raise FileNotFoundError(f'{member} not found in {index.path}.')
+    size, mtime, _ = index.files[member]
+    return size, mtime
+
+
+def openFile(path: str, mode: str = 'r', newline: Optional[str] = None, mirror: bool = False) -> IO:
+    '''
+    Opens the given file for reading, in text ('r') or binary ('rb') mode. Files inside archives are streamed from the archive.
+    Other files are read from the local cache if one is set, mirroring the file to it first if mirror is set.
+    '''
+    assert mode in ('r', 'rb')
+    archive = splitArchive(path)
+    if archive is None:
+        cache = localCache()
+        if cache is not None:
+            path = cache.fetch(path) if mirror else cache.lookup(path) or path
+        return open(path, mode, newline=newline) if mode == 'r' else open(path, mode)
+    index, member = archive
+    if member not in index.files:
+        raise FileNotFoundError(f'{member} not found in {index.path}.')
+    file = index.open(member)
+    return TextIOWrapper(file, newline=newline) if mode == 'r' else file
@@ -8,7 +8,9 @@ from Result import ResultType
 from Cursor import Cursor
 from math import ceil
 from Result import Result
-from read_and_write_functions import loadEMT
+from read_and_write_functions import loadEMT, loadRMS, signalColumn
+from layout_templates import LayoutCache
+from derived_signals import DerivedSignals, isExpression, requiredColumns, signalAvailable
 
 
 def addCursors(htmlPlots: List[go.Figure],
@@ -17,7 +19,8 @@ def addCursors(htmlPlots: List[go.Figure],
                pfFlatTIme: float,
                pscadInitTime: float,
                rank: int,
-               nColumns: int):
+               nColumns: int,
+               reducedPrecision: bool = False):
     cursor_settings = [i for i in cursorDict if i.id == rank]
     if len(cursor_settings) == 0:
         return list()
@@ -41,36 +44,26 @@ def addCursors(htmlPlots: List[go.Figure],
             signalKey = result.typ.name.lower()
             rawSigNames = getattr(cursor_setting, f'{signalKey}_signals')
             totalRawSigNames.extend(rawSigNames)
+            if len(rawSigNames) == 0:
+                continue
+            columns = requiredColumns(result, rawSigNames)
             data = None
             if result.typ == ResultType.RMS:
-                data: pd.DataFrame = pd.read_csv(result.fullpath, sep=';', decimal=',',
-                                                       header=[0, 1])  # type: ignore
+                data: pd.DataFrame = loadRMS(result.fullpath, reducedPrecision, columns)
             elif result.typ == ResultType.EMT:
-                data: pd.DataFrame = loadEMT(result.fullpath)
-            if len(rawSigNames) == 0:
-                continue
+                data: pd.DataFrame = loadEMT(result.fullpath, reducedPrecision, columns)
+            derived = DerivedSignals(result.typ, data)
             for rawSigName in rawSigNames:
-                if result.typ == ResultType.RMS:
-                    # Remove hash and split signal name
-                    while rawSigName.startswith('#'):
-                        rawSigName = rawSigName[1:]
-                    splitSigName = rawSigName.split('\\')
-
-                    if len(splitSigName) == 2:
-                        sigColumn = ('##' + splitSigName[0], splitSigName[1])
-                    else:
-                        sigColumn = rawSigName
-                else:
-                    sigColumn = rawSigName
+                rawSigName, sigColumn = signalColumn(result.typ, rawSigName)
 
                 # Determine the time column and offset based on the type
                 timeColName = 'time' if result.typ == ResultType.EMT else data.columns[0]
                 timeoffset = pfFlatTIme if result.typ == ResultType.RMS else pscadInitTime
 
-                if sigColumn in data.columns:
+                if signalAvailable(rawSigName, result.signals):
                     # Get the signal data and time values
                     x.extend(data[timeColName] - timeoffset)  # type: ignore
-                    y.extend(data[sigColumn])  # type: ignore
+                    y.extend(derived.get(rawSigName) if isExpression(rawSigName) else data[sigColumn])  # type: ignore
 
         # Filter the data based on the time_ranges
         if len(y) != 0:
@@ -83,7 +76,7 @@ def addCursors(htmlPlots: List[go.Figure],
 
 
 def setupPlotLayoutCursors(config, ranksCursor: List, htmlPlots: List[go.Figure],
-                           imagePlots: List[go.Figure]):
+                           imagePlots: List[go.Figure], layoutCache: LayoutCache):
     lst: List[Tuple[int, List[go.Figure]]] = []
 
     if config.genHTML:
@@ -91,39 +84,49 @@ def setupPlotLayoutCursors(config, ranksCursor: List, htmlPlots: List[go.Figure]
     if config.genImage:
         lst.append((config.imageCursorColumns, imagePlots))
 
+    cursorKey = tuple((rankCursor.title, len(rankCursor.cursor_options)) for rankCursor in ranksCursor)
     for columnNr, plotList in lst:
-        if columnNr == 1:
-            for rankCursor in ranksCursor:
-                # Prepare cursor data for the table
-                table = create_cursor_table()
-
-                # Create a figure to contain the table
-                fig_table = go.Figure(data=[table])
-                fig_table.update_layout(title=rankCursor.title, height=140*max(len(rankCursor.cursor_options), 1))
-                plotList.append(fig_table)
-
-        elif columnNr > 1:
-            num_rows = ceil(len(ranksCursor) / columnNr)
-            titles = [rankCursor.title for rankCursor in ranksCursor]  # Gather titles for each table
-
-            # Create subplots specifically for tables
-            fig_subplots = make_subplots(rows=num_rows, cols=columnNr,
-                                         subplot_titles=titles,
-                                         specs=[[{'type': 'table'} for _ in range(columnNr)] for _ in
-                                                range(num_rows)])  # Define all as table subplots
-            height_to_use = 500
-            for i, rankCursor in enumerate(ranksCursor):
-                # Prepare cursor data for the table
-                table = create_cursor_table()
-
-                # Add table to the subplot layout
-                fig_subplots.add_trace(table, row=i // columnNr + 1, col=i % columnNr + 1)
-
-                # Update the layout of the subplot figure
-                height_to_use = max(500*len(rankCursor.cursor_options), height_to_use)
-            fig_subplots.update_layout(height=height_to_use)
-
-            plotList.append(fig_subplots)
+        if columnNr > 1:
+            plotList.extend(layoutCache.get(('cursors', columnNr, cursorKey), lambda: buildCursorLayout(ranksCursor, columnNr)))
+        else:
+            plotList.extend(buildCursorLayout(ranksCursor, columnNr))
+
+
+def buildCursorLayout(ranksCursor: List, columnNr: int) -> List[go.Figure]:
+    plotList: List[go.Figure] = []
+    if columnNr == 1:
+        for rankCursor in ranksCursor:
+            # Prepare cursor data for the table
+            table = create_cursor_table()
+
+            # Create a figure to contain the table
+            fig_table = go.Figure(data=[table])
+            fig_table.update_layout(title=rankCursor.title, height=140*max(len(rankCursor.cursor_options), 1))
+            plotList.append(fig_table)
+
+    elif columnNr > 1:
+        num_rows = ceil(len(ranksCursor) / columnNr)
+        titles = [rankCursor.title for rankCursor in ranksCursor]  # Gather titles for each table
+
+        # Create subplots specifically for tables
+        fig_subplots = make_subplots(rows=num_rows, cols=columnNr,
+                                     subplot_titles=titles,
+                                     specs=[[{'type': 'table'} for _ in range(columnNr)] for _ in
+                                            range(num_rows)])  # Define all as table subplots
+        height_to_use = 500
+        for i, rankCursor in enumerate(ranksCursor):
+            # Prepare cursor data for the table
+            table = create_cursor_table()
+
+            # Add table to the subplot layout
+            fig_subplots.add_trace(table, row=i // columnNr + 1, col=i % columnNr + 1)
+
+            # Update the layout of the subplot figure
+            height_to_use = max(500*len(rankCursor.cursor_options), height_to_use)
+        fig_subplots.update_layout(height=height_to_use)
+
+        plotList.append(fig_subplots)
+    return plotList
 
 
 def create_cursor_table():
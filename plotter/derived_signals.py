@@ -0,0 +1,199 @@
+'''
+Derived signals defined by expressions over existing signals in the figure and cursor setup.
+An expression starts with "=", e.g. "=P_pu_PoC*50" or "=sqrt({meas\\s:ppoc_pu}**2 + {meas\\s:qpoc_pu}**2)".
+Signal names that are not valid identifiers (RMS signals) are enclosed in braces. The time vector is available as "t".
+Expressions are compiled once and evaluated vectorised over NumPy arrays on first reference.
+Phasor, sequence component and instantaneous power functions of phasor_functions are available, e.g. "=pos_mag(meas_Vag_pu, meas_Vbg_pu, meas_Vcg_pu)".
+'''
+from __future__ import annotations
+from functools import partial
+from threading import Lock
+from typing import Callable, Collection, Dict, List, Set
+import ast
+import re
+import numpy as np
+import pandas as pd
+from Result import ResultType, Result
+from read_and_write_functions import signalColumn
+import phasor_functions
+
+EXPRESSION_PREFIX = '='
+TIME_NAME = 't'
+
+EXPRESSION_FUNCTIONS: Dict[str, Callable] = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'log10': np.log10,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'arctan2': np.arctan2,
+    'hypot': np.hypot,
+    'degrees': np.degrees,
+    'radians': np.radians,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'clip': np.clip,
+    'where': np.where,
+}
+
+# Functions evaluated with the time vector of the result as first argument
+TIME_FUNCTIONS: Dict[str, Callable] = {
+    'phasor_mag': phasor_functions.phasor_mag,
+    'phasor_ang': phasor_functions.phasor_ang,
+    'pos_mag': phasor_functions.pos_mag,
+    'pos_ang': phasor_functions.pos_ang,
+    'neg_mag': phasor_functions.neg_mag,
+    'neg_ang': phasor_functions.neg_ang,
+    'zero_mag': phasor_functions.zero_mag,
+    'zero_ang': phasor_functions.zero_ang,
+    'p_inst': phasor_functions.p_inst,
+    'q_inst': phasor_functions.q_inst,
+}
+
+EXPRESSION_CONSTANTS: Dict[str, float] = {
+    'pi': np.pi,
+}
+
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant, ast.Compare,
+                 ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.FloorDiv, ast.USub, ast.UAdd,
+                 ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+def isFunction(name: str) -> bool:
+    return name in EXPRESSION_FUNCTIONS or name in TIME_FUNCTIONS
+
+
+def isExpression(rawSigName: str) -> bool:
+    return rawSigName.strip().startswith(EXPRESSION_PREFIX)
+
+
+class Expression:
+    '''
+    Compiled derived signal expression. Operands are the signal names referenced by the expression.
+    '''
+    def __init__(self, text: str) -> None:
+        self.text = text.strip()
+        source = self.text[len(EXPRESSION_PREFIX):]
+
+        # Replace braced signal names with placeholder identifiers
+        self.operands: Dict[str, str] = dict()
+
+        def placeholder(match: re.Match) -> str:
+            name = match.group(1).strip()
+            for identifier, operand in self.operands.items():
+                if operand == name:
+                    return identifier
+            identifier = f'_operand{len(self.operands)}'
+            self.operands[identifier] = name
+            return identifier
+
+        source = re.sub(r'\{([^{}]+)\}', placeholder, source)
+
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f'Invalid expression "{self.text}": {e.msg}')
+
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(f'Invalid expression "{self.text}": {type(node).__name__} not allowed.')
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and isFunction(node.func.id)):
+                raise ValueError(f'Invalid expression "{self.text}": unknown function.')
+            if isinstance(node, ast.Name) and node.id not in self.operands and not isFunction(node.id) \
+                    and node.id not in EXPRESSION_CONSTANTS and node.id != TIME_NAME:
+                self.operands[node.id] = node.id
+
+        self.code = compile(tree, self.text, 'eval')
+
+    @property
+    def signals(self) -> Set[str]:
+        return set(self.operands.values())
+
+    def evaluate(self, operands: Dict[str, np.ndarray], time: np.ndarray) -> np.ndarray:
+        namespace: Dict[str, object] = dict(EXPRESSION_FUNCTIONS)
+        namespace.update({name: partial(function, time) for name, function in TIME_FUNCTIONS.items()})
+        namespace.update(EXPRESSION_CONSTANTS)
+        namespace[TIME_NAME] = time
+        for identifier, name in self.operands.items():
+            namespace[identifier] = operands[name]
+        result = eval(self.code, {'__builtins__': {}}, namespace)
+        return np.broadcast_to(np.asarray(result), time.shape)
+
+
+_compiled: Dict[str, Expression] = dict()
+_compiledLock = Lock()
+
+
+def compileExpression(text: str) -> Expression:
+    '''
+    Returns the compiled expression, compiling it on first use.
+    '''
+    with _compiledLock:
+        expression = _compiled.get(text)
+    if expression is None:
+        expression = Expression(text)
+        with _compiledLock:
+            _compiled[text] = expression
+    return expression
+
+
+def expressionSignals(rawSigNames: List[str]) -> Set[str]:
+    '''
+    Returns the signal names needed to evaluate the given signal names, replacing expressions by their operands.
+    '''
+    signals: Set[str] = set()
+    for rawSigName in rawSigNames:
+        if isExpression(rawSigName):
+            signals.update(compileExpression(rawSigName).signals)
+        else:
+            signals.add(rawSigName)
+    return signals
+
+
+def signalAvailable(rawSigName: str, signals: Collection[str]) -> bool:
+    '''
+    Returns True if the given signal, or all operands of the given expression, are among the given signal names.
+    '''
+    if isExpression(rawSigName):
+        return compileExpression(rawSigName).signals.issubset(signals)
+    return rawSigName in signals
+
+
+def requiredColumns(result: Result, rawSigNames: List[str]) -> List[int]:
+    '''
+    Returns the catalog columns of the given result needed to plot the given signals and expressions.
+    '''
+    names = expressionSignals([rawSigName for rawSigName in rawSigNames if rawSigName != ''])
+    columns: Set[int] = set()
+    for name in names:
+        cleanName = signalColumn(result.typ, name)[0]
+        if cleanName in result.signals:
+            columns.add(result.signals[cleanName].column)
+    return sorted(columns)
+
+
+class DerivedSignals:
+    '''
+    Derived signals of one loaded result. Each expression is evaluated once, when first referenced.
+    '''
+    def __init__(self, typ: ResultType, data: pd.DataFrame) -> None:
+        self.typ = typ
+        self.data = data
+        self.cache: Dict[str, pd.Series] = dict()
+
+    @property
+    def time(self) -> np.ndarray:
+        timeColName = 'time' if self.typ == ResultType.EMT else self.data.columns[0]
+        return self.data[timeColName].to_numpy()
+
+    def get(self, text: str) -> pd.Series:
+        text = text.strip()
+        if text not in self.cache:
+            expression = compileExpression(text)
+            operands = {name: self.data[signalColumn(self.typ, name)[1]].to_numpy() for name in expression.signals}
+            values = expression.evaluate(operands, self.time)
+            self.cache[text] = pd.Series(values, index=self.data.index)
+        return self.cache[text]
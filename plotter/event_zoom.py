@@ -0,0 +1,99 @@
+'''
+Zoom windows around case events. Event times are taken from the case sheet or, without a case sheet, located by
+change-point detection on the plotted signals. Zoom windows are plotted at full resolution while the overview trace
+of the figure is downsampled to a fixed number of points.
+'''
+from __future__ import annotations
+from typing import List, Optional, Tuple
+import numpy as np
+from Case import Case
+
+OVERVIEW_POINTS = 2000
+CHANGE_POINT_THRESHOLD = 20.0  # Robust standard deviations of the sample-to-sample change
+
+
+class EventZoom:
+    def __init__(self, events: List[float], before: float, after: float) -> None:
+        self.events = events
+        self.before = before
+        self.after = after
+
+    def windows(self) -> List[Tuple[float, float]]:
+        return [(event - self.before, event + self.after) for event in self.events]
+
+
+def caseEventTimes(case: Case) -> List[float]:
+    '''
+    Returns the sorted event times of the given case. Faults also give an event at the fault clearing time.
+    '''
+    times: List[float] = list()
+    for eventType, eventTime, _, eventX2 in case.Events:
+        if eventType.lower() == 'nan' or not np.isfinite(eventTime):
+            continue
+        times.append(eventTime)
+        if eventType.count('fault') > 0 and eventType != 'Clear fault' and isinstance(eventX2, float) and eventX2 > 0.0:
+            times.append(eventTime + eventX2)
+    return sorted(set(times))
+
+
+def changePoints(time: np.ndarray, values: np.ndarray, minSeparation: float) -> List[Tuple[float, float]]:
+    '''
+    Locates abrupt changes of the given signal. A sample is a change point if its change from the previous sample exceeds
+    the median change by CHANGE_POINT_THRESHOLD robust standard deviations. Change points closer than minSeparation
+    are merged into one event. Returns (time, strength) of each event, the strength being the largest change relative to the threshold.
+    '''
+    time = np.asarray(time, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    time, values = time[finite], values[finite]
+    if len(values) < 3:
+        return []
+    valueRange = float(np.ptp(values))
+    if valueRange == 0.0:
+        return []
+
+    change = np.abs(np.diff(values))
+    median = float(np.median(change))
+    mad = float(np.median(np.abs(change - median)))
+    threshold = median + max(CHANGE_POINT_THRESHOLD * 1.4826 * mad, 1e-3 * valueRange)
+
+    index = np.flatnonzero(change > threshold)
+    if len(index) == 0:
+        return []
+    times = time[index + 1]
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(times) > minSeparation)))
+    strength = np.maximum.reduceat(change[index], starts) / threshold
+    return list(zip(times[starts].tolist(), strength.tolist()))
+
+
+def selectEvents(candidates: List[Tuple[float, float]], minSeparation: float, maxEvents: int) -> List[float]:
+    '''
+    Merges candidate events of several signals closer than minSeparation and returns the times of the strongest events in time order.
+    '''
+    events: List[Tuple[float, float]] = list()
+    for eventTime, strength in sorted(candidates):
+        if len(events) > 0 and eventTime - events[-1][0] <= minSeparation:
+            events[-1] = (events[-1][0], max(events[-1][1], strength))
+        else:
+            events.append((eventTime, strength))
+    strongest = sorted(events, key=lambda event: event[1], reverse=True)[:maxEvents]
+    return sorted(eventTime for eventTime, _ in strongest)
+
+
+def windowMask(x: np.ndarray, window: Tuple[float, float]) -> np.ndarray:
+    return (x >= window[0]) & (x <= window[1])
+
+
+def eventZoom(events: Optional[List[float]], before: float, after: float, maxEvents: int) -> Optional[EventZoom]:
+    '''
+    Returns the zoom windows of the first maxEvents events. Events within the window of the previous event share its window.
+    '''
+    if events is None or maxEvents <= 0:
+        return None
+    merged: List[float] = list()
+    for event in sorted(events):
+        if len(merged) == 0 or event > merged[-1] + after:
+            merged.append(event)
+    if len(merged) == 0:
+        return None
+    return EventZoom(merged[:maxEvents], before, after)
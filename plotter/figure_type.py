@@ -0,0 +1,13 @@
+from enum import Enum
+
+class FigureType(Enum):
+    TIME = 1
+    SPECTRUM = 2
+    HARMONICS = 3
+
+    @classmethod
+    def from_string(cls, string : str):
+        try:
+            return cls[string.strip().upper() or 'TIME']
+        except KeyError:
+            raise ValueError(f"{string} is not a valid {cls.__name__}")
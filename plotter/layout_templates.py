@@ -0,0 +1,27 @@
+'''
+Cache of plot layouts shared between ranks. Each layout is built once and every rank using it gets a clone.
+Cloning validates the whole layout again, including its template, so it only pays off for subplot grids, which are
+slow to build. Plain figures are cheaper to build than to clone and are not cached.
+'''
+from __future__ import annotations
+import plotly.graph_objects as go  # type: ignore
+from threading import Lock
+from typing import Callable, Dict, Hashable, List
+
+
+class LayoutCache:
+    def __init__(self) -> None:
+        self.templates: Dict[Hashable, List[go.Figure]] = dict()
+        self.lock = Lock()
+
+    def get(self, key: Hashable, build: Callable[[], List[go.Figure]]) -> List[go.Figure]:
+        '''
+        Returns clones of the layout stored under the given key. The layout is built on first use.
+        '''
+        with self.lock:
+            templates = self.templates.get(key)
+        if templates is None:
+            built = build()
+            with self.lock:
+                templates = self.templates.setdefault(key, built)
+        return [go.Figure(template) for template in templates]
@@ -0,0 +1,198 @@
+'''
+Read-through local disk cache for simulation data folders on slow network shares. Result files are mirrored to the local
+cache folder when their data is read, and later reads use the local copy while the source file is unchanged (size and
+modification time). The cache is bounded in size by evicting the least recently used copies. The files of the next ranks
+in the schedule can be prefetched in the background while the current ranks are processed, hiding the network latency.
+Header reads use a local copy if there is one but do not mirror the file, so scanning a study does not copy it.
+Files inside archives are not mirrored. The copies are kept in a subfolder of the configured folder created by the cache,
+and only files named like its copies are removed from it, so pointing the cache at an existing folder is safe.
+'''
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import sha1
+from os import listdir, makedirs, remove, replace, stat
+from os.path import abspath, basename, exists, join
+from shutil import copyfile
+from threading import Lock
+from typing import Dict, Iterable, Optional
+import json
+import re
+import time
+from plotter_logging import LogLevel, log
+
+CACHE_INDEX_FILE = 'cache_index.json'
+CACHE_FOLDER = 'mtb_cache'
+CACHE_FILE_PATTERN = re.compile(r'^[0-9a-f]{16}_.+$')  # Copies and partial copies named by localName
+MB = 1024 * 1024
+
+
+class CacheEntry:
+    def __init__(self, local: str, size: int, mtime: float, lastUsed: float) -> None:
+        self.local = local  # File name in the cache folder
+        self.size = size  # Size and modification time of the source file when copied
+        self.mtime = mtime
+        self.lastUsed = lastUsed
+
+
+class LocalCache:
+    def __init__(self, directory: str, size: float, workers: int = 2) -> None:
+        self.directory = join(directory, CACHE_FOLDER)
+        self.size = size * MB
+        self.entries: Dict[str, CacheEntry] = dict()
+        self.pending: Dict[str, Future] = dict()
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max(workers, 1), thread_name_prefix='prefetch')
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.evicted = 0
+        if not exists(self.directory):
+            makedirs(self.directory)
+        self.__load__()
+
+    @property
+    def used(self) -> int:
+        return sum(entry.size for entry in self.entries.values())
+
+    def __load__(self) -> None:
+        indexPath = join(self.directory, CACHE_INDEX_FILE)
+        if exists(indexPath):
+            try:
+                with open(indexPath, 'r') as file:
+                    self.entries = {path: CacheEntry(*entry) for path, entry in json.load(file).items()}
+            except (OSError, ValueError, TypeError):
+                log(f'Local cache index {indexPath} could not be read. Starting with an empty cache.', level=LogLevel.WARNING)
+        # Copies missing from the folder are forgotten, files missing from the index are left over from an interrupted run
+        self.entries = {path: entry for path, entry in self.entries.items() if exists(join(self.directory, entry.local))}
+        known = set(entry.local for entry in self.entries.values())
+        for file in listdir(self.directory):
+            if file not in known and CACHE_FILE_PATTERN.match(file):
+                try:
+                    remove(join(self.directory, file))
+                except OSError:
+                    pass
+
+    def save(self) -> None:
+        with self.lock:
+            index = {path: [entry.local, entry.size, entry.mtime, entry.lastUsed] for path, entry in self.entries.items()}
+        with open(join(self.directory, CACHE_INDEX_FILE), 'w') as file:
+            json.dump(index, file)
+
+    def localName(self, path: str) -> str:
+        return f'{sha1(abspath(path).encode()).hexdigest()[:16]}_{basename(path)}'
+
+    def lookup(self, path: str) -> Optional[str]:
+        '''
+        Returns the local copy of the given file if it is up to date, without copying it.
+        '''
+        try:
+            sourceStat = stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry.size != sourceStat.st_size or entry.mtime != sourceStat.st_mtime:
+                return None
+            entry.lastUsed = time.time()
+            return join(self.directory, entry.local)
+
+    def fetch(self, path: str) -> str:
+        '''
+        Returns the local copy of the given file, copying it first if needed or waiting for its prefetch.
+        Returns the source path if the file cannot be cached.
+        '''
+        local = self.lookup(path)
+        with self.lock:
+            if local is not None:
+                self.hits += 1
+                return local
+            self.misses += 1
+        return self.__transfer__(path) or path
+
+    def prefetch(self, paths: Iterable[str]) -> None:
+        '''
+        Copies the given files to the cache in the background, skipping files already cached or being copied.
+        '''
+        for path in paths:
+            with self.lock:
+                if path in self.pending:
+                    continue
+            if self.lookup(path) is None:
+                self.executor.submit(self.__transfer__, path, True)
+
+    def __transfer__(self, path: str, prefetch: bool = False) -> Optional[str]:
+        '''
+        Copies the given file to the cache. A file is copied by one thread at a time, other threads wait for its copy.
+        '''
+        with self.lock:
+            future = self.pending.get(path)
+            owner = future is None
+            if owner:
+                future = self.pending[path] = Future()
+        if not owner:
+            return future.result()  # type: ignore
+        local: Optional[str] = None
+        try:
+            local = self.__copy__(path)
+        finally:
+            with self.lock:
+                self.pending.pop(path, None)
+                if prefetch and local is not None:
+                    self.prefetched += 1
+            future.set_result(local)  # type: ignore
+        return local
+
+    def __copy__(self, path: str) -> Optional[str]:
+        try:
+            sourceStat = stat(path)
+            if sourceStat.st_size > self.size:
+                return None
+            local = self.localName(path)
+            partial = join(self.directory, f'{local}.part')
+            copyfile(path, partial)
+            replace(partial, join(self.directory, local))
+        except OSError as e:
+            log(f'Could not copy {path} to the local cache: {e}', level=LogLevel.WARNING)
+            return None
+        with self.lock:
+            self.entries[path] = CacheEntry(local, sourceStat.st_size, sourceStat.st_mtime, time.time())
+            self.__evict__(path)
+        return join(self.directory, local)
+
+    def __evict__(self, keep: str) -> None:
+        '''
+        Removes the least recently used copies until the cache fits its size. Called with the lock held.
+        '''
+        used = self.used
+        for path, entry in sorted(self.entries.items(), key=lambda item: item[1].lastUsed):
+            if used <= self.size:
+                break
+            if path == keep:
+                continue
+            try:
+                remove(join(self.directory, entry.local))
+            except OSError:
+                continue  # Still open for reading, evicted later
+            del self.entries[path]
+            used -= entry.size
+            self.evicted += 1
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.save()
+
+    def report(self) -> str:
+        return (f'Local cache: {self.hits} hits, {self.misses} misses, {self.prefetched} files prefetched, '
+                f'{self.evicted} evicted, {self.used / MB:.0f} of {self.size / MB:.0f} MB used')
+
+
+_localCache: Optional[LocalCache] = None
+
+
+def setLocalCache(cache: Optional[LocalCache]) -> None:
+    global _localCache
+    _localCache = cache
+
+
+def localCache() -> Optional[LocalCache]:
+    return _localCache
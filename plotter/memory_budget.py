@@ -0,0 +1,111 @@
+'''
+Memory budget for concurrent rank processing. The footprint of a rank is estimated from the size of its result files before loading.
+'''
+from __future__ import annotations
+from threading import Condition
+from typing import Dict, List, Optional, Tuple
+from warnings import warn
+from Result import ResultType, Result
+from read_and_write_functions import emtFragments
+from archives import fileStat
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+    warn('memory_budget.py: psutil module not found. Peak memory logging disabled.')
+
+MB = 1024 * 1024
+
+
+def resultFiles(result: Result) -> List[str]:
+    '''
+    Returns the files that are read when loading the given result.
+    '''
+    if result.typ == ResultType.EMT:
+        return emtFragments(result.fullpath)
+    return [result.fullpath]
+
+
+def estimateRankMemory(resultList: List[Result], estimateFactor: float, reducedPrecision: bool) -> float:
+    '''
+    Estimates the peak memory in MB needed to plot a rank as the total size of its result files times the estimate factor.
+    Signal data loaded as float32 takes half the memory of float64.
+    '''
+    fileSize = 0
+    for result in resultList:
+        for file in resultFiles(result):
+            try:
+                fileSize += fileStat(file)[0]
+            except OSError:
+                pass
+    estimate = fileSize * estimateFactor / MB
+    return estimate / 2 if reducedPrecision else estimate
+
+
+def processMemory() -> Optional[float]:
+    '''
+    Returns the resident memory of the plotter process in MB, or None if psutil is not available.
+    '''
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / MB
+
+
+class MemoryGovernor:
+    '''
+    Admits ranks for concurrent processing while the projected memory of all running ranks fits within the budget.
+    A budget of 0 disables the governor. Ranks estimated above the budget are only admitted when nothing else is running.
+    '''
+    def __init__(self, budget: float) -> None:
+        self.budget = budget
+        self.reserved: Dict[int, float] = dict()
+        self.peaks: Dict[int, float] = dict()
+        self.peak: float = 0.0
+        self.peakProjected: float = 0.0
+        self.condition = Condition()
+
+    @property
+    def projected(self) -> float:
+        return sum(self.reserved.values())
+
+    def admits(self, estimate: float) -> bool:
+        if self.budget <= 0 or len(self.reserved) == 0:
+            return True
+        return self.projected + estimate <= self.budget
+
+    def reserve(self, rank: int, estimate: float) -> None:
+        with self.condition:
+            self.reserved[rank] = estimate
+            self.peaks[rank] = processMemory() or 0.0
+            self.peakProjected = max(self.peakProjected, self.projected)
+
+    def acquire(self, rank: int, estimate: float) -> None:
+        '''
+        Waits until the rank is admitted and reserves its estimate. For concurrent workers, woken when a rank is released.
+        '''
+        with self.condition:
+            while not self.admits(estimate):
+                self.condition.wait()
+            self.reserve(rank, estimate)
+
+    def release(self, rank: int) -> Tuple[float, float]:
+        '''
+        Releases the reservation of the given rank. Returns the estimate and the peak process memory observed while the rank was running.
+        '''
+        with self.condition:
+            released = self.reserved.pop(rank), self.peaks.pop(rank)
+            self.condition.notify_all()
+            return released
+
+    def sample(self) -> None:
+        '''
+        Samples the process memory and updates the peak of every running rank.
+        '''
+        current = processMemory()
+        if current is None:
+            return
+        with self.condition:
+            self.peak = max(self.peak, current)
+            for rank in self.peaks.keys():
+                self.peaks[rank] = max(self.peaks[rank], current)
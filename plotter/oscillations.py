@@ -0,0 +1,310 @@
+'''
+Oscillation and damping analysis. The figure signals of every rank are cut into windows after the case events (or the
+detected events when the case setup has none), resampled to a common number of samples, and the oscillation modes of all
+signals and windows of a result are identified at once with a batched matrix pencil method. The dominant modes are
+written to a sortable table, and modes damped less than the config limit can be annotated on the rank figures.
+'''
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from os.path import exists
+from typing import Dict, List, Optional, Tuple
+import csv
+import numpy as np
+from Figure import Figure
+from figure_type import FigureType
+from Result import ResultType, Result
+from read_configs import ReadConfig
+from read_and_write_functions import signalColumn
+from result_set import ResultSet
+from derived_signals import signalAvailable
+from event_zoom import changePoints, selectEvents
+from recordings import uniqueTime
+from validation import loadSignals
+from plotter_logging import LogLevel, log, logRank
+
+OSCILLATION_FILE = 'oscillations'  # Written as .csv and .html
+OSCILLATION_SAMPLES = 400  # Samples per window
+OSCILLATION_MODES = 2  # Dominant modes reported per signal and window
+MAX_GROWTH = 300.0  # Largest natural logarithm of the growth of a pole over a window
+
+
+class OscillationMode:
+    def __init__(self,
+                 rank: int,
+                 figure: int,
+                 result: str,
+                 signal: str,
+                 start: float,
+                 end: float,
+                 frequency: float,
+                 damping: float,
+                 amplitude: float,
+                 poorlyDamped: bool) -> None:
+        self.rank = rank
+        self.figure = figure  # Figure id
+        self.result = result
+        self.signal = signal
+        self.start = start
+        self.end = end
+        self.frequency = frequency  # Hz
+        self.damping = damping  # Damping ratio
+        self.amplitude = amplitude
+        self.poorlyDamped = poorlyDamped
+
+
+def matrixPencil(y: np.ndarray, dt: float, order: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Identifies the modes of each row of y (signals x samples) with the matrix pencil method, all rows at once.
+    Returns the complex poles s (rad/s) and the complex residues of each row, both of shape signals x order.
+    '''
+    nSignals, n = y.shape
+    pencil = n // 3
+    order = min(order, pencil)
+    hankel = np.lib.stride_tricks.sliding_window_view(y, pencil + 1, axis=1)  # signals x (n - pencil) x (pencil + 1)
+    _, _, vh = np.linalg.svd(hankel, full_matrices=False)
+    v = np.conj(np.swapaxes(vh[:, :order, :], 1, 2))  # Dominant right singular vectors, signals x (pencil + 1) x order
+    v1, v2 = v[:, :-1, :], v[:, 1:, :]
+    z = np.linalg.eigvals(np.linalg.pinv(v1) @ v2)
+    # Poles growing beyond the float range over the window are numerical artefacts of a signal with fewer modes than
+    # the order, and are set to zero (no mode) before they overflow the Vandermonde matrix
+    with np.errstate(divide='ignore'):
+        z = np.where(np.isfinite(z) & ((n - 1) * np.log(np.abs(z)) < MAX_GROWTH), z, 0.0)
+    # Residues by least squares on the Vandermonde matrix of the poles
+    vandermonde = z[:, None, :] ** np.arange(n)[None, :, None]
+    residues = (np.linalg.pinv(vandermonde) @ y[:, :, None].astype(complex))[:, :, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        poles = np.log(z) / dt
+    return poles, residues
+
+
+def dominantModes(poles: np.ndarray,
+                  residues: np.ndarray,
+                  minFrequency: float,
+                  maxFrequency: float,
+                  minAmplitude: float) -> List[List[Tuple[float, float, float]]]:
+    '''
+    Returns the OSCILLATION_MODES largest oscillating modes of each row as (frequency, damping ratio, amplitude).
+    Modes outside minFrequency to maxFrequency or below minAmplitude are left out.
+    '''
+    frequency = poles.imag / (2 * np.pi)
+    magnitude = np.abs(poles)
+    with np.errstate(invalid='ignore'):
+        damping = np.where(magnitude > 0, -poles.real / np.where(magnitude > 0, magnitude, 1.0), 1.0)
+    amplitude = 2 * np.abs(residues)  # Each oscillation is a pair of conjugate poles
+    modes: List[List[Tuple[float, float, float]]] = list()
+    for row in range(poles.shape[0]):
+        keep = np.flatnonzero(np.isfinite(poles[row]) & (frequency[row] >= minFrequency) & (frequency[row] <= maxFrequency) &
+                              (amplitude[row] >= minAmplitude))
+        keep = keep[np.argsort(amplitude[row, keep])[::-1]][:OSCILLATION_MODES]
+        modes.append([(float(frequency[row, i]), float(damping[row, i]), float(amplitude[row, i])) for i in keep])
+    return modes
+
+
+def eventWindows(boundaries: List[Tuple[float, str]], end: float, delay: float, length: float) -> List[Tuple[float, float]]:
+    '''
+    Returns the analysis windows after the given event boundaries (time, name), ending at the next boundary or the end
+    of the result. The fault period itself is not analysed, and windows shorter than half the window length are left out.
+    '''
+    boundaries = sorted(boundaries)
+    windows: List[Tuple[float, float]] = list()
+    for i, (event, name) in enumerate(boundaries):
+        if name == 'fault':
+            continue
+        stop = min(event + delay + length, boundaries[i + 1][0] if i + 1 < len(boundaries) else end, end)
+        if stop - (event + delay) >= length / 2:
+            windows.append((event + delay, stop))
+    return windows
+
+
+def resampleWindow(time: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    '''
+    Samples the piecewise linear signal at the evenly spaced grid after averaging it with a triangular window reaching
+    one grid step to either side, computed exactly as the second difference of its second integral. The window has
+    zeros at the multiples of the sample rate, so harmonics that would fold into the low frequencies are suppressed.
+    '''
+    if len(time) < 2:
+        return np.full(len(grid), values[0] if len(values) > 0 else 0.0)
+    dt = grid[1] - grid[0]
+    # Integrated over the window only, relative to its first value, to keep the integrals small
+    lo = max(int(np.searchsorted(time, grid[0] - dt, side='right')) - 1, 0)
+    hi = min(int(np.searchsorted(time, grid[-1] + dt, side='left')) + 1, len(time))
+    lo = min(lo, len(time) - 2)
+    time = time[lo:hi]
+    offset = values[lo]
+    y = values[lo:hi] - offset
+    step = np.diff(time)
+    slope = np.diff(y) / step
+    first = np.concatenate(([0.0], np.cumsum((y[:-1] + y[1:]) / 2 * step)))
+    second = np.concatenate(([0.0], np.cumsum(first[:-1] * step + y[:-1] * step ** 2 / 2 + slope * step ** 3 / 6)))
+
+    def secondIntegral(t: np.ndarray) -> np.ndarray:
+        i = np.clip(np.searchsorted(time, t, side='right') - 1, 0, len(time) - 2)
+        h = t - time[i]
+        return second[i] + first[i] * h + y[i] * h ** 2 / 2 + slope[i] * h ** 3 / 6
+
+    return offset + (secondIntegral(grid + dt) - 2 * secondIntegral(grid) + secondIntegral(grid - dt)) / dt ** 2
+
+
+def figureSignals(typ: ResultType, result: Result, figures: List[Figure], figureIds: List[int]) -> List[Tuple[Figure, str]]:
+    '''
+    Returns the signals of the selected time figures available in the given result.
+    '''
+    signals: List[Tuple[Figure, str]] = list()
+    for figure in figures:
+        if figure.type != FigureType.TIME or (len(figureIds) > 0 and figure.id not in figureIds):
+            continue
+        for sig in range(1, 4):
+            signal = getattr(figure, f'{typ.name.lower()}_signal_{sig}')
+            if signal != '' and signalAvailable(signalColumn(typ, signal)[0], result.signals):
+                signals.append((figure, signal))
+    return signals
+
+
+def analyseRank(rank: int,
+                resultSet: ResultSet,
+                figures: List[Figure],
+                boundaries: List[Tuple[float, str]],
+                config: ReadConfig) -> List[OscillationMode]:
+    '''
+    Identifies the dominant oscillation modes of the figure signals of each result of the rank after each event.
+    '''
+    modes: List[OscillationMode] = list()
+    with logRank(rank):
+        for result in resultSet.resultDict.get(rank, []):
+            if result.typ not in (ResultType.EMT, ResultType.RMS):
+                continue
+            signals = figureSignals(result.typ, result, figures, config.oscillationFigures)
+            if len(signals) == 0:
+                continue
+            time, values = loadSignals(resultSet, result, [signal for _, signal in signals])
+            events = boundaries
+            if len(events) == 0:
+                candidates = [point for series in values for point in changePoints(time, series, config.oscillationWindow)]
+                events = [(event, 'event') for event in selectEvents(candidates, config.oscillationWindow, config.zoomMaxEvents)]
+            windows = eventWindows(events, float(time[-1]), config.oscillationDelay, config.oscillationWindow)
+            if len(windows) == 0:
+                continue
+
+            # Every signal and window low-pass filtered and resampled to the same number of samples, detrended,
+            # and identified in one batch
+            rows: List[Tuple[Figure, str, float, float]] = list()
+            batch = np.empty((len(signals) * len(windows), OSCILLATION_SAMPLES))
+            dts = np.empty(len(signals) * len(windows))
+            for (figure, signal), series in zip(signals, values):
+                x, y = uniqueTime(time, series)
+                for start, end in windows:
+                    grid = np.linspace(start, end, OSCILLATION_SAMPLES)
+                    batch[len(rows)] = resampleWindow(x, y, grid)
+                    dts[len(rows)] = grid[1] - grid[0]
+                    rows.append((figure, signal, start, end))
+            sampleIndex = np.arange(OSCILLATION_SAMPLES)
+            slope, offset = np.polyfit(sampleIndex, batch.T, 1)
+            batch -= offset[:, None] + slope[:, None] * sampleIndex[None, :]
+
+            # Windows of equal length share the sample time and are identified together. Slower modes than one cycle
+            # per window are trends rather than oscillations.
+            for dt in np.unique(dts):
+                select = np.flatnonzero(dts == dt)
+                poles, residues = matrixPencil(batch[select], float(dt), config.oscillationOrder)
+                for i, rowModes in zip(select, dominantModes(poles, residues, 1.0 / (dt * (OSCILLATION_SAMPLES - 1)),
+                                                             config.oscillationMaxFrequency, config.oscillationMinAmplitude)):
+                    figure, signal, start, end = rows[i]
+                    for frequency, damping, amplitude in rowModes:
+                        modes.append(OscillationMode(rank, figure.id, result.shorthand, signal, start, end, frequency,
+                                                     damping, amplitude, damping < config.oscillationMinDamping))
+        poorlyDamped = sum(mode.poorlyDamped for mode in modes)
+        if poorlyDamped > 0:
+            log(f'{poorlyDamped} poorly damped oscillation modes found.', level=LogLevel.WARNING)
+    return modes
+
+
+def analyseRanks(ranks: List[int],
+                 resultSet: ResultSet,
+                 figureDict: Dict[int, List[Figure]],
+                 windowDict: Optional[Dict[int, List[Tuple[float, str]]]],
+                 config: ReadConfig) -> List[OscillationMode]:
+    '''
+    Analyses the given ranks in parallel. Ranks without case events are analysed after their detected events.
+    '''
+    with ThreadPoolExecutor(max(config.threads, 1)) as executor:
+        rankModes = executor.map(
+            lambda rank: analyseRank(rank, resultSet, figureDict[rank],
+                                     windowDict.get(rank, []) if windowDict is not None else [], config),
+            ranks)
+        return [mode for modes in rankModes for mode in modes]
+
+
+OSCILLATION_COLUMNS = ['rank', 'figure', 'result', 'signal', 'start', 'end', 'frequency_hz', 'damping_ratio', 'amplitude', 'result_flag']
+
+
+def modeRow(mode: OscillationMode) -> List[str]:
+    return [str(mode.rank), str(mode.figure), mode.result, mode.signal, f'{mode.start:.4f}', f'{mode.end:.4f}',
+            f'{mode.frequency:.4f}', f'{mode.damping:.4f}', f'{mode.amplitude:.6g}', 'POORLY DAMPED' if mode.poorlyDamped else 'OK']
+
+
+def writeOscillations(modes: List[OscillationMode], path: str) -> None:
+    '''
+    Writes the oscillation modes as a csv table and as an html table sortable by clicking the column headers,
+    ordered by damping ratio so the least damped modes come first.
+    '''
+    modes = sorted(modes, key=lambda mode: mode.damping)
+    with open(f'{path}.csv', 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(OSCILLATION_COLUMNS)
+        for mode in modes:
+            writer.writerow(modeRow(mode))
+
+    header = ''.join(f'<th onclick="sortTable({i})">{column}</th>' for i, column in enumerate(OSCILLATION_COLUMNS))
+    rows = ''.join(f'<tr{" class=flagged" if mode.poorlyDamped else ""}><td><a href="{mode.rank}.html">{mode.rank}</a></td>' +
+                   ''.join(f'<td>{escape(value)}</td>' for value in modeRow(mode)[1:]) + '</tr>\n' for mode in modes)
+    with open(f'{path}.html', 'w') as file:
+        file.write(f'''<html>
+  <head>
+    <link rel="stylesheet" href="mtb.css">
+    <style>
+      table {{ border-collapse: collapse; font-size: 13px; }}
+      th, td {{ border: 1px solid #ddd; padding: 3px 8px; text-align: right; }}
+      th {{ cursor: pointer; background-color: #028B76; color: white; }}
+      tr.flagged {{ background-color: #fde0dc; }}
+    </style>
+    <script>
+      function sortTable(column) {{
+        const body = document.getElementById('modes').tBodies[0];
+        const rows = Array.from(body.rows);
+        const ascending = body.dataset.column != column || body.dataset.order != 'asc';
+        rows.sort(function (a, b) {{
+          const x = a.cells[column].innerText, y = b.cells[column].innerText;
+          const order = isNaN(x) || isNaN(y) ? x.localeCompare(y) : x - y;
+          return ascending ? order : -order;
+        }});
+        rows.forEach(function (row) {{ body.appendChild(row); }});
+        body.dataset.column = column;
+        body.dataset.order = ascending ? 'asc' : 'desc';
+      }}
+    </script>
+  </head>
+  <body>
+    <h2>Oscillation modes</h2>
+    <table id="modes"><thead><tr>{header}</tr></thead><tbody>
+{rows}    </tbody></table>
+  </body>
+</html>''')
+
+
+def readOscillations(path: str, poorlyDampedOnly: bool = True) -> Dict[int, List[OscillationMode]]:
+    '''
+    Reads the poorly damped modes, or all modes, of an oscillation table written by writeOscillations, with the rank as key.
+    '''
+    modes: Dict[int, List[OscillationMode]] = dict()
+    if not exists(path):
+        return modes
+    with open(path, 'r', newline='') as file:
+        for row in csv.DictReader(file, delimiter=';'):
+            poorlyDamped = row['result_flag'] != 'OK'
+            if poorlyDamped or not poorlyDampedOnly:
+                mode = OscillationMode(int(row['rank']), int(row['figure']), row['result'], row['signal'], float(row['start']),
+                                       float(row['end']), float(row['frequency_hz']), float(row['damping_ratio']),
+                                       float(row['amplitude']), poorlyDamped)
+                modes.setdefault(mode.rank, []).append(mode)
+    return modes
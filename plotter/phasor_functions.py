@@ -0,0 +1,87 @@
+'''
+Fundamental phasors, sequence components and instantaneous power computed from three-phase EMT waveforms.
+Phasors use a one-cycle sliding DFT, evaluated for all samples at once from the cumulative sum of the rotated signal.
+Magnitudes are peak values, angles are in degrees relative to cos(2*pi*f0*t). The first cycle has no full window and is NaN.
+'''
+import numpy as np
+
+NOMINAL_FREQUENCY = 50.0
+
+A = np.exp(2j * np.pi / 3)
+
+
+def fundamental_phasor(time, values, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    time = np.asarray(time, dtype=np.float64)
+    values = np.asarray(values)
+    phasor = np.full(len(values), np.nan, dtype=np.complex128)
+    if len(values) < 2:
+        return phasor
+
+    dt = (time[-1] - time[0]) / (len(time) - 1)
+    window = int(round(1.0 / (f0 * dt)))
+    if window < 2 or window > len(values):
+        return phasor
+
+    # Sum over the last window of samples as the difference of two cumulative sums
+    cumulative = np.empty(len(values) + 1, dtype=np.complex128)
+    cumulative[0] = 0.0
+    np.cumsum(values * np.exp(-2j * np.pi * f0 * time), out=cumulative[1:])
+    phasor[window - 1:] = (cumulative[window:] - cumulative[:-window]) * (2.0 / window)
+    return phasor
+
+
+def sequence_phasor(time, a, b, c, sequence: int, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    '''
+    Returns the positive (1), negative (2) or zero (0) sequence phasor of the given phase signals.
+    The DFT is linear, so the phases are combined before a single DFT of the complex combination.
+    '''
+    rotation = A ** (sequence % 3)
+    a, b, c = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64), np.asarray(c, dtype=np.float64)
+    return fundamental_phasor(time, (a + rotation * b + rotation * rotation * c) / 3.0, f0)
+
+
+def phasor_mag(time, values, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.abs(fundamental_phasor(time, values, f0))
+
+
+def phasor_ang(time, values, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.degrees(np.angle(fundamental_phasor(time, values, f0)))
+
+
+def pos_mag(time, a, b, c, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.abs(sequence_phasor(time, a, b, c, 1, f0))
+
+
+def pos_ang(time, a, b, c, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.degrees(np.angle(sequence_phasor(time, a, b, c, 1, f0)))
+
+
+def neg_mag(time, a, b, c, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.abs(sequence_phasor(time, a, b, c, 2, f0))
+
+
+def neg_ang(time, a, b, c, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.degrees(np.angle(sequence_phasor(time, a, b, c, 2, f0)))
+
+
+def zero_mag(time, a, b, c, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.abs(sequence_phasor(time, a, b, c, 0, f0))
+
+
+def zero_ang(time, a, b, c, f0: float = NOMINAL_FREQUENCY) -> np.ndarray:
+    return np.degrees(np.angle(sequence_phasor(time, a, b, c, 0, f0)))
+
+
+def p_inst(time, va, vb, vc, ia, ib, ic) -> np.ndarray:
+    '''
+    Instantaneous active power p = va*ia + vb*ib + vc*ic.
+    '''
+    return np.asarray(va) * ia + np.asarray(vb) * ib + np.asarray(vc) * ic
+
+
+def q_inst(time, va, vb, vc, ia, ib, ic) -> np.ndarray:
+    '''
+    Instantaneous reactive power q = ((vb - vc)*ia + (vc - va)*ib + (va - vb)*ic) / sqrt(3).
+    '''
+    va, vb, vc = np.asarray(va), np.asarray(vb), np.asarray(vc)
+    return ((vb - vc) * ia + (vc - va) * ib + (va - vb) * ic) / np.sqrt(3.0)
@@ -0,0 +1,150 @@
+'''
+Staged processing pipeline. Items pass through stages connected by bounded queues, every stage running its own pool of
+worker threads, so the file I/O of one item overlaps the computation of another. A full queue blocks the stage before it,
+which bounds the number of items in flight. Throughput, busy time and time blocked on the next stage are recorded per stage.
+'''
+from __future__ import annotations
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any, Callable, Iterable, List, Optional
+import time
+import traceback
+from plotter_logging import LogLevel, log
+
+_STOP = object()
+
+
+class StageStats:
+    def __init__(self) -> None:
+        self.items = 0
+        self.failed = 0
+        self.busy = 0.0  # Summed over the workers
+        self.blocked = 0.0  # Time waiting for room in the queue of the next stage, summed over the workers
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+
+    @property
+    def wall(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class Stage:
+    '''
+    A pipeline stage applying the function to each item with the given number of workers.
+    The function returns the item passed to the next stage, or None to drop it.
+    '''
+    def __init__(self, name: str, function: Callable[[Any], Any], workers: int = 1, queueSize: int = 1) -> None:
+        assert workers > 0
+        assert queueSize > 0
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue: Queue[Any] = Queue(maxsize=queueSize)
+        self.stats = StageStats()
+        self.running = 0
+        self.lock = Lock()
+
+
+class Pipeline:
+    '''
+    Runs items through the given stages. The onExit callback is called for every item leaving the pipeline,
+    with True when it passed all stages and False when a stage dropped it or failed on it.
+    '''
+    def __init__(self, stages: List[Stage], onExit: Optional[Callable[[Any, bool], None]] = None) -> None:
+        assert len(stages) > 0
+        self.stages = stages
+        self.onExit = onExit
+        self.threads: List[Thread] = list()
+        self.feeder: Optional[Thread] = None
+
+    def start(self, items: Iterable[Any]) -> None:
+        for i, stage in enumerate(self.stages):
+            stage.running = stage.workers
+            for _ in range(stage.workers):
+                thread = Thread(target=self.__work__, args=(i,), name=f'{stage.name} worker', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        self.feeder = Thread(target=self.__feed__, args=(items,), name='pipeline feeder', daemon=True)
+        self.feeder.start()
+
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def join(self) -> None:
+        if self.feeder is not None:
+            self.feeder.join()
+        for thread in self.threads:
+            thread.join()
+
+    def run(self, items: Iterable[Any]) -> None:
+        self.start(items)
+        self.join()
+
+    def __feed__(self, items: Iterable[Any]) -> None:
+        first = self.stages[0]
+        for item in items:
+            first.queue.put(item)
+        for _ in range(first.workers):
+            first.queue.put(_STOP)
+
+    def __leave__(self, item: Any, ok: bool) -> None:
+        if self.onExit is not None:
+            self.onExit(item, ok)
+
+    def __work__(self, index: int) -> None:
+        stage = self.stages[index]
+        nextStage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+            started = time.perf_counter()
+            with stage.lock:
+                if stage.stats.start is None:
+                    stage.stats.start = started
+            try:
+                result = stage.function(item)
+            except Exception:
+                result = None
+                with stage.lock:
+                    stage.stats.failed += 1
+                log(f'{stage.name} stage failed:\n{traceback.format_exc()}', level=LogLevel.ERROR)
+            finished = time.perf_counter()
+
+            blocked = 0.0
+            if result is None:
+                self.__leave__(item, False)
+            elif nextStage is None:
+                self.__leave__(result, True)
+            else:
+                nextStage.queue.put(result)
+                blocked = time.perf_counter() - finished
+            with stage.lock:
+                stage.stats.items += 1
+                stage.stats.busy += finished - started
+                stage.stats.blocked += blocked
+                stage.stats.end = time.perf_counter()
+
+        # The last worker of the stage stops the workers of the next stage
+        with stage.lock:
+            stage.running -= 1
+            last = stage.running == 0
+        if last and nextStage is not None:
+            for _ in range(nextStage.workers):
+                nextStage.queue.put(_STOP)
+
+    def report(self) -> List[str]:
+        '''
+        Returns a line per stage with items processed, throughput, worker utilisation and time blocked on the next stage.
+        '''
+        lines: List[str] = list()
+        for stage in self.stages:
+            stats = stage.stats
+            throughput = stats.items / stats.wall if stats.wall > 0 else 0.0
+            utilisation = stats.busy / (stats.wall * stage.workers) if stats.wall > 0 else 0.0
+            lines.append(f'{stage.name}: {stats.items} items ({stats.failed} failed) by {stage.workers} workers, '
+                         f'{throughput:.2f} items/s, busy {stats.busy:.1f} s ({100 * utilisation:.0f}% utilisation), '
+                         f'blocked {stats.blocked:.1f} s')
+        return lines
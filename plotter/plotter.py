@@ -2,124 +2,61 @@
 Minimal script to plot simulation results from PSCAD and PowerFactory.
 '''
 from __future__ import annotations
-from os import listdir, makedirs
-from os.path import join, split, splitext, exists
+from os import listdir, makedirs, remove
+from os.path import join, exists, isfile, abspath
+from shutil import copy2
+import argparse
 import re
 import pandas as pd
+import numpy as np
 from plotly.subplots import make_subplots  # type: ignore
 import plotly.graph_objects as go  # type: ignore
-from typing import List, Dict, Union, Tuple, Set
-import sampling_functions
-from down_sampling_method import DownSamplingMethod
-from threading import Thread, Lock
+from typing import List, Dict, Union, Tuple, Set, Optional
 import time
-import sys
 from math import ceil
 from collections import defaultdict
 from cursor_image_logic import addCursors, setupPlotLayoutCursors
+from layout_templates import LayoutCache
 from read_configs import ReadConfig, readFigureSetup, readCursorSetup
 from Figure import Figure
 from Result import ResultType, Result
 from Case import Case
 from Cursor import Cursor
-from read_and_write_functions import loadEMT
-
-try:
-    LOG_FILE = open('plotter.log', 'w')
-except:
-    print('Failed to open log file. Logging to file disabled.')
-    LOG_FILE = None  # type: ignore
-
-gLock = Lock()
-
-
-def print(*args):  # type: ignore
-    '''
-    Overwrites the print function to also write to a log file.
-    '''
-    gLock.acquire()
-    outputString = ''.join(map(str, args)) + '\n'  # type: ignore
-    sys.stdout.write(outputString)
-    if LOG_FILE:
-        try:
-            LOG_FILE.write(outputString)
-            LOG_FILE.flush()
-        except:
-            pass
-    gLock.release()
-
-
-def idFile(filePath: str) -> Tuple[
-    Union[ResultType, None], Union[int, None], Union[str, None], Union[str, None], Union[str, None]]:
+from read_and_write_functions import emtColumns, signalColumn
+from memory_budget import estimateRankMemory, resultFiles, MemoryGovernor
+from local_cache import LocalCache, localCache, setLocalCache
+from plotter_logging import LogLevel, log, logRank, startLogging, stopLogging, setLogLevel
+from rank_selection import parseRanks, parseShard, selectRanks
+from signal_validation import validateSignals
+from signal_catalog import SignalInfo, querySignals
+from derived_signals import DerivedSignals, isExpression, requiredColumns, signalAvailable
+from recordings import Recording, Alignment, alignRecording
+from event_zoom import EventZoom, caseEventTimes, changePoints, eventZoom, selectEvents
+from traces import Trace, prepareTraces, resultTime
+from spectrum import spectrumTraces
+from figure_type import FigureType
+from thumbnails import OVERVIEW_FILE, THUMBNAIL_PATTERN, rankThumbnails, thumbnailFile, writeOverview
+from pipeline import Pipeline, Stage
+from server import PlotServer, serve
+from sweep import envelopeFigure, sweepEnvelope, sweepFileName, sweepOverlay, writeEnvelopeFlags
+from oscillations import OSCILLATION_FILE, OscillationMode, analyseRanks, readOscillations, writeOscillations
+from validation import VALIDATION_FILE, caseWindowBoundaries, validateRanks, writeValidation
+from result_set import ResultSet, ResultView, mapResultFiles
+from references import REFERENCE_COLOR, REFERENCE_GROUP, Reference, caseReferences, referenceTraces
+
+NAVIGATION_START = '<!-- MTB navigation start -->'
+NAVIGATION_END = '<!-- MTB navigation end -->'
+RECORDING_GROUP = 'recording'
+RECORDING_COLOR = '#000000'
+
+layoutCache = LayoutCache()
+
+
+def print(*args, level: LogLevel = LogLevel.INFO):  # type: ignore
     '''
-    Identifies the type (EMT or RMS), root and case id of a given file. If the file is not recognized, a none tuple is returned.
+    Overwrites the print function to log through the queued log writer.
     '''
-    path, fileName = split(filePath)
-    match = re.match(r'^(\w+?)_([0-9]+).(inf|csv)$', fileName.lower())
-    if match:
-        rank = int(match.group(2))
-        projectName = match.group(1)
-        bulkName = join(path, match.group(1))
-        fullpath = filePath
-        with open(filePath, 'r') as file:
-            firstLine = file.readline()
-            if match.group(3) == 'inf' and firstLine.startswith('PGB(1)'):
-                fileType = ResultType.EMT
-                return (fileType, rank, projectName, bulkName, fullpath)
-            elif match.group(3) == 'csv':
-                secondLine = file.readline()
-                if secondLine.startswith(r'"b:tnow in s"'):
-                    fileType = ResultType.RMS
-                    return (fileType, rank, projectName, bulkName, fullpath)
-    return (None, None, None, None, None)
-
-
-def mapResultFiles(config: ReadConfig) -> Dict[int, List[Result]]:
-    '''
-    Goes through all files in the given directories and maps them to a dictionary of cases.
-    '''
-    files: List[Tuple[str, str]] = list()
-    for dir_ in config.simDataDirs:
-        for file_ in listdir(dir_[1]):
-            files.append((dir_[0], join(dir_[1], file_)))
-
-    results: Dict[int, List[Result]] = dict()
-
-    for file in files:
-        group = file[0]
-        fullpath = file[1]
-        typ, rank, projectName, bulkName, fullpath = idFile(fullpath)
-
-        if typ is None:
-            continue
-        assert rank is not None
-        assert projectName is not None
-        assert bulkName is not None
-        assert fullpath is not None
-
-        newResult = Result(typ, rank, projectName, bulkName, fullpath, group)
-
-        if rank in results.keys():
-            results[rank].append(newResult)
-        else:
-            results[rank] = [newResult]
-
-    return results
-
-
-def emtColumns(infFilePath: str) -> Dict[int, str]:
-    '''
-    Reads EMT result columns from the given inf file and returns a dictionary with the column number as key and the column name as value.
-    '''
-    columns: Dict[int, str] = dict()
-    with open(infFilePath, 'r') as file:
-        for line in file:
-            rem = re.match(
-                r'^PGB\(([0-9]+)\) +Output +Desc="(\w+)" +Group="(\w+)" +Max=([0-9\-\.]+) +Min=([0-9\-\.]+) +Units="(\w*)" *$',
-                line)
-            if rem:
-                columns[int(rem.group(1))] = rem.group(2)
-    return columns
+    log(*args, level=level)
 
 
 def colorMap(results: Dict[int, List[Result]]) -> Dict[str, List[str]]:
@@ -153,17 +90,15 @@ def colorMap(results: Dict[int, List[Result]]) -> Dict[str, List[str]]:
 
 
 def addResults(plots: List[go.Figure],
-               typ: ResultType,
-               data: pd.DataFrame,
                figures: List[Figure],
-               resultName: str,
-               file: str,  # Only for error messages
+               figureTraces: List[List[Trace]],
                colors: Dict[str, List[str]],
                nColumns: int,
-               pfFlatTIme: float,
-               pscadInitTime: float) -> None:
+               webglThreshold: int = 0,
+               zoom: bool = False) -> None:
     '''
-    Add result to plot.
+    Add the prepared traces of a result to plot. Traces with more points than webglThreshold are rendered with WebGL (0 disables WebGL).
+    With event zoom (single column layout only) the overview traces are plotted with the full resolution zoom windows below them.
     '''
 
     assert nColumns > 0
@@ -176,7 +111,7 @@ def addResults(plots: List[go.Figure],
     rowPos = 1
     colPos = 1
     fi = -1
-    for figure in figures:
+    for figure, traces in zip(figures, figureTraces):
         fi += 1
 
         if nColumns == 1:
@@ -185,67 +120,161 @@ def addResults(plots: List[go.Figure],
             rowPos = (fi // nColumns) + 1
             colPos = (fi % nColumns) + 1
 
-        downsampling_method = figure.down_sampling_method
-        traces = 0
-        for sig in range(1, 4):
-            signalKey = typ.name.lower()
-            rawSigName: str = getattr(figure, f'{signalKey}_signal_{sig}')
-
-            if typ == ResultType.RMS:
-                while rawSigName.startswith('#'):
-                    rawSigName = rawSigName[1:]
-                splitSigName = rawSigName.split('\\')
-
-                if len(splitSigName) == 2:
-                    sigColumn = ('##' + splitSigName[0], splitSigName[1])
-                else:
-                    sigColumn = rawSigName
+        for trace in traces:
+            if not trace.known:
+                x_value, y_value = None, None
+            elif zoom and figure.type == FigureType.TIME:
+                add_zoom_traces(trace, colors, plotlyFigure, webglThreshold)
+                x_value, y_value = trace.overviewX, trace.overviewY
             else:
-                sigColumn = rawSigName
+                x_value, y_value = trace.x, trace.y
+            add_scatterplot_for_result(colPos, colors, trace.displayName, nColumns, plotlyFigure, trace.resultName, rowPos,
+                                       trace.index, x_value, y_value, webglThreshold, trace.dash)
+
+        update_y_and_x_axis(colPos, figure, nColumns, plotlyFigure, rowPos)
+
 
-            displayName = f'{resultName}:{rawSigName.split(" ")[0]}'
+def alignRecordings(typ: ResultType,
+                    data: pd.DataFrame,
+                    time: np.ndarray,
+                    signals: Dict[str, SignalInfo],
+                    derived: DerivedSignals,
+                    figures: List[Figure],
+                    recordings: Dict[str, Recording],
+                    resultName: str,
+                    alignments: Dict[int, Tuple[str, Alignment]]) -> None:
+    '''
+    Aligns the recordings of the given figures to the first available signal of the figure in the given result.
+    Every alignment is reported, the first alignment of a figure is used for the overlay.
+    '''
+    signalKey = typ.name.lower()
+    for figure in figures:
+        if figure.recording not in recordings:
+            continue
+        recording = recordings[figure.recording]
+        for sig in range(1, 4):
+            rawSigName, sigColumn = signalColumn(typ, getattr(figure, f'{signalKey}_signal_{sig}'))
+            if sigColumn != '' and signalAvailable(rawSigName, signals):
+                break
+        else:
+            continue
 
-            timeColName = 'time' if typ == ResultType.EMT else data.columns[0]
-            timeoffset = pfFlatTIme if typ == ResultType.RMS else pscadInitTime
+        y_value = (derived.get(rawSigName) if isExpression(rawSigName) else data[sigColumn]).to_numpy()  # type: ignore
+        recTime, recValues = recording.data
+        alignment = alignRecording(recTime, recValues, time, y_value)
+        if alignment is None:
+            print(f'Recording "{recording.name}" could not be aligned to {resultName}:{rawSigName}.', level=LogLevel.WARNING)
+            continue
+        print(f'Recording "{recording.name}" aligned to {resultName}:{rawSigName} in figure "{figure.title}": '
+              f'offset {alignment.offset:.4f} s, RMS error {alignment.rmsError:.4g} over {alignment.overlap:.3f} s.')
+        alignments.setdefault(figure.id, (resultName, alignment))
 
-            if sigColumn in data.columns:
-                x_value = data[timeColName] - timeoffset  # type: ignore
-                y_value = data[sigColumn]  # type: ignore
-                if downsampling_method == DownSamplingMethod.GRADIENT:
-                    x_value, y_value = sampling_functions.downsample_based_on_gradient(x_value, y_value,
-                                                                                       figure.gradient_threshold)  # type: ignore
-                elif downsampling_method == DownSamplingMethod.AMOUNT:
-                    x_value, y_value = sampling_functions.down_sample(x_value, y_value)  # type: ignore
 
-                add_scatterplot_for_result(colPos, colors, displayName, nColumns, plotlyFigure, resultName, rowPos,
-                                           traces, x_value, y_value)
+def addRecordings(plots: List[go.Figure],
+                  figures: List[Figure],
+                  recordings: Dict[str, Recording],
+                  alignments: Dict[int, Tuple[str, Alignment]],
+                  nColumns: int,
+                  webglThreshold: int = 0) -> None:
+    '''
+    Add the aligned recordings to the plots.
+    '''
+    colors = {RECORDING_GROUP: [RECORDING_COLOR]}
+    rowPos = 1
+    colPos = 1
+    for fi, figure in enumerate(figures):
+        if figure.id not in alignments:
+            continue
+        if nColumns == 1:
+            plotlyFigure = plots[fi]
+        else:
+            plotlyFigure = plots[0]
+            rowPos = (fi // nColumns) + 1
+            colPos = (fi % nColumns) + 1
 
-                # plot_cursor_functions.add_annotations(x_value, y_value, plotlyFigure)
-                traces += 1
-            elif sigColumn != '':
-                print(f'Signal "{rawSigName}" not recognized in resultfile: {file}')
-                add_scatterplot_for_result(colPos, colors, f'{displayName} (Unknown)', nColumns, plotlyFigure, resultName, rowPos,
-                                           traces, None, None)
-                traces += 1
+        _, alignment = alignments[figure.id]
+        recTime, recValues = recordings[figure.recording].data
+        displayName = f'{RECORDING_GROUP}:{figure.recording} ({alignment.offset:+.4f} s)'
+        add_scatterplot_for_result(colPos, colors, displayName, nColumns, plotlyFigure, RECORDING_GROUP, rowPos, 0,
+                                   recTime + alignment.offset, recValues, webglThreshold)
 
-        update_y_and_x_axis(colPos, figure, nColumns, plotlyFigure, rowPos)
+
+def addReferences(plots: List[go.Figure],
+                  figures: List[Figure],
+                  traces: Dict[int, Tuple[np.ndarray, np.ndarray]],
+                  nColumns: int,
+                  webglThreshold: int = 0) -> None:
+    '''
+    Add the reference waveforms of the case setup to the plots.
+    '''
+    colors = {REFERENCE_GROUP: [REFERENCE_COLOR]}
+    rowPos = 1
+    colPos = 1
+    for fi, figure in enumerate(figures):
+        if figure.id not in traces:
+            continue
+        if nColumns == 1:
+            plotlyFigure = plots[fi]
+        else:
+            plotlyFigure = plots[0]
+            rowPos = (fi // nColumns) + 1
+            colPos = (fi % nColumns) + 1
+
+        x_value, y_value = traces[figure.id]
+        add_scatterplot_for_result(colPos, colors, f'{REFERENCE_GROUP}:{figure.reference}', nColumns, plotlyFigure,
+                                   REFERENCE_GROUP, rowPos, 0, x_value, y_value, webglThreshold)
+
+
+def addOscillations(plots: List[go.Figure],
+                    figures: List[Figure],
+                    modes: List[OscillationMode],
+                    nColumns: int,
+                    zoom: bool = False) -> None:
+    '''
+    Marks the windows of the poorly damped oscillation modes on the plots, labelled with frequency and damping ratio.
+    '''
+    rowPos = 1
+    colPos = 1
+    for fi, figure in enumerate(figures):
+        figureModes = [mode for mode in modes if mode.figure == figure.id]
+        if len(figureModes) == 0 or figure.type != FigureType.TIME:
+            continue
+        if nColumns == 1:
+            plotlyFigure = plots[fi]
+            # The overview of the event zoom layout is the first subplot, a plain figure has no subplots
+            position = dict(row=1, col=1) if zoom else dict()
+        else:
+            plotlyFigure = plots[0]
+            rowPos = (fi // nColumns) + 1
+            colPos = (fi % nColumns) + 1
+            position = dict(row=rowPos, col=colPos)
+
+        windows: Dict[Tuple[float, float], List[OscillationMode]] = dict()
+        for mode in figureModes:
+            windows.setdefault((mode.start, mode.end), []).append(mode)
+        for (start, end), windowModes in windows.items():
+            label = '<br>'.join(f'{mode.signal.split(" ")[0]}: {mode.frequency:.2f} Hz, ζ={mode.damping:.3f}' for mode in windowModes)
+            plotlyFigure.add_vrect(x0=start, x1=end, fillcolor='red', opacity=0.1, line_width=0, annotation_text=label,  # type: ignore
+                                   annotation_position='top left', annotation_font_size=10, **position)
 
 
 def update_y_and_x_axis(colPos, figure, nColumns, plotlyFigure, rowPos):
+    xaxisTitle = {FigureType.TIME: 'Time[s]', FigureType.SPECTRUM: 'Frequency[Hz]', FigureType.HARMONICS: 'Harmonic order'}[figure.type]
     if nColumns == 1:
         yaxisTitle = f'[{figure.units}]'
     else:
         yaxisTitle = f'{figure.title}[{figure.units}]'
     if nColumns == 1:
-        plotlyFigure.update_xaxes(  # type: ignore
-            title_text='Time[s]'
+        # Zoom window axes keep their event title
+        plotlyFigure.for_each_xaxis(  # type: ignore
+            lambda axis: axis.update(title_text=xaxisTitle) if axis.title.text is None else None
         )
         plotlyFigure.update_yaxes(  # type: ignore
             title_text=yaxisTitle
         )
     else:
         plotlyFigure.update_xaxes(  # type: ignore
-            title_text='Time[s]',
+            title_text=xaxisTitle,
             row=rowPos, col=colPos
         )
         plotlyFigure.update_yaxes(  # type: ignore
@@ -255,13 +284,19 @@ def update_y_and_x_axis(colPos, figure, nColumns, plotlyFigure, rowPos):
 
 
 def add_scatterplot_for_result(colPos, colors, displayName, nColumns, plotlyFigure, resultName, rowPos, traces, x_value,
-                               y_value):
+                               y_value, webglThreshold=0, dash=None):
+    # SVG rendering becomes unusable for dense traces, switch to WebGL above the threshold
+    if webglThreshold > 0 and x_value is not None and len(x_value) > webglThreshold:
+        scatter = go.Scattergl
+    else:
+        scatter = go.Scatter
     if nColumns == 1:
         plotlyFigure.add_trace(  # type: ignore
-            go.Scatter(
+            scatter(
                 x=x_value,
                 y=y_value,
                 line_color=colors[resultName][traces],
+                line_dash=dash,
                 name=displayName,
                 legendgroup=displayName,
                 showlegend=True
@@ -269,10 +304,11 @@ def add_scatterplot_for_result(colPos, colors, displayName, nColumns, plotlyFigu
         )
     else:
         plotlyFigure.add_trace(  # type: ignore
-            go.Scatter(
+            scatter(
                 x=x_value,
                 y=y_value,
                 line_color=colors[resultName][traces],
+                line_dash=dash,
                 name=displayName,
                 legendgroup=resultName,
                 showlegend=True
@@ -281,71 +317,282 @@ def add_scatterplot_for_result(colPos, colors, displayName, nColumns, plotlyFigu
         )
 
 
-def drawPlot(rank: int,
-             resultDict: Dict[int, List[Result]],
-             figureDict: Dict[int, List[Figure]],
-             caseDict: Dict[int, str],
-             colorMap: Dict[str, List[str]],
-             cursorDict: List[Cursor],
-             config: ReadConfig):
+def loadResult(view: ResultView, figureList: List[Figure]) -> Optional[pd.DataFrame]:
     '''
-    Draws plots for html and static image export.    
+    Loads the signals and expression operands of the given figures from the given result.
     '''
+    if view.typ not in (ResultType.RMS, ResultType.EMT):
+        return None
+    return view.data(requiredColumns(view.result, [getattr(figure, f'{view.typ.name.lower()}_signal_{sig}')
+                                                   for figure in figureList for sig in range(1, 4)]))
 
-    print(f'Drawing plot for rank {rank}.')
 
-    resultList = resultDict.get(rank, [])
-    rankList = list(resultDict.keys())
-    rankList.sort()
-    figureList = figureDict[rank]
-    ranksCursor = [i for i in cursorDict if i.id == rank]
+def detectRankEvents(resultSet: ResultSet,
+                     resultList: List[Result],
+                     figureList: List[Figure],
+                     config: ReadConfig,
+                     preloaded: Dict[str, pd.DataFrame]) -> List[float]:
+    '''
+    Locates events by change-point detection on the figure signals of one result of the rank, preferring RMS results.
+    The loaded result is kept in preloaded so it is not read again when plotting.
+    '''
+    results = sorted(resultList, key=lambda result: result.typ != ResultType.RMS)
+    if len(results) == 0:
+        return []
+    result = results[0]
+    data = loadResult(resultSet.view(result), figureList)
+    if data is None:
+        return []
+    preloaded[result.fullpath] = data
+
+    time = resultTime(result.typ, data, config.pfFlatTIme, config.pscadInitTime)
+    minSeparation = config.zoomBefore + config.zoomAfter
+
+    candidates: List[Tuple[float, float]] = list()
+    signalKey = result.typ.name.lower()
+    for figure in figureList:
+        for sig in range(1, 4):
+            rawSigName, sigColumn = signalColumn(result.typ, getattr(figure, f'{signalKey}_signal_{sig}'))
+            if sigColumn != '' and not isExpression(rawSigName) and rawSigName in result.signals:
+                candidates.extend(changePoints(time, data[sigColumn].to_numpy(), minSeparation))  # type: ignore
+    return selectEvents(candidates, minSeparation, config.zoomMaxEvents)
 
-    if resultList == [] or figureList == []:
-        return
 
-    figurePath = join(config.resultsDir, str(rank))
+def add_zoom_traces(trace: Trace, colors, plotlyFigure, webglThreshold=0):
+    for i, (x_value, y_value) in enumerate(trace.zoomed):
+        scatter = go.Scattergl if webglThreshold > 0 and len(x_value) > webglThreshold else go.Scatter
+        plotlyFigure.add_trace(  # type: ignore
+            scatter(
+                x=x_value,
+                y=y_value,
+                line_color=colors[trace.resultName][trace.index],
+                name=trace.displayName,
+                legendgroup=trace.displayName,
+                showlegend=False
+            ),
+            row=2, col=i + 1
+        )
+
 
-    htmlPlots: List[go.Figure] = list()
-    imagePlots: List[go.Figure] = list()
-    htmlPlotsCursors: List[go.Figure] = list()
-    imagePlotsCursors: List[go.Figure] = list()
+class RankJob:
+    '''
+    A rank passed through the stages of plotting: load, prepare traces, render and write.
+    '''
+    def __init__(self,
+                 rank: int,
+                 resultDict: Dict[int, List[Result]],
+                 figureDict: Dict[int, List[Figure]],
+                 caseDict: Dict[int, str],
+                 colorMap: Dict[str, List[str]],
+                 cursorDict: List[Cursor],
+                 config: ReadConfig,
+                 eventDict: Optional[Dict[int, List[float]]] = None,
+                 referenceDict: Optional[Dict[int, Dict[str, Reference]]] = None,
+                 oscillationDict: Optional[Dict[int, List[OscillationMode]]] = None) -> None:
+        self.rank = rank
+        self.resultDict = resultDict
+        self.caseDict = caseDict
+        self.colorMap = colorMap
+        self.cursorDict = cursorDict
+        self.config = config
+        self.eventDict = eventDict
+        self.referenceDict = referenceDict
+        self.oscillations = oscillationDict.get(rank, []) if oscillationDict is not None else []
+        self.resultList = resultDict.get(rank, [])
+        self.figureList = figureDict[rank]
+        self.ranksCursor = [i for i in cursorDict if i.id == rank]
+        self.figurePath = join(config.resultsDir, str(rank))
+        self.estimate = 0.0  # Memory reserved for the rank, in MB
+        # Load stage
+        self.loaded: List[Tuple[Result, pd.DataFrame]] = list()
+        self.zoom: Optional[EventZoom] = None
+        self.htmlPlotsCursors: List[go.Figure] = list()
+        self.imagePlotsCursors: List[go.Figure] = list()
+        # Prepare stage
+        self.figureTraces: List[List[List[Trace]]] = list()
+        self.alignments: Dict[int, Tuple[str, Alignment]] = dict()
+        self.references: Dict[int, Tuple[np.ndarray, np.ndarray]] = dict()
+        self.thumbnails: Dict[int, bytes] = dict()
+        # Render stage
+        self.html: Optional[str] = None
+        self.image: Optional[bytes] = None
+
+    @property
+    def htmlZoom(self) -> bool:
+        # Event zoom applies to single column layouts
+        return self.zoom is not None and self.config.htmlColumns == 1
+
+    @property
+    def imageZoom(self) -> bool:
+        return self.zoom is not None and self.config.imageColumns == 1
+
+
+def loadRank(job: RankJob) -> Optional[RankJob]:
+    '''
+    Loads the results of the rank and locates the events to zoom on.
+    '''
+    config = job.config
+    with logRank(job.rank):
+        print(f'Drawing plot for rank {job.rank}.')
+        if job.resultList == [] or job.figureList == []:
+            return None
+
+        # Each result is read once per rank, so the signal cache of the result set is not used
+        resultSet = ResultSet(job.resultDict, config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision, cacheSize=0)
+        preloaded: Dict[str, pd.DataFrame] = dict()
+        if config.eventZoom:
+            if job.eventDict is not None and job.rank in job.eventDict:
+                events = job.eventDict[job.rank]
+            else:
+                events = detectRankEvents(resultSet, job.resultList, job.figureList, config, preloaded)
+            job.zoom = eventZoom(events, config.zoomBefore, config.zoomAfter, config.zoomMaxEvents)
+            if job.zoom is not None:
+                print(f'Zooming on events at {", ".join(f"{event:.3f}" for event in job.zoom.events)} s.')
+
+        for result in job.resultList:
+            print(result.typ, level=LogLevel.DEBUG)
+            resultData = preloaded.pop(result.fullpath, None)
+            if resultData is None:
+                resultData = loadResult(resultSet.view(result), job.figureList)
+            if resultData is not None:
+                job.loaded.append((result, resultData))
+
+        if config.genHTML and len(job.ranksCursor) > 0:
+            setupPlotLayoutCursors(config, job.ranksCursor, job.htmlPlotsCursors, job.imagePlotsCursors, layoutCache)
+            addCursors(job.htmlPlotsCursors, job.resultList, job.cursorDict, config.pfFlatTIme, config.pscadInitTime,
+                       job.rank, config.htmlCursorColumns, config.reducedPrecision)
+    return job
+
+
+def prepareRank(job: RankJob) -> RankJob:
+    '''
+    Prepares the traces, recording alignments and references of the rank. The loaded results are released afterwards.
+    '''
+    config = job.config
+    with logRank(job.rank):
+        # Traces are prepared once for the layouts in use
+        zoomLayout = (config.genHTML and job.htmlZoom) or (config.genImage and job.imageZoom)
+        plainLayout = (config.genHTML and not job.htmlZoom) or (config.genImage and not job.imageZoom)
+        for figure in job.figureList:
+            if figure.recording != '' and figure.recording not in config.recordings:
+                print(f'Recording "{figure.recording}" of figure "{figure.title}" is not defined in the Recordings section of the config.',
+                      level=LogLevel.WARNING)
+
+        referenceTime: Optional[np.ndarray] = None
+        for result, resultData in job.loaded:
+            derived = DerivedSignals(result.typ, resultData)
+            resultTimes = resultTime(result.typ, resultData, config.pfFlatTIme, config.pscadInitTime)
+            if referenceTime is None:
+                referenceTime = resultTimes
+            figureTraces = prepareTraces(result.typ, resultData, resultTimes, result.signals, derived, job.figureList,
+                                         result.shorthand, result.fullpath, plainLayout, job.zoom if zoomLayout else None)
+            if result.typ == ResultType.EMT:
+                spectra = spectrumTraces(resultData, resultTimes, result.signals, derived, job.figureList, result.shorthand,
+                                         result.fullpath, config.fundamentalFrequency, config.spectrumMaxHarmonic)
+                figureTraces = [spectra.get(figure.id, traces) for figure, traces in zip(job.figureList, figureTraces)]
+            job.figureTraces.append(figureTraces)
+            alignRecordings(result.typ, resultData, resultTimes, result.signals, derived, job.figureList, config.recordings,
+                            result.shorthand, job.alignments)
+        job.loaded = list()
+
+        if len(config.thumbnailFigures) > 0:
+            job.thumbnails = rankThumbnails(job.figureList, job.figureTraces, job.colorMap, config.thumbnailFigures)
+
+        # References are evaluated on the time grid of the first result of the rank
+        if job.referenceDict is not None and job.rank in job.referenceDict and referenceTime is not None:
+            job.references = referenceTraces(job.referenceDict[job.rank], job.figureList, referenceTime)
+    return job
+
+
+def renderRank(job: RankJob) -> RankJob:
+    '''
+    Builds the figures of the rank from the prepared traces and renders the html page and the image.
+    '''
+    config = job.config
+    with logRank(job.rank):
+        htmlPlots: List[go.Figure] = list()
+        imagePlots: List[go.Figure] = list()
+        columnNr = setupPlotLayout(job.caseDict, config, job.figureList, htmlPlots, imagePlots, job.rank, job.zoom)
+        for figureTraces in job.figureTraces:
+            if config.genHTML:
+                addResults(htmlPlots, job.figureList, figureTraces, job.colorMap, config.htmlColumns, config.webglThreshold,
+                           job.htmlZoom)
+            if config.genImage:
+                addResults(imagePlots, job.figureList, figureTraces, job.colorMap, config.imageColumns, config.webglThreshold,
+                           job.imageZoom)
+        job.figureTraces = list()
 
-    columnNr = setupPlotLayout(caseDict, config, figureList, htmlPlots, imagePlots, rank)
-    if len(ranksCursor) > 0:
-        setupPlotLayoutCursors(config, ranksCursor, htmlPlotsCursors, imagePlotsCursors)
-    for result in resultList:
-        print(result.typ)
-        if result.typ == ResultType.RMS:
-            resultData: pd.DataFrame = pd.read_csv(result.fullpath, sep=';', decimal=',', header=[0, 1])  # type: ignore
-        elif result.typ == ResultType.EMT:
-            resultData = loadEMT(result.fullpath)
-        else:
-            continue
         if config.genHTML:
-            addResults(htmlPlots, result.typ, resultData, figureList, result.shorthand, result.fullpath, colorMap,
-                       config.htmlColumns, config.pfFlatTIme, config.pscadInitTime)
-        if config.genImage:
-            addResults(imagePlots, result.typ, resultData, figureList, result.shorthand, result.fullpath, colorMap,
-                       config.imageColumns, config.pfFlatTIme, config.pscadInitTime)
+            addReferences(htmlPlots, job.figureList, job.references, config.htmlColumns, config.webglThreshold)
+            addOscillations(htmlPlots, job.figureList, job.oscillations, config.htmlColumns, job.htmlZoom)
+            addRecordings(htmlPlots, job.figureList, config.recordings, job.alignments, config.htmlColumns, config.webglThreshold)
+            rankList = sorted(job.resultDict.keys())
+            job.html = create_html(htmlPlots, job.htmlPlotsCursors, job.caseDict[job.rank] if job.caseDict is not None else "",
+                                   job.rank, config, rankList)
 
-    if config.genHTML:
-        addCursors(htmlPlotsCursors, resultList, cursorDict, config.pfFlatTIme, config.pscadInitTime,
-                   rank, config.htmlCursorColumns)
-        create_html(htmlPlots, htmlPlotsCursors, figurePath, caseDict[rank] if caseDict is not None else "", rank, config, rankList)
-        print(f'Exported plot for rank {rank} to {figurePath}.html')
+        if config.genImage:
+            addReferences(imagePlots, job.figureList, job.references, config.imageColumns, config.webglThreshold)
+            addOscillations(imagePlots, job.figureList, job.oscillations, config.imageColumns, job.imageZoom)
+            addRecordings(imagePlots, job.figureList, config.recordings, job.alignments, config.imageColumns, config.webglThreshold)
+            # Cursor plots are not currently supported for image export and commented out
+            # addCursors(imagePlotsCursors, resultList, cursorDict, config.pfFlatTIme, config.pscadInitTime,
+            #           rank, config.imageCursorColumns)
+            job.image = create_image_plots(columnNr, config, job.figureList, imagePlots)
+            # create_cursor_plots(config.htmlCursorColumns, config, figurePath, imagePlotsCursors, ranksCursor)
+    return job
+
+
+def writeRank(job: RankJob) -> RankJob:
+    '''
+    Writes the rendered html page and image of the rank.
+    '''
+    config = job.config
+    with logRank(job.rank):
+        if job.html is not None:
+            with open(f'{job.figurePath}.html', 'w') as file:
+                file.write(job.html)
+            print(f'Exported plot for rank {job.rank} to {job.figurePath}.html')
+
+        if job.image is not None:
+            with open(f'{job.figurePath}.{config.imageFormat}', 'wb') as file:
+                file.write(job.image)
+            print(f'Exported plot for rank {job.rank} to {job.figurePath}.{config.imageFormat}')
+
+        for figureId, thumbnail in job.thumbnails.items():
+            with open(join(config.resultsDir, thumbnailFile(job.rank, figureId)), 'wb') as file:
+                file.write(thumbnail)
+        # Thumbnails of earlier runs of figures without a thumbnail in this run are removed
+        for figureId in config.thumbnailFigures:
+            stalePath = join(config.resultsDir, thumbnailFile(job.rank, figureId))
+            if figureId not in job.thumbnails and exists(stalePath):
+                remove(stalePath)
+
+        job.html = job.image = None
+        job.thumbnails = dict()
+        print(f'Plot for rank {job.rank} done.')
+    return job
 
-    if config.genImage:
-        # Cursor plots are not currently supported for image export and commented out
-        # addCursors(imagePlotsCursors, resultList, cursorDict, config.pfFlatTIme, config.pscadInitTime,
-        #           rank, config.imageCursorColumns)
-        create_image_plots(columnNr, config, figureList, figurePath, imagePlots)
-        # create_cursor_plots(config.htmlCursorColumns, config, figurePath, imagePlotsCursors, ranksCursor)
-        print(f'Exported plot for rank {rank} to {figurePath}.{config.imageFormat}')
 
-    print(f'Plot for rank {rank} done.')
+def drawPlot(rank: int,
+             resultDict: Dict[int, List[Result]],
+             figureDict: Dict[int, List[Figure]],
+             caseDict: Dict[int, str],
+             colorMap: Dict[str, List[str]],
+             cursorDict: List[Cursor],
+             config: ReadConfig,
+             eventDict: Optional[Dict[int, List[float]]] = None,
+             referenceDict: Optional[Dict[int, Dict[str, Reference]]] = None,
+             oscillationDict: Optional[Dict[int, List[OscillationMode]]] = None):
+    '''
+    Draws plots for html and static image export, running the stages of the pipeline in sequence.
+    '''
+    job = loadRank(RankJob(rank, resultDict, figureDict, caseDict, colorMap, cursorDict, config, eventDict, referenceDict,
+                           oscillationDict))
+    if job is not None:
+        writeRank(renderRank(prepareRank(job)))
 
 
-def create_image_plots(columnNr, config, figureList, figurePath, imagePlots):
+def create_image_plots(columnNr, config, figureList, imagePlots) -> bytes:
     if columnNr == 1:
         # Combine all figures into a single plot, same as for nColumns > 1 but no grid needed
         combined_plot = make_subplots(rows=len(imagePlots), cols=1,
@@ -366,8 +613,8 @@ def create_image_plots(columnNr, config, figureList, figurePath, imagePlots):
             showlegend=True,
         )
 
-        # Save the combined plot as a single image
-        combined_plot.write_image(f'{figurePath}.{config.imageFormat}', height=500 * len(imagePlots), width=2000)
+        # Render the combined plot as a single image
+        return combined_plot.to_image(format=config.imageFormat, height=500 * len(imagePlots), width=2000)
 
     else:
         # Combine all figures into a grid when nColumns > 1
@@ -376,8 +623,8 @@ def create_image_plots(columnNr, config, figureList, figurePath, imagePlots):
             width=500 * config.imageColumns,  # Adjust width based on column number
             showlegend=True,
         )
-        imagePlots[0].write_image(f'{figurePath}.{config.imageFormat}', height=500 * ceil(len(figureList) / columnNr),
-                                  width=500 * config.imageColumns)  # type: ignore
+        return imagePlots[0].to_image(format=config.imageFormat, height=500 * ceil(len(figureList) / columnNr),
+                                      width=500 * config.imageColumns)  # type: ignore
 
 
 def create_cursor_plots(columnNr, config, figurePath, imagePlotsCursors, ranksCursor):
@@ -415,35 +662,58 @@ def create_cursor_plots(columnNr, config, figurePath, imagePlotsCursors, ranksCu
                                              width=500 * config.imageColumns)
 
 
-def setupPlotLayout(caseDict, config, figureList, htmlPlots, imagePlots, rank):
+def setupPlotLayout(caseDict, config, figureList, htmlPlots, imagePlots, rank, zoom: Optional[EventZoom] = None):
     lst: List[Tuple[int, List[go.Figure]]] = []
     if config.genHTML:
         lst.append((config.htmlColumns, htmlPlots))
     if config.genImage:
         lst.append((config.imageColumns, imagePlots))
 
+    figureKey = tuple((fig.id, fig.title, fig.type) for fig in figureList)
     for columnNr, plotList in lst:
-        if columnNr == 1:
-            for fig in figureList:
+        nZoom = len(zoom.events) if zoom is not None and columnNr == 1 else 0
+        # Subplot grids are cloned from the layout cache, single column figures are cheaper to build than to clone
+        if columnNr > 1:
+            plotList.extend(layoutCache.get(('plots', columnNr, figureKey), lambda: buildPlotLayout(figureList, columnNr)))
+        else:
+            plotList.extend(buildPlotLayout(figureList, columnNr, nZoom))
+        if nZoom > 0:
+            for plot, fig in zip(plotList[-len(figureList):], figureList):
+                if fig.type != FigureType.TIME:
+                    continue
+                for i, window in enumerate(zoom.windows()):  # type: ignore
+                    plot.update_xaxes(range=list(window), title_text=f'Event at {zoom.events[i]:.3f} s', row=2, col=i + 1)  # type: ignore
+        if columnNr > 1 and plotList == imagePlots and caseDict is not None:
+            plotList[-1].update_layout(title_text=caseDict[rank])  # type: ignore
+    return columnNr
+
+
+def buildPlotLayout(figureList, columnNr, nZoom: int = 0) -> List[go.Figure]:
+    plotList: List[go.Figure] = []
+    if columnNr == 1:
+        for fig in figureList:
+            if nZoom > 0 and fig.type == FigureType.TIME:
+                # Overview spanning the first row with one zoom window per event below
+                plotList.append(make_subplots(rows=2, cols=nZoom, row_heights=[0.6, 0.4], vertical_spacing=0.15,
+                                              specs=[[{'colspan': nZoom}] + [None] * (nZoom - 1), [{}] * nZoom]))
+            else:
                 # Create a direct Figure instead of subplots when there's only 1 column
                 plotList.append(go.Figure())  # Normal figure, no subplots
-                plotList[-1].update_layout(
-                    title=fig.title,  # Add the figure title directly
-                    height=500,  # Set height for the plot
-                    legend=dict(
-                        orientation="h",
-                        yanchor="top",
-                        y=1.22,
-                        xanchor="left",
-                        x=0.12,
-                    )
+            plotList[-1].update_layout(
+                title=fig.title,  # Add the figure title directly
+                height=800 if nZoom > 0 and fig.type == FigureType.TIME else 500,  # Set height for the plot
+                legend=dict(
+                    orientation="h",
+                    yanchor="top",
+                    y=1.14 if nZoom > 0 and fig.type == FigureType.TIME else 1.22,
+                    xanchor="left",
+                    x=0.12,
                 )
-        elif columnNr > 1:
-            plotList.append(make_subplots(rows=ceil(len(figureList) / columnNr), cols=columnNr))
-            plotList[-1].update_layout(height=500 * ceil(len(figureList) / columnNr))  # type: ignore
-            if plotList == imagePlots and caseDict is not None:
-                plotList[-1].update_layout(title_text=caseDict[rank])  # type: ignore
-    return columnNr
+            )
+    elif columnNr > 1:
+        plotList.append(make_subplots(rows=ceil(len(figureList) / columnNr), cols=columnNr))
+        plotList[-1].update_layout(height=500 * ceil(len(figureList) / columnNr))  # type: ignore
+    return plotList
 
 
 def create_css(resultsDir):
@@ -525,8 +795,8 @@ def create_css(resultsDir):
         file.write(css_content)        
         
         
-def create_html(plots: List[go.Figure], cursor_plots: List[go.Figure], path: str, title: str, rank: int,
-                config: ReadConfig, rankList) -> None:
+def create_html(plots: List[go.Figure], cursor_plots: List[go.Figure], title: str, rank: int,
+                config: ReadConfig, rankList) -> str:
                 
     source_list = '<div style="text-align: left; margin-top: 1px;">'
     source_list += '<h4>Source data:</h4>'
@@ -539,6 +809,27 @@ def create_html(plots: List[go.Figure], cursor_plots: List[go.Figure], path: str
     html_content_cursors = create_html_plots(config.htmlCursorColumns, cursor_plots, "Relevant signal metrics", rank) if len(
         cursor_plots) > 0 else ""
     
+    full_html_content = f'''<html>
+  <head>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+	<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css">
+    <link rel="stylesheet" href="mtb.css"
+  </head>
+  <body>
+    {create_navigation(rank, rankList)}
+    {html_content}
+    {html_content_cursors}
+    {source_list}
+    <p><center><a href="https://github.com/Energinet-AIG/MTB" target="_blank">Generated with Energinets Model Testbench</a></center></p>
+  </body>
+</html>'''
+    return full_html_content
+
+
+def create_navigation(rank: int, rankList: List[int]) -> str:
+    '''
+    Creates the navbar and keyboard navigation between rank pages. The block is enclosed in markers so it can be rebuilt when merging shards.
+    '''
     # Create Dropdown Content for the Navbar
     idx = 0
     dropdown_content = ''
@@ -550,14 +841,8 @@ def create_html(plots: List[go.Figure], cursor_plots: List[go.Figure], path: str
     idx = rankList.index(rank)
     rankPrev = rankList[idx-1]
     rankNext = rankList[idx+1 if idx+1 < len(rankList) else 0]
-    
-    full_html_content = f'''<html>
-  <head>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-	<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css">
-    <link rel="stylesheet" href="mtb.css"
-  </head>
-  <body>
+
+    return f'''{NAVIGATION_START}
 	<div class="navbar">
 	  <a href="{rankPrev}.html" > &laquo; Previous Rank</a>
 	  <a href="{rankNext}.html" > Next Rank &raquo;</a>
@@ -589,15 +874,7 @@ def create_html(plots: List[go.Figure], cursor_plots: List[go.Figure], path: str
                     }}
                 }});
     </script>
-    {html_content}
-    {html_content_cursors}
-    {source_list}
-    <p><center><a href="https://github.com/Energinet-AIG/MTB" target="_blank">Generated with Energinets Model Testbench</a></center></p>
-  </body>
-</html>'''
-
-    with open(f'{path}.html', 'w') as file:
-        file.write(full_html_content)
+    {NAVIGATION_END}'''
 
 
 def create_html_plots(columns, plots, title, rank):
@@ -620,17 +897,18 @@ def create_html_plots(columns, plots, title, rank):
     return html_content
 
 
-def readCasesheet(casesheetPath: str) -> Dict[int, str]:
+def readCasesheet(casesheetPath: str) -> Tuple[Optional[Dict[int, str]], Optional[Dict[int, List[float]]],
+                                               Optional[Dict[int, List[Tuple[float, str]]]]]:
     '''
-    Reads optional casesheets and provides dict mapping rank to case title.
+    Reads optional casesheets and provides dicts mapping rank to case title, rank to event times and rank to validation windows.
     '''
     if not casesheetPath:
-        return None
+        return None, None, None
     try:
         pd.read_excel(casesheetPath, sheet_name='RfG cases', header=1)  # type: ignore
     except FileNotFoundError:
-        print(f'Casesheet not found at {casesheetPath}.')
-        return dict()
+        print(f'Casesheet not found at {casesheetPath}.', level=LogLevel.WARNING)
+        return dict(), None, None
 
     cases: List[Case] = list()
     for sheet in ['RfG', 'DCC', 'Unit', 'Custom']:
@@ -639,14 +917,251 @@ def readCasesheet(casesheetPath: str) -> Dict[int, str]:
             cases.append(Case(case))  # type: ignore
 
     caseDict: Dict[int, str] = defaultdict(lambda: 'Unknown case')
+    eventDict: Dict[int, List[float]] = dict()
+    windowDict: Dict[int, List[Tuple[float, str]]] = dict()
     for case in cases:
         caseDict[case.rank] = case.Name
-    return caseDict
+        eventDict[case.rank] = caseEventTimes(case)
+        windowDict[case.rank] = caseWindowBoundaries(case)
+    return caseDict, eventDict, windowDict
+
+
+def mergeShards(shardDirs: List[str], resultsDir: str) -> None:
+    '''
+    Merges the output folders of several shards into the given results folder and rebuilds the navigation between all merged rank pages.
+    Rank pages, images and thumbnails are copied. The validation and oscillation tables of the shards are concatenated,
+    other files of a shard (scan index, log, sweep figures) are not merged.
+    '''
+    if not exists(resultsDir):
+        makedirs(resultsDir)
+
+    ranks: Set[int] = set()
+    hasThumbnails = False
+    validationTables: List[str] = list()
+    oscillationModes: List[OscillationMode] = list()
+    skipped: Set[str] = set()
+    for shardDir in shardDirs:
+        for file in listdir(shardDir):
+            source = join(shardDir, file)
+            if not isfile(source) or file in ('mtb.css', OVERVIEW_FILE):
+                continue
+            if file == VALIDATION_FILE:
+                validationTables.append(source)
+                continue
+            if file == f'{OSCILLATION_FILE}.csv':
+                oscillationModes.extend(mode for modes in readOscillations(source, poorlyDampedOnly=False).values() for mode in modes)
+                continue
+            isThumbnail = re.match(THUMBNAIL_PATTERN, file) is not None
+            rankOutput = re.match(r'^([0-9]+)\.[A-Za-z]+$', file)
+            if not isThumbnail and rankOutput is None:
+                if file != f'{OSCILLATION_FILE}.html':
+                    skipped.add(file)
+                continue
+            if abspath(source) != abspath(join(resultsDir, file)):
+                copy2(source, join(resultsDir, file))
+            if file.endswith('.html') and rankOutput is not None:
+                ranks.add(int(rankOutput.group(1)))
+            hasThumbnails = hasThumbnails or isThumbnail
+
+    create_css(resultsDir)
+    if len(validationTables) > 0:
+        mergeTables(validationTables, join(resultsDir, VALIDATION_FILE))
+    if len(oscillationModes) > 0:
+        writeOscillations(oscillationModes, join(resultsDir, OSCILLATION_FILE))
+    if len(skipped) > 0:
+        print(f'Files of the shards not merged: {", ".join(sorted(skipped))}')
+
+    rankList = sorted(ranks)
+    for rank in rankList:
+        pagePath = join(resultsDir, f'{rank}.html')
+        with open(pagePath, 'r') as file:
+            content = file.read()
+        start = content.find(NAVIGATION_START)
+        end = content.find(NAVIGATION_END)
+        if start < 0 or end < 0:
+            print(f'No navigation found in {pagePath}. Page not relinked.', level=LogLevel.WARNING)
+            continue
+        content = content[:start] + create_navigation(rank, rankList) + content[end + len(NAVIGATION_END):]
+        with open(pagePath, 'w') as file:
+            file.write(content)
+
+    if hasThumbnails:
+        # Case names and figure titles are not known when merging, the overview is labelled by rank and figure number
+        writeOverview(resultsDir, None, dict())
+
+    print(f'Merged {len(rankList)} ranks from {len(shardDirs)} shards into {resultsDir}')
+
+
+def mergeTables(paths: List[str], target: str) -> None:
+    '''
+    Concatenates the rows of the given semicolon separated tables under the header of the first table.
+    '''
+    rows: List[str] = list()
+    header: Optional[str] = None
+    for path in paths:
+        with open(path, 'r', newline='') as file:
+            lines = file.readlines()
+        if len(lines) == 0:
+            continue
+        header = header or lines[0]
+        rows.extend(lines[1:])
+    if header is not None:
+        with open(target, 'w', newline='') as file:
+            file.writelines([header] + rows)
+
 
+def listSignals(resultDict: Dict[int, List[Result]], args: argparse.Namespace) -> None:
+    '''
+    Lists the signals of the signal catalog matching the command line selection.
+    '''
+    ranks = parseRanks(args.ranks) if args.ranks else None
+    matches = querySignals(resultDict, ranks, args.signal_group, args.signals)
+    for result, signal in matches:
+        print(f'{result.rank}\t{result.typ.name}\t{result.shorthand}\t{signal.group}\t{signal.name}\t[{signal.units}]')
+    print(f'{len(matches)} signals found')
+
+
+def validate(resultDict: Dict[int, List[Result]],
+             figureDict: Dict[int, List[Figure]],
+             windowDict: Optional[Dict[int, List[Tuple[float, str]]]],
+             ranks: List[int],
+             config: ReadConfig) -> None:
+    '''
+    Validates the RMS results against the EMT results of the given ranks and writes the pass/fail table to the results folder.
+    '''
+    if not exists(config.resultsDir):
+        makedirs(config.resultsDir)
+    resultSet = ResultSet(resultDict, config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision, cacheSize=0)
+    metrics = validateRanks(ranks, resultSet, figureDict, windowDict, config)
+    path = join(config.resultsDir, VALIDATION_FILE)
+    writeValidation(metrics, path)
+
+    failedRanks = sorted(set(metric.rank for metric in metrics if not metric.passed))
+    validatedRanks = sorted(set(metric.rank for metric in metrics))
+    print(f'Validated {len(validatedRanks)} of {len(ranks)} ranks: {len(validatedRanks) - len(failedRanks)} passed, '
+          f'{len(failedRanks)} failed. Results written to {path}')
+    if len(failedRanks) > 0:
+        print(f'Failed ranks: {", ".join(str(rank) for rank in failedRanks)}', level=LogLevel.WARNING)
+
+
+def oscillations(resultDict: Dict[int, List[Result]],
+                 figureDict: Dict[int, List[Figure]],
+                 windowDict: Optional[Dict[int, List[Tuple[float, str]]]],
+                 ranks: List[int],
+                 config: ReadConfig) -> None:
+    '''
+    Identifies the oscillation modes of the given ranks after their events and writes the table of modes to the results folder.
+    '''
+    if not exists(config.resultsDir):
+        makedirs(config.resultsDir)
+    create_css(config.resultsDir)
+    resultSet = ResultSet(resultDict, config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision, cacheSize=0)
+    modes = analyseRanks(ranks, resultSet, figureDict, windowDict, config)
+    path = join(config.resultsDir, OSCILLATION_FILE)
+    writeOscillations(modes, path)
+
+    flaggedRanks = sorted(set(mode.rank for mode in modes if mode.poorlyDamped))
+    print(f'Identified {len(modes)} oscillation modes in {len(set(mode.rank for mode in modes))} of {len(ranks)} ranks. '
+          f'Results written to {path}.html and {path}.csv')
+    if len(flaggedRanks) > 0:
+        print(f'Ranks with poorly damped modes: {", ".join(str(rank) for rank in flaggedRanks)}', level=LogLevel.WARNING)
+
+
+def sweep(resultDict: Dict[int, List[Result]],
+          caseDict: Dict[int, str],
+          ranks: List[int],
+          signal: str,
+          group: Optional[str],
+          config: ReadConfig) -> None:
+    '''
+    Plots the given signal of all given ranks in one figure and writes it to the results folder.
+    '''
+    resultSet = ResultSet(resultDict, config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision, cacheSize=0)
+    figure = sweepOverlay(resultSet, ranks, signal, group, caseDict if config.optionalCasesheet != '' else None,
+                          config.threads, config.webglThreshold)
+    if figure is None:
+        print(f'Signal "{signal}" not found in any of the {len(ranks)} ranks.', level=LogLevel.ERROR)
+        return
+    writeSweepFigure(figure, join(config.resultsDir, sweepFileName(signal)), config)
+
+
+def envelope(resultDict: Dict[int, List[Result]],
+             caseDict: Dict[int, str],
+             ranks: List[int],
+             signal: str,
+             group: Optional[str],
+             config: ReadConfig) -> None:
+    '''
+    Plots the percentile envelope of the given signal across the given ranks and writes it with the flagged ranks to the results folder.
+    '''
+    resultSet = ResultSet(resultDict, config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision, cacheSize=0)
+    computed = sweepEnvelope(resultSet, ranks, signal, group, config.envelopePercentiles, config.envelopeBins,
+                             config.envelopeOutlierShare, config.threads)
+    if computed is None:
+        print(f'Signal "{signal}" not found in any of the {len(ranks)} ranks.', level=LogLevel.ERROR)
+        return
+    env, flags, flagged = computed
+    figure = envelopeFigure(signal, env, config.envelopePercentiles, flags, flagged,
+                            caseDict if config.optionalCasesheet != '' else None)
+    path = join(config.resultsDir, sweepFileName(signal, 'envelope'))
+    writeSweepFigure(figure, path, config)
+    writeEnvelopeFlags(flags, f'{path}.csv')
+    if len(flags) > 0:
+        print(f'Ranks outside the envelope: {", ".join(str(flag.rank) for flag in flags)}', level=LogLevel.WARNING)
+
+
+def writeSweepFigure(figure: go.Figure, path: str, config: ReadConfig) -> None:
+    if not exists(config.resultsDir):
+        makedirs(config.resultsDir)
+    create_css(config.resultsDir)
+    if config.genHTML:
+        html = figure.to_html(full_html=False, include_plotlyjs='cdn')
+        with open(f'{path}.html', 'w') as file:
+            file.write(f'<html><head><link rel="stylesheet" href="mtb.css"></head><body>{html}</body></html>')
+        print(f'Exported {path}.html')
+    if config.genImage:
+        figure.write_image(f'{path}.{config.imageFormat}', height=800, width=2000)
+        print(f'Exported {path}.{config.imageFormat}')
+
+
+def parseArguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Plots simulation results from PSCAD and PowerFactory.')
+    parser.add_argument('--config', default='config.ini', help='Path to the config file (default: config.ini)')
+    parser.add_argument('--output', help='Output folder, overrides resultsDir of the config file')
+    parser.add_argument('--ranks', help='Ranks to plot, e.g. "1-200,305"')
+    parser.add_argument('--shard', help='Plot only shard <n>/<count> of the selected ranks, e.g. "3/8"')
+    parser.add_argument('--signals', metavar='PATTERN',
+                        help='List the signals matching the name pattern (e.g. "meas_V*") instead of plotting')
+    parser.add_argument('--signal-group', help='Only use signals of the given group (with --signals, --sweep or --envelope)')
+    parser.add_argument('--validate', action='store_true',
+                        help='Validate the RMS results against the EMT results of each rank instead of plotting')
+    parser.add_argument('--oscillations', action='store_true',
+                        help='Identify the oscillation modes and damping after the events of each rank instead of plotting')
+    parser.add_argument('--serve', action='store_true',
+                        help='Serve the rank pages on localhost, rendering each page when first requested, instead of plotting')
+    parser.add_argument('--port', type=int, default=8050, help='Port of the local server (with --serve, default: 8050)')
+    parser.add_argument('--sweep', metavar='SIGNAL',
+                        help='Plot the signal of all selected ranks in one figure instead of plotting, e.g. for SCR/XR sweeps')
+    parser.add_argument('--envelope', metavar='SIGNAL',
+                        help='Plot the percentile envelope of the signal across all selected ranks instead of plotting')
+    parser.add_argument('--merge', nargs='+', metavar='SHARD_DIR',
+                        help='Merge the output folders of several shards into the output folder instead of plotting')
+    return parser.parse_args(argv)
+
+
+def prefetchRanks(rank: int, rankSelection: List[int], resultDict: Dict[int, List[Result]], nRanks: int) -> None:
+    '''
+    Prefetches the result files of the nRanks ranks following the given rank in the selection to the local cache, if one is set.
+    '''
+    cache = localCache()
+    if cache is None or nRanks == 0 or rank not in rankSelection:
+        return
+    position = rankSelection.index(rank)
+    cache.prefetch(file for nextRank in rankSelection[position + 1:position + 1 + nRanks]
+                   for result in resultDict.get(nextRank, []) for file in resultFiles(result))
 
-def main() -> None:
-    config = ReadConfig()
 
+def plot(args: argparse.Namespace, config: ReadConfig) -> None:
     print('Starting plotter main thread')
 
     # Output config
@@ -659,47 +1174,145 @@ def main() -> None:
     resultDict = mapResultFiles(config)
     figureDict = readFigureSetup('figureSetup.csv')
     cursorDict = readCursorSetup('cursorSetup.csv')
-    caseDict = readCasesheet(config.optionalCasesheet)
+    caseDict, eventDict, windowDict = readCasesheet(config.optionalCasesheet)
     colorSchemeMap = colorMap(resultDict)
+
+    rankSelection = selectRanks(resultDict.keys(),
+                                parseRanks(args.ranks) if args.ranks else None,
+                                parseShard(args.shard) if args.shard else None)
+
+    if args.validate:
+        validate(resultDict, figureDict, windowDict, rankSelection, config)
+        return
+
+    if args.oscillations:
+        oscillations(resultDict, figureDict, windowDict, rankSelection, config)
+        return
+
+    if args.sweep:
+        sweep(resultDict, caseDict, rankSelection, args.sweep, args.signal_group, config)
+        return
+
+    if args.envelope:
+        envelope(resultDict, caseDict, rankSelection, args.envelope, args.signal_group, config)
+        return
+
+    # The references of all ranks are built in one pass over the case setup
+    referenceNames = set(figure.reference for rank in rankSelection for figure in figureDict[rank] if figure.reference != '')
+    referenceDict = caseReferences(config.optionalCasesheet, referenceNames)
+    oscillationDict: Optional[Dict[int, List[OscillationMode]]] = None
+    if config.oscillationAnnotations:
+        oscillationDict = readOscillations(join(config.resultsDir, f'{OSCILLATION_FILE}.csv'))
+        print(f'Annotating {sum(len(modes) for modes in oscillationDict.values())} poorly damped oscillation modes.')
+
+    if config.preflight:
+        missingSignals = validateSignals(resultDict, figureDict, cursorDict, rankSelection)
+        if len(missingSignals) > 0 and config.preflightAbort:
+            print('Aborting plotter as referenced signals are missing (preflightAbort = True).', level=LogLevel.ERROR)
+            return
     
     if not exists(config.resultsDir):
         makedirs(config.resultsDir)
 
     create_css(config.resultsDir)
 
-    threads: List[Thread] = list()
-
-    for rank in resultDict.keys():
-        if config.threads > 1:
-            threads.append(Thread(target=drawPlot,
-                                  args=(rank, resultDict, figureDict, caseDict, colorSchemeMap, cursorDict, config)))
-        else:
-            drawPlot(rank, resultDict, figureDict, caseDict, colorSchemeMap, cursorDict, config)
+    if args.serve:
+        # Pages are rendered to html only, image export and thumbnails are left to batch plotting
+        config.genHTML = True
+        config.genImage = False
+        config.thumbnailFigures = list()
+
+        def renderPage(rank: int) -> Optional[str]:
+            job = loadRank(RankJob(rank, resultDict, figureDict, caseDict, colorSchemeMap, cursorDict, config, eventDict, referenceDict,
+                                   oscillationDict))
+            if job is None:
+                return None
+            return renderRank(prepareRank(job)).html
+
+        resultSet = ResultSet(resultDict, config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision)
+        serve(PlotServer(resultSet, figureDict, rankSelection, config.htmlColumns, renderPage, config.resultsDir), args.port)
+        return
 
-    NoT = len(threads)
-    if NoT > 0:
-        sched = threads.copy()
-        inProg: List[Thread] = []
+    print(f'Plotting {len(rankSelection)} of {len(resultDict)} ranks')
 
-        while len(sched) > 0:
-            for t in inProg:
-                if not t.is_alive():
-                    print(f'Thread {t.native_id} finished')
-                    inProg.remove(t)
+    if config.threads == 1:
+        for rank in rankSelection:
+            prefetchRanks(rank, rankSelection, resultDict, config.prefetchRanks)
+            drawPlot(rank, resultDict, figureDict, caseDict, colorSchemeMap, cursorDict, config, eventDict, referenceDict,
+                     oscillationDict)
+    else:
+        governor = MemoryGovernor(config.memoryBudget)
+
+        def discoverRank(rank: int) -> RankJob:
+            job = RankJob(rank, resultDict, figureDict, caseDict, colorSchemeMap, cursorDict, config, eventDict, referenceDict,
+                          oscillationDict)
+            job.estimate = estimateRankMemory(job.resultList, config.memoryEstimateFactor, config.reducedPrecision)
+            if config.memoryBudget > 0 and job.estimate > config.memoryBudget:
+                print(f'Rank {rank} estimated at {job.estimate:.0f} MB exceeds the memory budget. Processing it alone.')
+            # The files of the next ranks are copied while this rank waits for memory and is loaded and rendered
+            prefetchRanks(rank, rankSelection, resultDict, config.prefetchRanks)
+            # Memory is reserved last, so a rank failing in this stage holds no reservation
+            governor.acquire(rank, job.estimate)
+            return job
+
+        def finishRank(job: Union[int, RankJob], ok: bool) -> None:
+            if isinstance(job, RankJob):
+                estimate, peak = governor.release(job.rank)
+                print(f'Rank {job.rank} {"finished" if ok else "skipped"} (estimated {estimate:.0f} MB, peak process memory {peak:.0f} MB)')
+
+        pipeline = Pipeline([Stage('Discover', discoverRank, 1, config.queueSize),
+                             Stage('Load', loadRank, config.loadWorkers, config.queueSize),
+                             Stage('Prepare', prepareRank, config.prepareWorkers, config.queueSize),
+                             Stage('Render', renderRank, config.renderWorkers, config.queueSize),
+                             Stage('Write', writeRank, config.writeWorkers, config.queueSize)],
+                            finishRank)
+        pipeline.start(rankSelection)
+        while pipeline.running():
+            governor.sample()
+            time.sleep(0.5)
+        pipeline.join()
 
-            while len(inProg) < config.threads and len(sched) > 0:
-                nextThread = sched.pop()
-                nextThread.start()
-                print(f'Started thread {nextThread.native_id}')
-                inProg.append(nextThread)
+        for line in pipeline.report():
+            print(line)
+        print(f'Peak process memory {governor.peak:.0f} MB, peak projected memory {governor.peakProjected:.0f} MB, memory budget {config.memoryBudget:.0f} MB')
 
-            time.sleep(0.5)
+    if len(config.thumbnailFigures) > 0:
+        figureTitles = {figure.id: figure.title for rank in rankSelection for figure in figureDict[rank]}
+        nRanks = writeOverview(config.resultsDir, caseDict if config.optionalCasesheet != '' else None, figureTitles,
+                               rankSelection, [figureId for figureId in config.thumbnailFigures if figureId in figureTitles])
+        print(f'Overview of {nRanks} ranks written to {join(config.resultsDir, OVERVIEW_FILE)}')
 
     print('Finished plotter main thread')
 
 
-if __name__ == "__main__":
-    main()
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parseArguments(argv)
+    config = ReadConfig(args.config)
+    setLogLevel(config.logLevel)
+    if args.output:
+        config.resultsDir = args.output
+
+    if args.merge:
+        mergeShards(args.merge, config.resultsDir)
+        return
+
+    cache = LocalCache(config.localCacheDir, config.localCacheSize) if config.localCacheDir != '' else None
+    setLocalCache(cache)
+    try:
+        if args.signals is not None:
+            listSignals(mapResultFiles(config), args)
+        else:
+            plot(args, config)
+    finally:
+        if cache is not None:
+            cache.close()
+            print(cache.report())
+            setLocalCache(None)
 
-if LOG_FILE:
-    LOG_FILE.close()
+
+if __name__ == "__main__":
+    startLogging('plotter.log')
+    try:
+        main()
+    finally:
+        stopLogging()
@@ -0,0 +1,157 @@
+'''
+Queue based logging for the plotter. Workers (threads or pool processes) enqueue records and a single writer thread
+batches them to the console and the log file, so logging never serialises the workers.
+'''
+from __future__ import annotations
+from contextlib import contextmanager
+from enum import Enum
+from threading import Thread, local
+from typing import Any, Iterator, List, Optional, Tuple, Union
+import multiprocessing
+import queue
+import sys
+
+BATCH_SIZE = 1000
+
+
+class LogLevel(Enum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+    @classmethod
+    def from_string(cls, string : str):
+        try:
+            return cls[string.upper()]
+        except KeyError:
+            raise ValueError(f"{string} is not a valid {cls.__name__}")
+
+
+LogRecord = Tuple[LogLevel, Optional[int], str]
+
+_queue: Optional[Union[queue.Queue, multiprocessing.Queue]] = None  # type: ignore
+_level: LogLevel = LogLevel.INFO
+_writer: Optional[LogWriter] = None
+_context = local()
+
+
+class LogWriter(Thread):
+    '''
+    Writes enqueued records to stdout and the log file. Each batch is written and flushed at once.
+    '''
+    def __init__(self, recordQueue: Union[queue.Queue, multiprocessing.Queue], logFile: Optional[str]) -> None:  # type: ignore
+        super().__init__(name='LogWriter', daemon=True)
+        self.recordQueue = recordQueue
+        self.logFile = None
+        if logFile:
+            try:
+                self.logFile = open(logFile, 'w')
+            except OSError:
+                sys.stdout.write('Failed to open log file. Logging to file disabled.\n')
+
+    def run(self) -> None:
+        running = True
+        while running:
+            batch: List[LogRecord] = [self.recordQueue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.recordQueue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                running = False
+            self.write(''.join(formatRecord(record) for record in batch))
+        if self.logFile:
+            self.logFile.close()
+
+    def write(self, output: str) -> None:
+        if output == '':
+            return
+        sys.stdout.write(output)
+        sys.stdout.flush()
+        if self.logFile:
+            try:
+                self.logFile.write(output)
+                self.logFile.flush()
+            except OSError:
+                pass
+
+
+def formatRecord(record: LogRecord) -> str:
+    level, rank, message = record
+    levelPrefix = '' if level == LogLevel.INFO else f'{level.name}: '
+    rankPrefix = '' if rank is None else f'[Rank {rank}] '
+    return f'{levelPrefix}{rankPrefix}{message}\n'
+
+
+def startLogging(logFile: Optional[str], level: LogLevel = LogLevel.INFO, processSafe: bool = False) -> None:
+    '''
+    Starts the writer thread. With processSafe set, a multiprocessing queue is used so pool processes can log through initWorkerLogging.
+    '''
+    global _queue, _writer
+    _queue = multiprocessing.Queue() if processSafe else queue.Queue()
+    _writer = LogWriter(_queue, logFile)
+    _writer.start()
+    setLogLevel(level)
+
+
+def stopLogging() -> None:
+    '''
+    Writes all pending records and stops the writer thread.
+    '''
+    global _queue, _writer
+    if _queue is None or _writer is None:
+        return
+    _queue.put(None)
+    _writer.join()
+    _queue = None
+    _writer = None
+
+
+def setLogLevel(level: LogLevel) -> None:
+    global _level
+    _level = level
+
+
+def logQueue() -> Tuple[Any, LogLevel]:
+    '''
+    Returns the record queue and log level to be passed to initWorkerLogging of pool processes.
+    '''
+    return _queue, _level
+
+
+def initWorkerLogging(recordQueue: Any, level: LogLevel) -> None:
+    '''
+    Initializer for pool processes. Records logged in the worker are enqueued to the writer thread of the main process.
+    '''
+    global _queue
+    _queue = recordQueue
+    setLogLevel(level)
+
+
+@contextmanager
+def logRank(rank: Optional[int]) -> Iterator[None]:
+    '''
+    Prefixes all records logged by the current thread within the context with the given rank.
+    '''
+    previous = getattr(_context, 'rank', None)
+    _context.rank = rank
+    try:
+        yield
+    finally:
+        _context.rank = previous
+
+
+def log(*args: Any, level: LogLevel = LogLevel.INFO) -> None:
+    '''
+    Logs the given arguments. Without a running writer the record is written directly to stdout.
+    '''
+    if level.value < _level.value:
+        return
+    record: LogRecord = (level, getattr(_context, 'rank', None), ''.join(map(str, args)))
+    if _queue is None:
+        sys.stdout.write(formatRecord(record))
+    else:
+        _queue.put(record)
@@ -0,0 +1,45 @@
+'''
+Selection of rank subsets for distributing a plotting run over several machines.
+'''
+from __future__ import annotations
+from typing import Iterable, List, Set, Tuple
+
+
+def parseRanks(rankString: str) -> Set[int]:
+    '''
+    Parses a rank selection like "1-200,305,310-312" into a set of ranks.
+    '''
+    ranks: Set[int] = set()
+    for item in rankString.split(','):
+        item = item.strip()
+        if item == '':
+            continue
+        if '-' in item:
+            first, last = item.split('-', 1)
+            ranks.update(range(int(first), int(last) + 1))
+        else:
+            ranks.add(int(item))
+    return ranks
+
+
+def parseShard(shardString: str) -> Tuple[int, int]:
+    '''
+    Parses a shard selection like "3/8" into shard number and shard count. Shards are numbered from 1.
+    '''
+    shard, count = shardString.split('/')
+    shardNr, shardCount = int(shard), int(count)
+    if shardCount < 1 or not 1 <= shardNr <= shardCount:
+        raise ValueError(f'Invalid shard "{shardString}". Expected <shard>/<count> with 1 <= shard <= count.')
+    return shardNr, shardCount
+
+
+def selectRanks(ranks: Iterable[int], rankSet: Set[int] | None, shard: Tuple[int, int] | None) -> List[int]:
+    '''
+    Returns the sorted ranks within the given rank set (None selects all) belonging to the given shard (None selects all).
+    Ranks are dealt round-robin to the shards so neighbouring ranks of similar size are spread over the machines.
+    '''
+    selected = sorted(rank for rank in ranks if rankSet is None or rank in rankSet)
+    if shard is not None:
+        shardNr, shardCount = shard
+        selected = selected[shardNr - 1::shardCount]
+    return selected
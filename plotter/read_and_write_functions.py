@@ -1,20 +1,101 @@
 import pandas as pd
+import numpy as np
 from os.path import join, split, splitext
-from os import listdir
-from typing import Dict
+from typing import Collection, Dict, List, Optional, Tuple, Union
 import re
+import csv
+from Result import ResultType
+from plotter_logging import log
+from time_index import readWindow
+from archives import listDir, openFile
 
 
-def loadEMT(infFile: str) -> pd.DataFrame:
+def idFile(filePath: str) -> Tuple[
+    Union[ResultType, None], Union[int, None], Union[str, None], Union[str, None], Union[str, None]]:
+    '''
+    Identifies the type (EMT or RMS), root and case id of a given file. If the file is not recognized, a none tuple is returned.
+    '''
+    path, fileName = split(filePath)
+    match = re.match(r'^(\w+?)_([0-9]+).(inf|csv)$', fileName.lower())
+    if match:
+        rank = int(match.group(2))
+        projectName = match.group(1)
+        bulkName = join(path, match.group(1))
+        fullpath = filePath
+        with openFile(filePath, 'r') as file:
+            firstLine = file.readline()
+            if match.group(3) == 'inf' and firstLine.startswith('PGB(1)'):
+                fileType = ResultType.EMT
+                return (fileType, rank, projectName, bulkName, fullpath)
+            elif match.group(3) == 'csv':
+                secondLine = file.readline()
+                if secondLine.startswith(r'"b:tnow in s"'):
+                    fileType = ResultType.RMS
+                    return (fileType, rank, projectName, bulkName, fullpath)
+    return (None, None, None, None, None)
+
+
+def loadEMT(infFile: str,
+            reducedPrecision: bool = False,
+            columns: Optional[Collection[int]] = None,
+            window: Optional[Tuple[float, float]] = None) -> pd.DataFrame:
     '''
     Load EMT results from a collection of csv files defined by the given inf file. Returns a dataframe with index 'time'.
+    If reducedPrecision is set, signal columns are loaded as float32. The time column is always loaded as float64.
+    If columns (PGB numbers) are given, only these signals and the time are read.
+    If a time window (t0, t1) in file time is given, only the rows of the window are read, located by the sparse time index.
+    '''
+    fragments: List[pd.DataFrame] = list()
+    firstFile = True
+    loadedColumns = 0
+    for csvFile in emtFragments(infFile):
+        # Every fragment starts with the time column, which is only kept from the first fragment
+        firstColumn = 0 if firstFile else 1
+        columnCount = csvColumnCount(csvFile)
+        fileColumns = range(firstColumn, columnCount)
+        pgbs = {column: loadedColumns + column - firstColumn for column in fileColumns}
+        loadedColumns += len(fileColumns)
+        keepTime = firstFile
+        firstFile = False
+
+        usecols = [column for column in fileColumns if columns is None or pgbs[column] == 0 or pgbs[column] in columns]
+        if len(usecols) == 0:
+            continue
+        if window is None:
+            with openFile(csvFile, 'rb', mirror=True) as file:
+                dfMap = pd.read_csv(file, skiprows=1, header=None, usecols=usecols, dtype=signalDtypes(columnCount, reducedPrecision))  # type: ignore
+        else:
+            # The time column of every fragment is read to filter the rows of the window
+            readcols = sorted(set(usecols) | {0})
+            dfMap = pd.read_csv(readWindow(csvFile, 1, ',', '.', window), header=None, usecols=readcols,
+                                dtype=signalDtypes(columnCount, reducedPrecision))  # type: ignore
+            dfMap = dfMap[(dfMap[0] >= window[0]) & (dfMap[0] <= window[1])].reset_index(drop=True)
+            if not keepTime:
+                dfMap = dfMap[usecols]
+        dfMap.columns = [pgbs[column] for column in usecols]
+        fragments.append(dfMap)
+    df = pd.concat(fragments, axis=1)  # type: ignore
+
+    columnNames = emtColumns(infFile)
+    columnNames[0] = 'time'
+    columnNames = {pgb: name for pgb, name in columnNames.items() if pgb in df.columns}
+    df = df[columnNames.keys()]
+    df.rename(columnNames, inplace=True, axis=1)
+    if len(df) > 0:
+        log(f"Loaded {infFile}, length = {df['time'].iloc[-1]}s")  # type: ignore
+    return df
+
+
+def emtFragments(infFile: str) -> List[str]:
+    '''
+    Returns the csv files holding the data of the given inf file, ordered by fragment number.
     '''
     folder, filename = split(infFile)
     filename, fileext = splitext(filename)
 
     assert fileext.lower() == '.inf'
 
-    adjFiles = listdir(folder)
+    adjFiles = listDir(folder)
     csvMap: Dict[int, str] = dict()
     pat = re.compile(r'^' + filename.lower() + r'(?:_([0-9]+))?.csv$')
 
@@ -28,38 +109,123 @@ def loadEMT(infFile: str) -> pd.DataFrame:
             csvMap[id] = join(folder, file)
     csvMaps = list(csvMap.keys())
     csvMaps.sort()
+    return [csvMap[map] for map in csvMaps]
 
-    df = pd.DataFrame()
-    firstFile = True
-    loadedColumns = 0
-    for map in csvMaps:
-        dfMap = pd.read_csv(csvMap[map], skiprows=1, header=None)  # type: ignore
-        if not firstFile:
-            dfMap = dfMap.iloc[:, 1:]
+
+def loadRMS(csvFile: str,
+            reducedPrecision: bool = False,
+            columns: Optional[Collection[int]] = None,
+            window: Optional[Tuple[float, float]] = None) -> pd.DataFrame:
+    '''
+    Load RMS results from a PowerFactory csv export. Returns a dataframe with a two-row header, the first column being time.
+    If reducedPrecision is set, signal columns are converted to float32. The time column is always kept as float64.
+    If columns (column numbers) are given, only these signals and the time are read.
+    If a time window (t0, t1) in file time is given, only the rows of the window are read, located by the sparse time index.
+    '''
+    if columns is None and window is None:
+        with openFile(csvFile, 'rb', mirror=True) as file:
+            df: pd.DataFrame = pd.read_csv(file, sep=';', decimal=',', header=[0, 1])  # type: ignore
+    else:
+        # read_csv does not support usecols with a multi-row header, so the header is applied afterwards
+        header = rmsColumns(csvFile)
+        usecols = sorted(set(columns) | {0}) if columns is not None else list(range(len(header)))
+        if window is None:
+            with openFile(csvFile, 'rb', mirror=True) as file:
+                df = pd.read_csv(file, sep=';', decimal=',', header=None, skiprows=2, usecols=usecols)  # type: ignore
         else:
-            firstFile = False
-        dfMap.columns = list(range(loadedColumns, loadedColumns + len(dfMap.columns)))
-        loadedColumns = loadedColumns + len(dfMap.columns)
-        df = pd.concat([df, dfMap], axis=1)  # type: ignore
-
-    columns = emtColumns(infFile)
-    columns[0] = 'time'
-    df = df[columns.keys()]
-    df.rename(columns, inplace=True, axis=1)
-    print(f"Loaded {infFile}, length = {df['time'].iloc[-1]}s")  # type: ignore
+            df = pd.read_csv(readWindow(csvFile, 2, ';', ',', window), sep=';', decimal=',', header=None, usecols=usecols)  # type: ignore
+            df = df[(df[0] >= window[0]) & (df[0] <= window[1])].reset_index(drop=True)
+        df.columns = pd.MultiIndex.from_tuples([header[column] for column in usecols])
+    if reducedPrecision:
+        df = df.astype({column: np.float32 for column in df.columns[1:]})  # type: ignore
     return df
 
 
+def signalDtypes(columnCount: int, reducedPrecision: bool) -> Optional[Dict[int, type]]:
+    '''
+    Returns the dtype mapping used by read_csv for an EMT csv file with the given number of columns, where column 0 holds the time.
+    The column count must be taken from the data rows (csvColumnCount), as the header line of PSCAD csv files is empty.
+    Returns None (pandas default dtypes) unless reducedPrecision is set.
+    '''
+    if not reducedPrecision:
+        return None
+    return {column: np.float64 if column == 0 else np.float32 for column in range(columnCount)}
+
+
+def csvColumnCount(csvFile: str) -> int:
+    '''
+    Returns the number of columns of the given EMT csv file, counted on the first data row.
+    '''
+    with openFile(csvFile, 'r') as file:
+        file.readline()
+        return len(file.readline().split(','))
+
+
+def signalColumn(typ: ResultType, rawSigName: str) -> Tuple[str, Union[str, Tuple[str, str]]]:
+    '''
+    Maps a signal name from the figure or cursor setup to the column of the loaded result. Returns the cleaned signal name and the column.
+    RMS signals are given as "<object>\\<variable>" and map to the two-row header of the PowerFactory export.
+    '''
+    if typ == ResultType.RMS:
+        while rawSigName.startswith('#'):
+            rawSigName = rawSigName[1:]
+        splitSigName = rawSigName.split('\\')
+
+        if len(splitSigName) == 2:
+            return rawSigName, ('##' + splitSigName[0], splitSigName[1])
+    return rawSigName, rawSigName
+
+
+def rmsColumns(csvFile: str) -> List[Tuple[str, str]]:
+    '''
+    Reads the two-row header of the given RMS result file and returns the columns, the first column being time.
+    '''
+    with openFile(csvFile, 'r', newline='') as file:
+        reader = csv.reader(file, delimiter=';')
+        objects = next(reader)
+        variables = next(reader)
+    return list(zip(objects, variables))
+
+
 def emtColumns(infFilePath: str) -> Dict[int, str]:
     '''
     Reads EMT result columns from the given inf file and returns a dictionary with the column number as key and the column name as value.
     '''
     columns: Dict[int, str] = dict()
-    with open(infFilePath, 'r') as file:
+    for pgb, desc, _, _, _, _ in emtDescriptors(infFilePath):
+        columns[pgb] = desc
+    return columns
+
+
+def emtDescriptors(infFilePath: str) -> List[Tuple[int, str, str, float, float, str]]:
+    '''
+    Reads the PGB descriptors of the given inf file. Returns a list of (column number, name, group, max, min, units).
+    '''
+    descriptors: List[Tuple[int, str, str, float, float, str]] = list()
+    with openFile(infFilePath, 'r') as file:
         for line in file:
             rem = re.match(
                 r'^PGB\(([0-9]+)\) +Output +Desc="(\w+)" +Group="(\w+)" +Max=([0-9\-\.]+) +Min=([0-9\-\.]+) +Units="(\w*)" *$',
                 line)
             if rem:
-                columns[int(rem.group(1))] = rem.group(2)
-    return columns
\ No newline at end of file
+                descriptors.append((int(rem.group(1)), rem.group(2), rem.group(3), float(rem.group(4)),
+                                    float(rem.group(5)), rem.group(6)))
+    return descriptors
+
+def loadRecording(path: str, column: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Loads the given column of a recorded waveform with time in column 0. Supports the formats of sim_interface.Recorded:
+    PowerFactory ElmFile (.meas), PSCAD legacy (.out) and .csv with dot decimal and semicolon separator.
+    Returns time and values sorted by time.
+    '''
+    extension = splitext(path)[1].lower()
+    if extension == '.meas' or extension == '.out':
+        with open(path, 'r') as file:
+            file.readline()  # Header line, "1" in ElmFile format and empty in PSCAD .out files
+            data = np.loadtxt((line.replace(',', ' ') for line in file), ndmin=2)
+    elif extension == '.csv':
+        data = pd.read_csv(path, sep=';', decimal='.', header=None, skiprows=1).to_numpy(dtype=np.float64)
+    else:
+        raise RuntimeError(f'Unknown filetype of: {path}.')
+    order = np.argsort(data[:, 0], kind='stable')
+    return data[order, 0], data[order, column]
@@ -7,13 +7,18 @@ from Cursor import Cursor
 from collections import defaultdict
 from configparser import ConfigParser
 from down_sampling_method import DownSamplingMethod
+from figure_type import FigureType
 from cursor_type import CursorType
+from plotter_logging import LogLevel
+from derived_signals import compileExpression, isExpression
+from recordings import Recording
 
 
 class ReadConfig:
-    def __init__(self) -> None:
+    def __init__(self, configPath: str = 'config.ini') -> None:
         cp = ConfigParser()
-        cp.read('config.ini')
+        if not cp.read(configPath):
+            raise FileNotFoundError(f'Config file not found at {configPath}.')
         parsedConf = cp['config']
         self.resultsDir = parsedConf['resultsDir']
         self.genHTML = parsedConf.getboolean('genHTML')
@@ -29,15 +34,100 @@ class ReadConfig:
         self.imageFormat = parsedConf['imageFormat']
         self.threads = parsedConf.getint('threads')
         assert self.threads > 0
+        self.loadWorkers = parsedConf.getint('loadWorkers', fallback=2)
+        assert self.loadWorkers > 0
+        self.prepareWorkers = parsedConf.getint('prepareWorkers', fallback=2)
+        assert self.prepareWorkers > 0
+        self.renderWorkers = parsedConf.getint('renderWorkers', fallback=self.threads)
+        assert self.renderWorkers > 0
+        self.writeWorkers = parsedConf.getint('writeWorkers', fallback=1)
+        assert self.writeWorkers > 0
+        self.queueSize = parsedConf.getint('queueSize', fallback=2)
+        assert self.queueSize > 0
         self.pfFlatTIme = parsedConf.getfloat('pfFlatTime')
         assert self.pfFlatTIme >= 0.1
         self.pscadInitTime = parsedConf.getfloat('pscadInitTime')
         assert self.pscadInitTime >= 1.0
         self.optionalCasesheet = parsedConf['optionalCasesheet']
+        self.reducedPrecision = parsedConf.getboolean('reducedPrecision', fallback=False)
+        self.memoryBudget = parsedConf.getfloat('memoryBudget', fallback=0.0)
+        assert self.memoryBudget >= 0.0
+        self.memoryEstimateFactor = parsedConf.getfloat('memoryEstimateFactor', fallback=10.0)
+        assert self.memoryEstimateFactor > 0.0
+        self.webglThreshold = parsedConf.getint('webglThreshold', fallback=100000)
+        assert self.webglThreshold >= 0
+        self.logLevel = LogLevel.from_string(parsedConf.get('logLevel', fallback='INFO'))
+        self.preflight = parsedConf.getboolean('preflight', fallback=True)
+        self.preflightAbort = parsedConf.getboolean('preflightAbort', fallback=False)
+        self.eventZoom = parsedConf.getboolean('eventZoom', fallback=False)
+        self.zoomBefore = parsedConf.getfloat('zoomBefore', fallback=0.05)
+        assert self.zoomBefore >= 0.0
+        self.zoomAfter = parsedConf.getfloat('zoomAfter', fallback=0.3)
+        assert self.zoomAfter > 0.0
+        self.zoomMaxEvents = parsedConf.getint('zoomMaxEvents', fallback=4)
+        assert self.zoomMaxEvents >= 0
+        self.validationStep = parsedConf.getfloat('validationStep', fallback=0.001)
+        assert self.validationStep > 0.0
+        self.validationMeanTolerance = parsedConf.getfloat('validationMeanTolerance', fallback=0.02)
+        assert self.validationMeanTolerance >= 0.0
+        self.validationMaxTolerance = parsedConf.getfloat('validationMaxTolerance', fallback=0.1)
+        assert self.validationMaxTolerance >= 0.0
+        self.validationTransientTime = parsedConf.getfloat('validationTransientTime', fallback=0.02)
+        assert self.validationTransientTime >= 0.0
+        self.fundamentalFrequency = parsedConf.getfloat('fundamentalFrequency', fallback=50.0)
+        assert self.fundamentalFrequency > 0.0
+        self.spectrumMaxHarmonic = parsedConf.getint('spectrumMaxHarmonic', fallback=50)
+        assert self.spectrumMaxHarmonic > 0
+        self.thumbnailFigures = [int(figure) for figure in parsedConf.get('thumbnailFigures', fallback='').split(',') if figure.strip() != '']
+        self.envelopePercentiles = [float(p) for p in parsedConf.get('envelopePercentiles', fallback='5, 25').split(',')]
+        assert all(0.0 <= p < 50.0 for p in self.envelopePercentiles)
+        self.envelopeBins = parsedConf.getint('envelopeBins', fallback=128)
+        assert self.envelopeBins > 0
+        self.envelopeOutlierShare = parsedConf.getfloat('envelopeOutlierShare', fallback=0.25)
+        assert 0.0 <= self.envelopeOutlierShare < 1.0
+        self.localCacheDir = parsedConf.get('localCacheDir', fallback='')
+        self.localCacheSize = parsedConf.getfloat('localCacheSize', fallback=20000.0)
+        assert self.localCacheSize > 0.0
+        self.prefetchRanks = parsedConf.getint('prefetchRanks', fallback=2)
+        assert self.prefetchRanks >= 0
+        self.oscillationFigures = [int(figure) for figure in parsedConf.get('oscillationFigures', fallback='').split(',') if figure.strip() != '']
+        self.oscillationDelay = parsedConf.getfloat('oscillationDelay', fallback=0.05)
+        assert self.oscillationDelay >= 0.0
+        self.oscillationWindow = parsedConf.getfloat('oscillationWindow', fallback=1.0)
+        assert self.oscillationWindow > 0.0
+        self.oscillationOrder = parsedConf.getint('oscillationOrder', fallback=8)
+        assert self.oscillationOrder > 0
+        self.oscillationMaxFrequency = parsedConf.getfloat('oscillationMaxFrequency', fallback=25.0)
+        assert self.oscillationMaxFrequency > 0.0
+        self.oscillationMinAmplitude = parsedConf.getfloat('oscillationMinAmplitude', fallback=0.001)
+        assert self.oscillationMinAmplitude >= 0.0
+        self.oscillationMinDamping = parsedConf.getfloat('oscillationMinDamping', fallback=0.05)
+        self.oscillationAnnotations = parsedConf.getboolean('oscillationAnnotations', fallback=False)
         self.simDataDirs : List[Tuple[str, str]] = list()
         simPaths = cp.items('Simulation data paths')
         for name, path in simPaths:
             self.simDataDirs.append((name, path))
+        self.recordings: Dict[str, Recording] = dict()
+        if cp.has_section('Recordings'):
+            for name, value in cp.items('Recordings'):
+                recording = [item.strip() for item in value.split(',')]
+                assert 2 <= len(recording) <= 3, f'Recording "{name}" must be given as <path>, <column>[, <scale>].'
+                scale = float(recording[2]) if len(recording) == 3 else 1.0
+                self.recordings[name] = Recording(name, recording[0], int(recording[1]), scale)
+
+
+def parseWindows(windows: str) -> List[Tuple[float, float]]:
+    '''
+    Parses time windows given as "<start>:<end>" separated by commas, e.g. "0.5:0.7, 2.0:2.2".
+    '''
+    parsed: List[Tuple[float, float]] = list()
+    for window in windows.split(','):
+        if window.strip() == '':
+            continue
+        start, end = (float(time) for time in window.split(':'))
+        assert end > start, f'Window "{window.strip()}" must end after it starts.'
+        parsed.append((start, end))
+    return parsed
 
 
 def readFigureSetup(filePath: str) -> Dict[int, List[Figure]]:
@@ -52,6 +142,12 @@ def readFigureSetup(filePath: str) -> Dict[int, List[Figure]]:
                 set([int(item.strip()) for item in row.get('exclude_in_case', '').split(',') if item.strip() != '']))
             row['include_in_case'] = list(
                 set([int(item.strip()) for item in row.get('include_in_case', '').split(',') if item.strip() != '']))
+            # Compile derived signal expressions up front so errors are reported before plotting
+            for signalKey in ('emt', 'rms'):
+                for sig in range(1, 4):
+                    rawSigName = row[f'{signalKey}_signal_{sig}']
+                    if isExpression(rawSigName):  # type: ignore
+                        compileExpression(rawSigName)  # type: ignore
             setup.append(row)
 
     figureList: List[Figure] = list()
@@ -69,7 +165,12 @@ def readFigureSetup(filePath: str) -> Dict[int, List[Figure]]:
                    figureStr['gradient_threshold'],  # type: ignore
                    DownSamplingMethod.from_string(figureStr['down_sampling_method']),  # type: ignore
                    figureStr['include_in_case'],  # type: ignore
-                   figureStr['exclude_in_case']))  # type: ignore
+                   figureStr['exclude_in_case'],  # type: ignore
+                   str(figureStr.get('recording') or '').strip().lower(),
+                   str(figureStr.get('reference') or '').strip().lower(),
+                   FigureType.from_string(str(figureStr.get('type') or '')),
+                   parseWindows(str(figureStr.get('spectrum_windows') or '')),
+                   str(figureStr.get('validate') or '').strip().lower() in ('true', 'yes', '1')))
 
     defaultSetup = [fig for fig in figureList if fig.include_in_case == []]
     figDict: Dict[int, List[Figure]] = defaultdict(lambda: defaultSetup)
@@ -102,6 +203,9 @@ def readCursorSetup(filePath: str) -> List[Cursor]:
                 set([str(item.strip()) for item in row.get('emt_signals', '').split(',') if item.strip() != '']))
             row['rms_signals'] = list(
                 set([str(item.strip()) for item in row.get('rms_signals', '').split(',') if item.strip() != '']))
+            for rawSigName in row['emt_signals'] + row['rms_signals']:  # type: ignore
+                if isExpression(rawSigName):
+                    compileExpression(rawSigName)
             row['time_ranges'] = list(
                 set([float(item.strip()) for item in row.get('time_ranges', '').split(',') if item.strip() != '']))
             setup.append(row)
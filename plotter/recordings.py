@@ -0,0 +1,97 @@
+'''
+Field recordings overlaid on the figures. A recording is aligned in time to the simulated trace of the figure
+by FFT cross-correlation on a common uniform grid, and the time offset and fit error are reported.
+'''
+from __future__ import annotations
+from threading import Lock
+from typing import Optional, Tuple
+import numpy as np
+from read_and_write_functions import loadRecording
+
+
+class Recording:
+    '''
+    Recorded waveform defined in the recordings section of the config. The file is loaded once, on first use.
+    '''
+    def __init__(self, name: str, path: str, column: int, scale: float = 1.0) -> None:
+        self.name = name
+        self.path = path
+        self.column = column
+        self.scale = scale
+        self.__data__: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.__lock__ = Lock()
+
+    def __repr__(self) -> str:
+        return f'{self.path}, column {self.column}, scale {self.scale}'
+
+    @property
+    def data(self) -> Tuple[np.ndarray, np.ndarray]:
+        with self.__lock__:
+            if self.__data__ is None:
+                time, values = loadRecording(self.path, self.column)
+                self.__data__ = (time, values * self.scale)
+            return self.__data__
+
+
+class Alignment:
+    def __init__(self, offset: float, rmsError: float, overlap: float) -> None:
+        self.offset = offset  # Added to the recording time
+        self.rmsError = rmsError
+        self.overlap = overlap  # Duration of the aligned overlap
+
+
+def uniqueTime(time: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns the samples with finite values, keeping the first sample of repeated time stamps.
+    '''
+    finite = np.isfinite(values) & np.isfinite(time)
+    time, values = time[finite], values[finite]
+    time, index = np.unique(time, return_index=True)
+    return time, values[index]
+
+
+def resample(time: np.ndarray, values: np.ndarray, dt: float) -> Tuple[np.ndarray, np.ndarray]:
+    grid = np.arange(time[0], time[-1], dt)
+    return grid, np.interp(grid, time, values)
+
+
+def alignRecording(recTime, recValues, simTime, simValues) -> Optional[Alignment]:
+    '''
+    Finds the time offset of the recording maximising its cross-correlation with the simulated trace.
+    Both are resampled to a uniform grid with the coarser of the two median time steps and correlated with one FFT.
+    The peak is refined by parabolic interpolation. Returns None if either trace has too few samples.
+    '''
+    recTime, recValues = uniqueTime(np.asarray(recTime, dtype=np.float64), np.asarray(recValues, dtype=np.float64))
+    simTime, simValues = uniqueTime(np.asarray(simTime, dtype=np.float64), np.asarray(simValues, dtype=np.float64))
+    if len(recTime) < 3 or len(simTime) < 3:
+        return None
+
+    dt = max(float(np.median(np.diff(recTime))), float(np.median(np.diff(simTime))))
+    recGrid, rec = resample(recTime, recValues, dt)
+    simGrid, sim = resample(simTime, simValues, dt)
+    if len(rec) < 3 or len(sim) < 3:
+        return None
+    rec = rec - rec.mean()
+    sim = sim - sim.mean()
+
+    # corr[k] = sum(sim[i + k] * rec[i]), negative lags wrap around to the end
+    nfft = 1 << (len(rec) + len(sim) - 2).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(sim, nfft) * np.conj(np.fft.rfft(rec, nfft)), nfft)
+    lags = np.concatenate((np.arange(0, len(sim)), np.arange(-(len(rec) - 1), 0)))
+    corr = np.concatenate((corr[:len(sim)], corr[nfft - len(rec) + 1:]))
+
+    peak = int(np.argmax(corr))
+    lag = float(lags[peak])
+    if 0 < peak < len(corr) - 1 and lags[peak - 1] == lags[peak] - 1 and lags[peak + 1] == lags[peak] + 1:
+        denominator = corr[peak - 1] - 2.0 * corr[peak] + corr[peak + 1]
+        if denominator < 0.0:
+            lag += 0.5 * (corr[peak - 1] - corr[peak + 1]) / denominator
+    offset = simGrid[0] + lag * dt - recGrid[0]
+
+    # Fit error on the original recording samples within the simulated time span
+    shifted = recTime + offset
+    inside = (shifted >= simTime[0]) & (shifted <= simTime[-1])
+    if not inside.any():
+        return Alignment(offset, float('nan'), 0.0)
+    residual = np.interp(shifted[inside], simTime, simValues) - recValues[inside]
+    return Alignment(offset, float(np.sqrt(np.mean(residual ** 2))), float(shifted[inside][-1] - shifted[inside][0]))
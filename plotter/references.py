@@ -0,0 +1,124 @@
+'''
+Reference waveforms rebuilt from the case setup of the testbench. The sim_interface waveforms of all ranks are built
+in a single pass by case_setup.setup, without PowerFactory or PSCAD, and evaluated on the plot time grid of each rank.
+Piecewise references are evaluated vectorised, recorded references are read from their files. Relative paths of
+recorded references are resolved against the folder of the casesheet.
+'''
+from __future__ import annotations
+from os.path import abspath, dirname, isabs, join
+from typing import Dict, List, Optional, Set, Tuple, Union
+import sys
+import warnings
+import numpy as np
+from Figure import Figure
+from recordings import Recording
+from traces import downsample
+from plotter_logging import LogLevel, log
+
+MTB_DIR = dirname(dirname(abspath(__file__)))  # case_setup.py and sim_interface.py are found in the parent folder of the plotter
+REFERENCE_GROUP = 'reference'
+REFERENCE_COLOR = '#7f7f7f'
+# Transformations applied as in the PowerFactory setup, a negative initial voltage reference selects load flow initialisation
+REFERENCE_TRANSFORMS = {'mtb_s_vref_pu': np.abs}
+
+
+class PiecewiseReference:
+    '''
+    Piecewise waveform of sim_interface. From time t[i] the waveform starts at s[i] and continues with gradient r[i].
+    '''
+    def __init__(self, t: List[float], s: List[float], r: List[float]) -> None:
+        self.t = np.asarray(t, dtype=np.float64)
+        self.s = np.asarray(s, dtype=np.float64)
+        self.r = np.asarray(r, dtype=np.float64)
+
+    def evaluate(self, time: np.ndarray) -> np.ndarray:
+        index = np.clip(np.searchsorted(self.t, time, side='right') - 1, 0, None)
+        return self.s[index] + (time - self.t[index]) * self.r[index]
+
+
+class RecordedReference:
+    '''
+    Recorded waveform of sim_interface, loaded on first use and interpolated on the plot time grid.
+    '''
+    def __init__(self, recording: Recording) -> None:
+        self.recording = recording
+
+    def evaluate(self, time: np.ndarray) -> np.ndarray:
+        recTime, recValues = self.recording.data
+        return np.interp(time, recTime, recValues)
+
+
+Reference = Union[PiecewiseReference, RecordedReference]
+
+
+def caseReferences(casesheetPath: str, names: Set[str]) -> Dict[int, Dict[str, Reference]]:
+    '''
+    Builds the given reference signals of all ranks of the casesheet with case_setup.setup.
+    Returns a dictionary with rank as key and a dictionary of the references of the rank by signal name as value.
+    '''
+    references: Dict[int, Dict[str, Reference]] = dict()
+    if not casesheetPath or len(names) == 0:
+        return references
+
+    if MTB_DIR not in sys.path:
+        sys.path.append(MTB_DIR)
+    try:
+        with warnings.catch_warnings():
+            # Neither PowerFactory nor PSCAD is set up, the recorded waveforms are not converted to simulator files
+            warnings.simplefilter('ignore')
+            import sim_interface as si
+            import case_setup
+            _, channels, _, _, _ = case_setup.setup(casesheetPath, pscad=False, pfEncapsulation=None)
+    except Exception as e:
+        log(f'Reference waveforms could not be built from the casesheet {casesheetPath}: {e}', level=LogLevel.WARNING)
+        return references
+
+    found: Set[str] = set()
+    for channel in channels:
+        if not isinstance(channel, si.Signal) or channel.name not in names:
+            continue
+        found.add(channel.name)
+        for rank in channel.ranks:
+            waveform = channel[rank]
+            if isinstance(waveform, si.Piecewise):
+                reference: Reference = PiecewiseReference(waveform.__t__, waveform.s(), waveform.r())
+            elif isinstance(waveform, si.Recorded):
+                path = waveform.__path__ if isabs(waveform.__path__) else join(dirname(abspath(casesheetPath)), waveform.__path__)
+                reference = RecordedReference(Recording(channel.name, path, waveform.__column__, waveform.__scale__))
+            else:
+                continue
+            references.setdefault(rank, dict())[channel.name] = reference
+
+    for name in sorted(names - found):
+        log(f'Reference "{name}" is not a signal of the case setup.', level=LogLevel.WARNING)
+    return references
+
+
+def referenceTraces(references: Dict[str, Reference],
+                    figures: List[Figure],
+                    time: np.ndarray) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    '''
+    Evaluates the references of the given figures on the plot time grid and downsamples them with the figure method.
+    Each reference is evaluated once. References that fail to load are logged and left out.
+    Returns a dictionary with figure id as key and the trace as value.
+    '''
+    evaluated: Dict[str, Optional[np.ndarray]] = dict()
+    traces: Dict[int, Tuple[np.ndarray, np.ndarray]] = dict()
+    for figure in figures:
+        if figure.reference not in references:
+            continue
+        if figure.reference not in evaluated:
+            reference = references[figure.reference]
+            try:
+                values = reference.evaluate(time)
+            except (OSError, ValueError, IndexError, RuntimeError) as e:
+                source = f' from {reference.recording.path}' if isinstance(reference, RecordedReference) else ''
+                log(f'Reference "{figure.reference}" could not be loaded{source}: {e}', level=LogLevel.WARNING)
+                evaluated[figure.reference] = None
+                continue
+            transform = REFERENCE_TRANSFORMS.get(figure.reference)
+            evaluated[figure.reference] = values if transform is None else transform(values)
+        referenceValues = evaluated[figure.reference]
+        if referenceValues is not None:
+            traces[figure.id] = downsample(figure, time, referenceValues)
+    return traces
@@ -0,0 +1,218 @@
+'''
+Lazy query API over the result files of the simulation data folders, for notebooks and scripts. The plotter reads
+results through the same API. Ranks, groups and signals come from the signal catalog; data is only read when a
+signal is requested, limited to the needed columns and time window, and kept in an LRU cache.
+
+    rs = ResultSet.fromConfig(ReadConfig('config.ini'))
+    rs[5].signal('meas_Vab_pu', t0=0.1, t1=0.5)
+    rs[5].result(ResultType.RMS).signal('meas\\s:Vab_pu')
+
+Times are plotted times, i.e. with the PowerFactory flat time and the PSCAD initialisation time removed.
+'''
+from __future__ import annotations
+from collections import OrderedDict
+from os.path import join
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+from Result import ResultType, Result
+from read_configs import ReadConfig
+from read_and_write_functions import loadEMT, loadRMS, signalColumn
+from signal_catalog import SCAN_INDEX_FILE, SignalCatalog, SignalInfo, querySignals
+from derived_signals import DerivedSignals, isExpression, requiredColumns, signalAvailable
+
+DEFAULT_CACHE_SIZE = 256  # MB
+
+
+def mapResultFiles(config: ReadConfig) -> Dict[int, List[Result]]:
+    '''
+    Goes through all files in the given directories and maps them to a dictionary of cases.
+    Identification and signal headers are kept in the scan index of the results folder, so unchanged files are not reread.
+    '''
+    indexPath = join(config.resultsDir, SCAN_INDEX_FILE)
+    catalog = SignalCatalog.load(indexPath)
+    results = catalog.scan(config.simDataDirs, config.threads)
+    catalog.save(indexPath)
+    return results
+
+
+class SignalCache:
+    '''
+    Thread-safe LRU cache of loaded signals, evicting the least recently used signals above the given size in MB.
+    '''
+    def __init__(self, size: float) -> None:
+        self.size = size * 1024 * 1024
+        self.used = 0
+        self.entries: OrderedDict[Tuple, pd.Series] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: Tuple) -> Optional[pd.Series]:
+        with self.lock:
+            series = self.entries.get(key)
+            if series is not None:
+                self.entries.move_to_end(key)
+            return series
+
+    def put(self, key: Tuple, series: pd.Series) -> None:
+        nbytes = int(series.memory_usage(index=True, deep=False))
+        if nbytes > self.size:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = series
+            self.used += nbytes
+            while self.used > self.size:
+                _, evicted = self.entries.popitem(last=False)
+                self.used -= int(evicted.memory_usage(index=True, deep=False))
+
+
+class ResultView:
+    '''
+    A single result file of a rank.
+    '''
+    def __init__(self, resultSet: ResultSet, result: Result) -> None:
+        self.resultSet = resultSet
+        self.result = result
+
+    def __repr__(self) -> str:
+        return f'ResultView({self.result.typ.name} rank {self.result.rank}: {self.result.fullpath})'
+
+    @property
+    def typ(self) -> ResultType:
+        return self.result.typ
+
+    @property
+    def group(self) -> str:
+        return self.result.group
+
+    @property
+    def signals(self) -> Dict[str, SignalInfo]:
+        return self.result.signals
+
+    @property
+    def timeOffset(self) -> float:
+        return self.resultSet.pfFlatTime if self.typ == ResultType.RMS else self.resultSet.pscadInitTime
+
+    def data(self, columns: Optional[List[int]] = None, t0: Optional[float] = None, t1: Optional[float] = None) -> pd.DataFrame:
+        '''
+        Reads the given catalog columns (None reads all) within the time window as loaded by loadEMT or loadRMS.
+        The time column of the returned data is file time.
+        '''
+        window = None
+        if t0 is not None or t1 is not None:
+            window = (float('-inf') if t0 is None else t0 + self.timeOffset,
+                      float('inf') if t1 is None else t1 + self.timeOffset)
+        if self.typ == ResultType.RMS:
+            return loadRMS(self.result.fullpath, self.resultSet.reducedPrecision, columns, window)
+        return loadEMT(self.result.fullpath, self.resultSet.reducedPrecision, columns, window)
+
+    def signal(self, name: str, t0: Optional[float] = None, t1: Optional[float] = None) -> pd.Series:
+        '''
+        Returns the given signal or derived-signal expression within the time window, indexed by plotted time.
+        '''
+        key = (self.result.fullpath, name, t0, t1)
+        cached = self.resultSet.cache.get(key)
+        if cached is not None:
+            return cached
+
+        rawSigName, sigColumn = signalColumn(self.typ, name)
+        if not signalAvailable(rawSigName, self.signals):
+            raise KeyError(f'Signal "{name}" not found in {self.result.fullpath}.')
+        data = self.data(requiredColumns(self.result, [rawSigName]), t0, t1)
+        timeColName = 'time' if self.typ == ResultType.EMT else data.columns[0]
+        values = DerivedSignals(self.typ, data).get(rawSigName) if isExpression(rawSigName) else data[sigColumn]
+        series = pd.Series(values.to_numpy(), index=pd.Index(data[timeColName].to_numpy() - self.timeOffset, name='time'),  # type: ignore
+                           name=name)
+        self.resultSet.cache.put(key, series)
+        return series
+
+
+class RankView:
+    '''
+    The result files of a rank.
+    '''
+    def __init__(self, resultSet: ResultSet, rank: int, results: List[Result]) -> None:
+        self.resultSet = resultSet
+        self.rank = rank
+        self.results = [ResultView(resultSet, result) for result in results]
+
+    def __repr__(self) -> str:
+        return f'RankView(rank {self.rank}: {", ".join(f"{r.group} {r.typ.name}" for r in self.results)})'
+
+    def __iter__(self) -> Iterator[ResultView]:
+        return iter(self.results)
+
+    def result(self, typ: Optional[ResultType] = None, group: Optional[str] = None) -> ResultView:
+        '''
+        Returns the first result of the rank of the given type and group (None matches any).
+        '''
+        for result in self.results:
+            if (typ is None or result.typ == typ) and (group is None or result.group.lower() == group.lower()):
+                return result
+        raise KeyError(f'No {typ.name if typ else ""} result of group {group} in rank {self.rank}.')
+
+    def signal(self, name: str, t0: Optional[float] = None, t1: Optional[float] = None,
+               typ: Optional[ResultType] = None, group: Optional[str] = None) -> pd.Series:
+        '''
+        Returns the given signal from the first result of the rank containing it, optionally restricted by type and group.
+        '''
+        for result in self.results:
+            if (typ is not None and result.typ != typ) or (group is not None and result.group.lower() != group.lower()):
+                continue
+            if signalAvailable(signalColumn(result.typ, name)[0], result.signals):
+                return result.signal(name, t0, t1)
+        raise KeyError(f'Signal "{name}" not found in rank {self.rank}.')
+
+
+class ResultSet:
+    def __init__(self,
+                 resultDict: Dict[int, List[Result]],
+                 pfFlatTime: float = 0.0,
+                 pscadInitTime: float = 0.0,
+                 reducedPrecision: bool = False,
+                 cacheSize: float = DEFAULT_CACHE_SIZE) -> None:
+        self.resultDict = resultDict
+        self.pfFlatTime = pfFlatTime
+        self.pscadInitTime = pscadInitTime
+        self.reducedPrecision = reducedPrecision
+        self.cache = SignalCache(cacheSize)
+
+    @classmethod
+    def fromConfig(cls, config: ReadConfig, cacheSize: float = DEFAULT_CACHE_SIZE) -> ResultSet:
+        return cls(mapResultFiles(config), config.pfFlatTIme, config.pscadInitTime, config.reducedPrecision, cacheSize)
+
+    def __repr__(self) -> str:
+        return f'ResultSet({len(self.resultDict)} ranks, groups: {", ".join(self.groups)})'
+
+    def __len__(self) -> int:
+        return len(self.resultDict)
+
+    def __contains__(self, rank: int) -> bool:
+        return rank in self.resultDict
+
+    def __iter__(self) -> Iterator[RankView]:
+        return (self[rank] for rank in self.ranks)
+
+    def __getitem__(self, rank: int) -> RankView:
+        if rank not in self.resultDict:
+            raise KeyError(f'Rank {rank} not found.')
+        return RankView(self, rank, self.resultDict[rank])
+
+    @property
+    def ranks(self) -> List[int]:
+        return sorted(self.resultDict.keys())
+
+    @property
+    def groups(self) -> List[str]:
+        return sorted(set(result.group for results in self.resultDict.values() for result in results))
+
+    def view(self, result: Result) -> ResultView:
+        return ResultView(self, result)
+
+    def query(self, pattern: Optional[str] = None, group: Optional[str] = None,
+              ranks: Optional[List[int]] = None) -> List[Tuple[Result, SignalInfo]]:
+        '''
+        Returns the signals matching the case-insensitive name pattern (fnmatch syntax) and signal group.
+        '''
+        return querySignals(self.resultDict, ranks, group, pattern)
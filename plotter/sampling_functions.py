@@ -29,10 +29,10 @@ def downsample_based_on_gradient(time, values, gradient_threshold):
     return downsampled_time, downsampled_values
 
 
-def down_sample(data_x_axis: List[int], data_y_axis: List[int]) -> Tuple[List[int], List[int]]:
-    if len(data_x_axis) < 100:
+def down_sample(data_x_axis: List[int], data_y_axis: List[int], n_out: int = 100) -> Tuple[List[int], List[int]]:
+    if len(data_x_axis) < n_out:
         return data_x_axis, data_y_axis
-    downsample = MinMaxLTTBDownsampler().downsample(data_x_axis, data_y_axis, n_out=100)
+    downsample = MinMaxLTTBDownsampler().downsample(data_x_axis, data_y_axis, n_out=n_out)
     return data_x_axis[downsample], data_y_axis[downsample]
 
 
@@ -0,0 +1,203 @@
+'''
+Local serve mode. Rank pages are rendered when first requested and cached, instead of plotting all ranks up front.
+On zoom and pan the pages fetch the traces of the visible time window, read through the time index of the result files
+and downsampled again with the method of the figure. The server only listens on localhost.
+'''
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import re
+import numpy as np
+from Figure import Figure
+from figure_type import FigureType
+from result_set import ResultSet
+from derived_signals import DerivedSignals, requiredColumns
+from traces import prepareTraces, resultTime
+from plotter_logging import LogLevel, log
+
+WINDOW_MARGIN = 0.05  # Share of the visible window read beyond each side, so traces do not end at the edge
+
+SERVE_SCRIPT = '''<script>
+(function () {
+    const rank = %(rank)d, nColumns = %(nColumns)d, nFigures = %(nFigures)d;
+    const divs = Array.from(document.querySelectorAll('.plotly-graph-div'));
+    const plots = nColumns == 1 ? divs.slice(0, nFigures) : divs.slice(0, 1);
+    const pending = {};
+    plots.forEach(function (gd, k) {
+        gd.on('plotly_relayout', function (event) {
+            const axes = new Set();
+            Object.keys(event).forEach(function (key) {
+                const match = key.match(/^(xaxis[0-9]*)\\.(range|autorange)/);
+                if (match) axes.add(match[1]);
+            });
+            axes.forEach(function (axis) {
+                const axisNumber = axis == 'xaxis' ? 1 : parseInt(axis.slice(5));
+                // Single column pages have one figure per plot, zoom windows below the overview are left as they are
+                if (nColumns == 1 && axisNumber != 1) return;
+                const figure = nColumns == 1 ? k : axisNumber - 1;
+                let query = 'data?rank=' + rank + '&figure=' + figure;
+                const range = event[axis + '.range'] || (axis + '.range[0]' in event ? [event[axis + '.range[0]'], event[axis + '.range[1]']] : null);
+                if (range && !event[axis + '.autorange']) query += '&t0=' + range[0] + '&t1=' + range[1];
+                const id = k + ':' + axis;
+                const request = pending[id] = (pending[id] || 0) + 1;
+                fetch(query).then(function (response) { return response.json(); }).then(function (traces) {
+                    if (pending[id] != request) return;
+                    const ref = axis.replace('axis', '');
+                    const x = [], y = [], indices = [];
+                    gd.data.forEach(function (trace, i) {
+                        if ((trace.xaxis || 'x') == ref && trace.name in traces) {
+                            x.push(traces[trace.name].x);
+                            y.push(traces[trace.name].y);
+                            indices.push(i);
+                        }
+                    });
+                    if (indices.length > 0) Plotly.restyle(gd, {x: x, y: y}, indices);
+                });
+            });
+        });
+    });
+})();
+</script>
+'''
+
+
+def jsonValues(values: np.ndarray) -> List[Optional[float]]:
+    '''
+    Converts values to a JSON serialisable list with non-finite values as null.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    return [value if finite else None for value, finite in zip(values.tolist(), np.isfinite(values).tolist())]
+
+
+class PlotServer:
+    def __init__(self,
+                 resultSet: ResultSet,
+                 figureDict: Dict[int, List[Figure]],
+                 ranks: List[int],
+                 nColumns: int,
+                 renderPage: Callable[[int], Optional[str]],
+                 resultsDir: str) -> None:
+        self.resultSet = resultSet
+        self.figureDict = figureDict
+        self.ranks = ranks
+        self.nColumns = nColumns
+        self.renderPage = renderPage
+        self.resultsDir = resultsDir
+        self.pages: Dict[int, str] = dict()
+        self.locks: Dict[int, Lock] = {rank: Lock() for rank in ranks}
+
+    def index(self) -> str:
+        links = '\n'.join(f'<p><a href="{rank}.html">Rank {rank}</a></p>' for rank in self.ranks)
+        return f'<html><head><link rel="stylesheet" href="mtb.css"></head><body><h1>Ranks</h1>{links}</body></html>'
+
+    def page(self, rank: int) -> Optional[str]:
+        '''
+        Returns the page of the given rank, rendering it on first request.
+        '''
+        if rank not in self.locks:
+            return None
+        with self.locks[rank]:
+            if rank not in self.pages:
+                html = self.renderPage(rank)
+                if html is None:
+                    return None
+                script = SERVE_SCRIPT % {'rank': rank, 'nColumns': self.nColumns, 'nFigures': len(self.figureDict[rank])}
+                self.pages[rank] = html.replace('</body>', f'{script}</body>', 1)
+            return self.pages[rank]
+
+    def windowTraces(self, rank: int, figureIndex: int, t0: Optional[float], t1: Optional[float]) -> Optional[Dict[str, Any]]:
+        '''
+        Returns the traces of the given figure of a rank within the time window, downsampled with the method of the figure,
+        as a dictionary with the trace name as key.
+        '''
+        if rank not in self.locks or not 0 <= figureIndex < len(self.figureDict[rank]):
+            return None
+        figure = self.figureDict[rank][figureIndex]
+        if figure.type != FigureType.TIME:
+            return dict()
+        if t0 is not None and t1 is not None:
+            margin = WINDOW_MARGIN * (t1 - t0)
+            t0, t1 = t0 - margin, t1 + margin
+
+        traces: Dict[str, Any] = dict()
+        for result in self.resultSet.resultDict.get(rank, []):
+            signals = [getattr(figure, f'{result.typ.name.lower()}_signal_{sig}') for sig in range(1, 4)]
+            data = self.resultSet.view(result).data(requiredColumns(result, signals), t0, t1)
+            if len(data) == 0:
+                continue
+            time = resultTime(result.typ, data, self.resultSet.pfFlatTime, self.resultSet.pscadInitTime)
+            for trace in prepareTraces(result.typ, data, time, result.signals, DerivedSignals(result.typ, data), [figure],
+                                       result.shorthand, result.fullpath, logUnknown=False)[0]:
+                if trace.known and trace.x is not None and trace.y is not None:
+                    traces[trace.displayName] = {'x': jsonValues(trace.x), 'y': jsonValues(trace.y)}
+        return traces
+
+
+class ServeHandler(BaseHTTPRequestHandler):
+    server: PlotHTTPServer
+
+    def do_GET(self) -> None:
+        plotServer = self.server.plotServer
+        url = urlparse(self.path)
+        try:
+            if url.path in ('/', '/index.html'):
+                self.respond(200, 'text/html', plotServer.index())
+                return
+            if url.path == '/mtb.css':
+                with open(join(plotServer.resultsDir, 'mtb.css')) as file:
+                    self.respond(200, 'text/css', file.read())
+                return
+            match = re.match(r'^/([0-9]+)\.html$', url.path)
+            if match:
+                page = plotServer.page(int(match.group(1)))
+                if page is not None:
+                    self.respond(200, 'text/html', page)
+                    return
+            elif url.path == '/data':
+                query = parse_qs(url.query)
+                t0 = float(query['t0'][0]) if 't0' in query else None
+                t1 = float(query['t1'][0]) if 't1' in query else None
+                traces = plotServer.windowTraces(int(query['rank'][0]), int(query['figure'][0]), t0, t1)
+                if traces is not None:
+                    self.respond(200, 'application/json', json.dumps(traces))
+                    return
+            self.respond(404, 'text/plain', 'Not found')
+        except (KeyError, ValueError) as e:
+            self.respond(400, 'text/plain', f'Bad request: {e}')
+
+    def respond(self, status: int, contentType: str, content: str) -> None:
+        body = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{contentType}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log(format % args, level=LogLevel.DEBUG)
+
+
+class PlotHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, plotServer: PlotServer) -> None:
+        super().__init__(('127.0.0.1', port), ServeHandler)
+        self.plotServer = plotServer
+
+
+def serve(plotServer: PlotServer, port: int) -> None:
+    '''
+    Serves the rank pages on localhost until interrupted.
+    '''
+    httpServer = PlotHTTPServer(port, plotServer)
+    log(f'Serving {len(plotServer.ranks)} ranks at http://127.0.0.1:{port}/ (Ctrl+C to stop)')
+    try:
+        httpServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpServer.server_close()
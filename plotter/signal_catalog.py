@@ -0,0 +1,173 @@
+'''
+Header-only catalog of the signals in every result file. The catalog is persisted in the scan index of the results folder,
+so unchanged result files are neither reopened to be identified nor to have their headers read.
+'''
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from os import makedirs
+from os.path import dirname, join, exists
+from typing import Dict, List, Optional, Tuple
+import json
+from Result import ResultType, Result
+from read_and_write_functions import idFile, emtDescriptors, rmsColumns
+from archives import fileStat, listDir
+from plotter_logging import LogLevel, log
+
+SCAN_INDEX_FILE = 'scan_index.json'
+SCAN_INDEX_VERSION = 1
+
+
+class SignalInfo:
+    def __init__(self, name: str, group: str, units: str, maxValue: Optional[float], minValue: Optional[float], column: int) -> None:
+        self.name = name
+        self.group = group
+        self.units = units
+        self.maxValue = maxValue
+        self.minValue = minValue
+        self.column = column
+
+
+class CatalogEntry:
+    '''
+    Identification and signals of a scanned file. The entry is valid while size and modification time of the file are unchanged.
+    '''
+    def __init__(self, size: int, mtime: float, typ: Optional[ResultType], rank: Optional[int], projectName: Optional[str],
+                 bulkname: Optional[str], signals: Dict[str, SignalInfo]) -> None:
+        self.size = size
+        self.mtime = mtime
+        self.typ = typ
+        self.rank = rank
+        self.projectName = projectName
+        self.bulkname = bulkname
+        self.signals = signals
+
+    def toJson(self) -> Dict:
+        return {'size': self.size,
+                'mtime': self.mtime,
+                'type': None if self.typ is None else self.typ.name,
+                'rank': self.rank,
+                'projectName': self.projectName,
+                'bulkname': self.bulkname,
+                'signals': [[s.name, s.group, s.units, s.maxValue, s.minValue, s.column] for s in self.signals.values()]}
+
+    @classmethod
+    def fromJson(cls, entry: Dict) -> CatalogEntry:
+        signals = {s[0]: SignalInfo(*s) for s in entry['signals']}
+        typ = None if entry['type'] is None else ResultType[entry['type']]
+        return cls(entry['size'], entry['mtime'], typ, entry['rank'], entry['projectName'], entry['bulkname'], signals)
+
+
+def resultSignals(typ: ResultType, fullpath: str) -> Dict[str, SignalInfo]:
+    '''
+    Reads the signals of a result file from its header. RMS signals are named "<object>\\<variable>" as in the figure setup.
+    '''
+    signals: Dict[str, SignalInfo] = dict()
+    if typ == ResultType.EMT:
+        for pgb, desc, group, maxValue, minValue, units in emtDescriptors(fullpath):
+            signals[desc] = SignalInfo(desc, group, units, maxValue, minValue, pgb)
+    else:
+        for column, (obj, variable) in enumerate(rmsColumns(fullpath)):
+            if column == 0:
+                continue
+            if obj.startswith('##'):
+                obj = obj[2:]
+            units = variable.split(' in ', 1)[1] if ' in ' in variable else ''
+            name = f'{obj}\\{variable}'
+            signals[name] = SignalInfo(name, obj, units, None, None, column)
+    return signals
+
+
+def scanFile(fullpath: str, size: int, mtime: float) -> CatalogEntry:
+    typ, rank, projectName, bulkname, _ = idFile(fullpath)
+    signals = resultSignals(typ, fullpath) if typ is not None else dict()
+    return CatalogEntry(size, mtime, typ, rank, projectName, bulkname, signals)
+
+
+class SignalCatalog:
+    def __init__(self) -> None:
+        self.entries: Dict[str, CatalogEntry] = dict()
+
+    @classmethod
+    def load(cls, indexPath: str) -> SignalCatalog:
+        '''
+        Loads the catalog from the given scan index. A missing or outdated index gives an empty catalog.
+        '''
+        catalog = cls()
+        if not exists(indexPath):
+            return catalog
+        try:
+            with open(indexPath, 'r') as file:
+                index = json.load(file)
+            if index.get('version') == SCAN_INDEX_VERSION:
+                catalog.entries = {path: CatalogEntry.fromJson(entry) for path, entry in index['files'].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            log(f'Scan index {indexPath} could not be read. Rescanning all files.', level=LogLevel.WARNING)
+        return catalog
+
+    def save(self, indexPath: str) -> None:
+        folder = dirname(indexPath)
+        if folder != '' and not exists(folder):
+            makedirs(folder)
+        with open(indexPath, 'w') as file:
+            json.dump({'version': SCAN_INDEX_VERSION,
+                       'files': {path: entry.toJson() for path, entry in self.entries.items()}}, file)
+
+    def scan(self, simDataDirs: List[Tuple[str, str]], threads: int = 1) -> Dict[int, List[Result]]:
+        '''
+        Goes through all files in the given directories and maps them to a dictionary of cases. Only new or changed files are read.
+        '''
+        files: List[Tuple[str, str]] = list()
+        for dir_ in simDataDirs:
+            for file_ in listDir(dir_[1]):
+                files.append((dir_[0], join(dir_[1], file_)))
+
+        entries: Dict[str, CatalogEntry] = dict()
+        changed: List[Tuple[str, int, float]] = list()
+        for _, fullpath in files:
+            size, mtime = fileStat(fullpath)
+            entry = self.entries.get(fullpath)
+            if entry is not None and entry.size == size and entry.mtime == mtime:
+                entries[fullpath] = entry
+            else:
+                changed.append((fullpath, size, mtime))
+
+        with ThreadPoolExecutor(max(threads, 1)) as executor:
+            for (fullpath, _, _), entry in zip(changed, executor.map(lambda c: scanFile(*c), changed)):
+                entries[fullpath] = entry
+        self.entries = entries
+        log(f'Scanned {len(changed)} new or changed files, {len(files) - len(changed)} files taken from the scan index.')
+
+        results: Dict[int, List[Result]] = dict()
+        for group, fullpath in files:
+            entry = entries[fullpath]
+            if entry.typ is None:
+                continue
+            assert entry.rank is not None
+            assert entry.projectName is not None
+            assert entry.bulkname is not None
+
+            newResult = Result(entry.typ, entry.rank, entry.projectName, entry.bulkname, fullpath, group, entry.signals)
+            results.setdefault(entry.rank, []).append(newResult)
+        return results
+
+
+def querySignals(resultDict: Dict[int, List[Result]],
+                 ranks: Optional[List[int]] = None,
+                 group: Optional[str] = None,
+                 pattern: Optional[str] = None) -> List[Tuple[Result, SignalInfo]]:
+    '''
+    Returns the signals of the given ranks (None selects all) matching the signal group and the case-insensitive name pattern (fnmatch syntax).
+    '''
+    matches: List[Tuple[Result, SignalInfo]] = list()
+    for rank in sorted(resultDict.keys()):
+        if ranks is not None and rank not in ranks:
+            continue
+        for result in resultDict[rank]:
+            for signal in result.signals.values():
+                if group is not None and signal.group.lower() != group.lower():
+                    continue
+                if pattern is not None and not fnmatchcase(signal.name.lower(), pattern.lower()):
+                    continue
+                matches.append((result, signal))
+    return matches
@@ -0,0 +1,78 @@
+'''
+Pre-flight validation of the signals referenced by the figure and cursor setup against the header-only signal catalog,
+so misspelled signal names are reported before any result data is loaded.
+'''
+from __future__ import annotations
+from difflib import get_close_matches
+from typing import Dict, List, Set, Tuple
+from Cursor import Cursor
+from Figure import Figure
+from Result import ResultType, Result
+from read_and_write_functions import signalColumn
+from derived_signals import expressionSignals
+from plotter_logging import LogLevel, log
+
+
+class MissingSignal:
+    def __init__(self, typ: ResultType, name: str) -> None:
+        self.typ = typ
+        self.name = name
+        self.files: List[str] = []
+        self.available: Set[str] = set()
+
+    @property
+    def suggestions(self) -> List[str]:
+        if self.typ == ResultType.RMS and '\\' in self.name:
+            # Compare variables of the same object only, the shared object prefix would dominate the similarity
+            obj, variable = self.name.split('\\', 1)
+            variables = sorted(available.split('\\', 1)[1] for available in self.available if available.startswith(f'{obj}\\'))
+            return [f'{obj}\\{match}' for match in get_close_matches(variable, variables, n=3, cutoff=0.6)]
+        return get_close_matches(self.name, sorted(self.available), n=3, cutoff=0.6)
+
+
+def referencedSignals(typ: ResultType, figures: List[Figure], cursors: List[Cursor]) -> Set[str]:
+    '''
+    Returns the signal names of the given result type referenced by the given figures and cursors, including expression operands.
+    '''
+    signalKey = typ.name.lower()
+    rawSigNames: List[str] = []
+    for figure in figures:
+        for sig in range(1, 4):
+            rawSigNames.append(getattr(figure, f'{signalKey}_signal_{sig}'))
+    for cursor in cursors:
+        rawSigNames.extend(getattr(cursor, f'{signalKey}_signals'))
+    return set(signalColumn(typ, name)[0] for name in expressionSignals([n for n in rawSigNames if n != '']))
+
+
+def validateSignals(resultDict: Dict[int, List[Result]],
+                    figureDict: Dict[int, List[Figure]],
+                    cursorDict: List[Cursor],
+                    ranks: List[int]) -> Dict[Tuple[ResultType, str], MissingSignal]:
+    '''
+    Checks that every signal referenced by the figures and cursors of the given ranks exists in the signal catalog of the rank's results.
+    All missing signals are logged at once with close-match suggestions and returned.
+    '''
+    results = [result for rank in ranks for result in resultDict.get(rank, [])]
+
+    missing: Dict[Tuple[ResultType, str], MissingSignal] = dict()
+    for result in results:
+        signals = result.signals
+        cursors = [cursor for cursor in cursorDict if cursor.id == result.rank]
+        for name in referencedSignals(result.typ, figureDict[result.rank], cursors):
+            if name in signals:
+                continue
+            missingSignal = missing.setdefault((result.typ, name), MissingSignal(result.typ, name))
+            missingSignal.files.append(result.fullpath)
+            missingSignal.available.update(signals)
+
+    if len(missing) == 0:
+        log(f'Pre-flight: all referenced signals found in {len(results)} result files.')
+        return missing
+
+    log(f'Pre-flight: {len(missing)} referenced signals not found:', level=LogLevel.WARNING)
+    for missingSignal in sorted(missing.values(), key=lambda m: (m.typ.name, m.name)):
+        suggestions = missingSignal.suggestions
+        hint = f' Did you mean: {", ".join(suggestions)}?' if suggestions else ''
+        log(f'\t{missingSignal.typ.name} signal "{missingSignal.name}" missing in {len(missingSignal.files)} result files, '
+            f'e.g. {missingSignal.files[0]}.{hint}', level=LogLevel.WARNING)
+    return missing
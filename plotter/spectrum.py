@@ -0,0 +1,169 @@
+'''
+Spectrum and harmonics figures of EMT results. The windows of a figure are cut to whole cycles of the fundamental so the
+harmonics fall on FFT bins, Hann weighted, and transformed with one batched FFT per window length over all signals and
+windows of a result. Spectra are cached per result file, so serving or replotting a rank does not transform it again.
+'''
+from __future__ import annotations
+from collections import OrderedDict
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from figure_type import FigureType
+from Figure import Figure
+from Result import ResultType
+from read_and_write_functions import signalColumn
+from derived_signals import DerivedSignals, isExpression, signalAvailable
+from traces import Trace
+from archives import fileStat
+from plotter_logging import LogLevel, log
+if TYPE_CHECKING:
+    from signal_catalog import SignalInfo
+
+SPECTRUM_CACHE_FILES = 64  # Result files kept in the spectrum cache
+WINDOW_DASHES = ['solid', 'dash', 'dot', 'dashdot']
+
+
+class SpectrumCache:
+    '''
+    Thread-safe LRU cache of the spectra of the most recently used result files. Entries of a file are dropped
+    when the file is modified.
+    '''
+    def __init__(self, files: int) -> None:
+        self.files = files
+        self.entries: OrderedDict[str, Tuple[float, Dict[Tuple, Tuple[np.ndarray, np.ndarray, int]]]] = OrderedDict()
+        self.lock = Lock()
+
+    def spectra(self, file: str) -> Dict[Tuple, Tuple[np.ndarray, np.ndarray, int]]:
+        try:
+            _, mtime = fileStat(file)
+        except OSError:
+            mtime = 0.0
+        with self.lock:
+            entry = self.entries.get(file)
+            if entry is None or entry[0] != mtime:
+                entry = self.entries[file] = (mtime, dict())
+            self.entries.move_to_end(file)
+            while len(self.entries) > self.files:
+                self.entries.popitem(last=False)
+            return entry[1]
+
+
+spectrumCache = SpectrumCache(SPECTRUM_CACHE_FILES)
+
+
+def figureWindows(figure: Figure, time: np.ndarray) -> List[Tuple[float, float]]:
+    '''
+    Returns the windows of the figure, or the whole result after initialisation if none are given.
+    '''
+    if len(figure.windows) > 0:
+        return figure.windows
+    return [(max(0.0, float(time[0])), float(time[-1]))]
+
+
+def batchSpectra(time: np.ndarray,
+                 requests: List[Tuple[np.ndarray, float, float]],
+                 fundamental: float) -> List[Optional[Tuple[np.ndarray, np.ndarray, int]]]:
+    '''
+    Computes the single-sided amplitude spectra of the given values within the windows (values, start, end).
+    Windows are cut to whole cycles of the fundamental and windows of equal length are transformed together.
+    Returns the frequencies, amplitudes and number of cycles of each window, or None for windows shorter than a cycle.
+    '''
+    dt = float(np.median(np.diff(time)))
+    spectra: List[Optional[Tuple[np.ndarray, np.ndarray, int]]] = [None] * len(requests)
+    groups: Dict[int, List[Tuple[int, int, int]]] = dict()
+    for i, (_, start, end) in enumerate(requests):
+        i0 = int(np.searchsorted(time, start, side='left'))
+        if i0 >= len(time):
+            continue
+        cycles = int(np.floor((min(end, float(time[-1])) - float(time[i0])) * fundamental + 1e-6))
+        n = int(round(cycles / fundamental / dt))
+        if cycles < 1 or i0 + n > len(time):
+            continue
+        groups.setdefault(n, []).append((i, i0, cycles))
+
+    for n, members in groups.items():
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)  # Periodic Hann
+        batch = np.stack([requests[i][0][i0:i0 + n] for i, i0, _ in members])
+        amplitudes = np.abs(np.fft.rfft(np.nan_to_num(batch) * window, axis=1)) * (2.0 / window.sum())
+        amplitudes[:, 0] /= 2.0
+        frequencies = np.fft.rfftfreq(n, dt)
+        for (i, _, cycles), amplitude in zip(members, amplitudes):
+            spectra[i] = (frequencies, amplitude, cycles)
+    return spectra
+
+
+def spectrumTraces(data: pd.DataFrame,
+                   time: np.ndarray,
+                   signals: Dict[str, SignalInfo],
+                   derived: DerivedSignals,
+                   figures: List[Figure],
+                   resultName: str,
+                   file: str,
+                   fundamental: float,
+                   maxHarmonic: int,
+                   logUnknown: bool = True) -> Dict[int, List[Trace]]:
+    '''
+    Prepares the traces of the spectrum and harmonics figures of an EMT result, with the figure id as key.
+    Spectra are shown up to maxHarmonic times the fundamental, harmonics as amplitude per harmonic order.
+    '''
+    cached = spectrumCache.spectra(file)
+    pending: Dict[Tuple, Tuple[np.ndarray, float, float]] = dict()
+    figureSignals: Dict[int, List[Tuple[str, str, bool]]] = dict()
+    for figure in figures:
+        if figure.type == FigureType.TIME:
+            continue
+        figureSignals[figure.id] = list()
+        for sig in range(1, 4):
+            rawSigName, sigColumn = signalColumn(ResultType.EMT, getattr(figure, f'emt_signal_{sig}'))
+            if sigColumn == '':
+                continue
+            known = signalAvailable(rawSigName, signals)
+            figureSignals[figure.id].append((rawSigName, sigColumn, known))
+            if not known:
+                continue
+            for start, end in figureWindows(figure, time):
+                key = (rawSigName, start, end, fundamental)
+                if key not in cached and key not in pending:
+                    values = derived.get(rawSigName) if isExpression(rawSigName) else data[sigColumn]  # type: ignore
+                    pending[key] = (pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64), start, end)  # type: ignore
+
+    if len(pending) > 0:
+        for key, spectrum in zip(pending.keys(), batchSpectra(time, list(pending.values()), fundamental)):
+            if spectrum is None:
+                log(f'Window {key[1]:g}-{key[2]:g} s of "{key[0]}" is shorter than a cycle in resultfile: {file}',
+                    level=LogLevel.WARNING)
+            else:
+                cached[key] = spectrum
+
+    figureTraces: Dict[int, List[Trace]] = dict()
+    for figure in figures:
+        if figure.type == FigureType.TIME:
+            continue
+        traces: List[Trace] = list()
+        for index, (rawSigName, sigColumn, known) in enumerate(figureSignals[figure.id]):
+            displayName = f'{resultName}:{rawSigName}' if isExpression(rawSigName) else f'{resultName}:{rawSigName.split(" ")[0]}'
+            if not known:
+                if logUnknown:
+                    log(f'Signal "{rawSigName}" not recognized in resultfile: {file}', level=LogLevel.WARNING)
+                traces.append(Trace(f'{displayName} (Unknown)', resultName, index))
+                continue
+            for w, (start, end) in enumerate(figureWindows(figure, time)):
+                spectrum = cached.get((rawSigName, start, end, fundamental))
+                if spectrum is None:
+                    continue
+                frequencies, amplitudes, cycles = spectrum
+                trace = Trace(f'{displayName} {start:g}-{end:g} s', resultName, index)
+                trace.known = True
+                trace.dash = WINDOW_DASHES[w % len(WINDOW_DASHES)]
+                if figure.type == FigureType.HARMONICS:
+                    orders = np.arange(maxHarmonic + 1)
+                    bins = orders * cycles
+                    inRange = bins < len(amplitudes)
+                    trace.x, trace.y = orders[inRange], amplitudes[bins[inRange]]
+                else:
+                    inRange = frequencies <= maxHarmonic * fundamental
+                    trace.x, trace.y = frequencies[inRange], amplitudes[inRange]
+                traces.append(trace)
+        figureTraces[figure.id] = traces
+    return figureTraces
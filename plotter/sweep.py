@@ -0,0 +1,319 @@
+'''
+Sweep overlay of one signal across many ranks, e.g. a current over the ranks of an SCR/XR sweep. Only the requested signal
+is read from each rank, in parallel. The signals are interpolated onto a shared time grid, stacked into one array and
+downsampled as a batch, and drawn in one figure coloured by rank.
+For large sweeps the envelope view instead streams the ranks through fixed-size accumulators and draws the range and
+percentile bands of the signal, flagging the ranks outside the bands.
+'''
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from typing import Dict, Iterator, List, Optional, Tuple
+import csv
+import re
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go  # type: ignore
+from plotly.colors import sample_colorscale  # type: ignore
+from result_set import ResultSet
+from recordings import uniqueTime
+from plotter_logging import LogLevel, log
+
+SWEEP_GRID_POINTS = 200000  # Maximum resolution of the shared time grid
+SWEEP_POINTS = 4000  # Points per rank after downsampling
+SWEEP_COLORSCALE = 'Viridis'
+
+
+def loadSweep(resultSet: ResultSet,
+              ranks: List[int],
+              signal: str,
+              group: Optional[str],
+              threads: int) -> Dict[int, pd.Series]:
+    '''
+    Loads the given signal of each rank in parallel. Ranks without the signal are left out.
+    '''
+    def load(rank: int) -> Optional[pd.Series]:
+        try:
+            return resultSet[rank].signal(signal, group=group)
+        except KeyError:
+            log(f'Signal "{signal}" not found in rank {rank}.', level=LogLevel.WARNING)
+            return None
+
+    with ThreadPoolExecutor(max(threads, 1)) as executor:
+        return {rank: series for rank, series in zip(ranks, executor.map(load, ranks)) if series is not None}
+
+
+def stackSweep(signals: Dict[int, pd.Series]) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Interpolates the signals onto a shared time grid spanning all of them, at the finest time step of the signals
+    limited to SWEEP_GRID_POINTS. Returns the grid and the stack (ranks x grid), NaN outside the time span of each signal.
+    '''
+    series = [uniqueTime(s.index.to_numpy(dtype=np.float64), s.to_numpy(dtype=np.float64)) for s in signals.values()]
+    spans = [time for time, _ in series if len(time) > 1]
+    if len(spans) == 0:
+        return np.empty(0), np.empty((len(series), 0), dtype=np.float32)
+    start = min(float(time[0]) for time in spans)
+    end = max(float(time[-1]) for time in spans)
+    dt = min(float(np.median(np.diff(time))) for time in spans)
+    grid = np.linspace(start, end, min(int(ceil((end - start) / dt)) + 1, SWEEP_GRID_POINTS))
+
+    stack = np.full((len(series), len(grid)), np.nan, dtype=np.float32)
+    for i, (time, values) in enumerate(series):
+        if len(time) > 1:
+            stack[i] = np.interp(grid, time, values, left=np.nan, right=np.nan)
+    return grid, stack
+
+
+def downsampleStack(grid: np.ndarray, stack: np.ndarray, nOut: int = SWEEP_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Min-max downsampling of all rows of the stack at once. The grid is split into nOut / 2 bins, and each bin gives
+    the minimum and maximum of every row, in their order of occurrence, at the first and last time of the bin.
+    '''
+    nRows, n = stack.shape
+    nBins = nOut // 2
+    if n <= nOut or nBins == 0:
+        return grid, stack
+    binSize = int(ceil(n / nBins))
+    nBins = int(ceil(n / binSize))
+    padded = np.full((nRows, nBins * binSize), np.nan, dtype=stack.dtype)
+    padded[:, :n] = stack
+    bins = padded.reshape(nRows, nBins, binSize)
+
+    # Missing values never win the minimum or maximum, bins without values stay missing
+    iMin = np.argmin(np.where(np.isnan(bins), np.inf, bins), axis=2)
+    iMax = np.argmax(np.where(np.isnan(bins), -np.inf, bins), axis=2)
+    mins = np.take_along_axis(bins, iMin[..., None], axis=2)[..., 0]
+    maxs = np.take_along_axis(bins, iMax[..., None], axis=2)[..., 0]
+    first = np.where(iMin <= iMax, mins, maxs)
+    second = np.where(iMin <= iMax, maxs, mins)
+
+    binStart = np.arange(nBins) * binSize
+    binEnd = np.minimum(binStart + binSize, n) - 1
+    x = np.stack((grid[binStart], grid[binEnd]), axis=1).reshape(-1)
+    y = np.stack((first, second), axis=2).reshape(nRows, -1)
+    return x, y
+
+
+def sweepFigure(signal: str,
+                ranks: List[int],
+                grid: np.ndarray,
+                stack: np.ndarray,
+                caseDict: Optional[Dict[int, str]],
+                webglThreshold: int = 0) -> go.Figure:
+    '''
+    Draws the downsampled stack as one figure with a trace per rank, coloured along the rank order.
+    '''
+    figure = go.Figure()
+    colors = sample_colorscale(SWEEP_COLORSCALE, [i / max(len(ranks) - 1, 1) for i in range(len(ranks))])
+    scatter = go.Scattergl if webglThreshold > 0 and len(grid) * len(ranks) > webglThreshold else go.Scatter
+    for rank, values, color in zip(ranks, stack, colors):
+        name = f'{rank}: {caseDict[rank]}' if caseDict is not None and rank in caseDict else f'Rank {rank}'
+        figure.add_trace(scatter(x=grid, y=values, name=name, line_color=color, legendgroup=str(rank)))  # type: ignore
+    figure.update_layout(title=f'{signal} in ranks {ranks[0]} to {ranks[-1]}' if len(ranks) > 0 else signal,
+                         xaxis_title='Time[s]', height=800, legend_title_text='Rank')
+    return figure
+
+
+def sweepFileName(signal: str, prefix: str = 'sweep') -> str:
+    return f'{prefix}_' + re.sub(r'[^A-Za-z0-9_.-]+', '_', signal).strip('_')
+
+
+def sweepOverlay(resultSet: ResultSet,
+                 ranks: List[int],
+                 signal: str,
+                 group: Optional[str],
+                 caseDict: Optional[Dict[int, str]],
+                 threads: int,
+                 webglThreshold: int = 0) -> Optional[go.Figure]:
+    '''
+    Builds the sweep overlay of the given signal over the given ranks. Returns None if no rank has the signal.
+    '''
+    signals = loadSweep(resultSet, ranks, signal, group, threads)
+    if len(signals) == 0:
+        return None
+    grid, stack = stackSweep(signals)
+    x, y = downsampleStack(grid, stack)
+    log(f'Sweep of "{signal}" over {len(signals)} ranks: {stack.shape[1]} grid points downsampled to {len(x)}.')
+    return sweepFigure(signal, list(signals.keys()), x, y, caseDict, webglThreshold)
+
+
+ENVELOPE_GRID_POINTS = 20000  # Resolution of the envelope time grid
+ENVELOPE_FLAGGED_TRACES = 10  # Flagged ranks drawn on top of the envelope, the furthest outside first
+ENVELOPE_FILL = 'rgba(31, 119, 180, {})'
+
+
+class Envelope:
+    '''
+    Fixed-size accumulators of a signal across ranks on a common time grid: minimum, maximum and count per grid point,
+    and a histogram per grid point between the minimum and maximum for the percentiles.
+    The memory used is independent of the number of ranks.
+    '''
+    def __init__(self, grid: np.ndarray, bins: int) -> None:
+        self.grid = grid
+        self.bins = bins
+        self.min = np.full(len(grid), np.nan)
+        self.max = np.full(len(grid), np.nan)
+        self.count = np.zeros(len(grid), dtype=np.int64)
+        self.histogram = np.zeros((len(grid), bins), dtype=np.uint32)
+
+    def addRange(self, values: np.ndarray) -> None:
+        self.min = np.fmin(self.min, values)
+        self.max = np.fmax(self.max, values)
+        self.count += np.isfinite(values)
+
+    def binIndex(self, index: np.ndarray, values: np.ndarray) -> np.ndarray:
+        '''
+        Returns the histogram bins of the values at the given grid points.
+        '''
+        low, high = self.min[index], self.max[index]
+        width = np.where(high > low, high - low, 1.0)
+        return np.clip(((values - low) / width * self.bins).astype(np.int64), 0, self.bins - 1)
+
+    def addHistogram(self, values: np.ndarray) -> None:
+        finite = np.flatnonzero(np.isfinite(values))
+        self.histogram[finite, self.binIndex(finite, values[finite])] += 1  # One value per grid point, so no repeated indices
+
+    def percentile(self, p: float) -> np.ndarray:
+        '''
+        Returns the p'th percentile per grid point, interpolated linearly within the histogram bin holding it.
+        '''
+        cumulative = np.cumsum(self.histogram, axis=1)
+        target = p / 100.0 * self.count
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), self.bins - 1)
+        rows = np.arange(len(self.grid))
+        before = np.where(index > 0, cumulative[rows, np.maximum(index - 1, 0)], 0)
+        inBin = np.maximum(self.histogram[rows, index], 1)
+        width = (self.max - self.min) / self.bins
+        values = self.min + (index + np.clip((target - before) / inBin, 0.0, 1.0)) * width
+        return np.where(self.count > 0, values, np.nan)
+
+
+class EnvelopeFlag:
+    def __init__(self, rank: int, outsideShare: float, maxExcursion: float) -> None:
+        self.rank = rank
+        self.outsideShare = outsideShare  # Share of the time outside the outer percentile band
+        self.maxExcursion = maxExcursion  # Largest distance outside the band
+
+
+def streamSweep(resultSet: ResultSet,
+                ranks: List[int],
+                signal: str,
+                group: Optional[str],
+                threads: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    '''
+    Yields the time and values of the signal of each rank. Ranks are loaded by up to threads workers, each holding
+    one rank at a time, so at most threads ranks are in memory. Ranks without the signal are left out.
+    '''
+    def load(rank: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        try:
+            series = resultSet[rank].signal(signal, group=group)
+        except KeyError:
+            return None
+        time, values = uniqueTime(series.index.to_numpy(dtype=np.float64), series.to_numpy(dtype=np.float64))
+        return (time, values) if len(time) > 1 else None
+
+    threads = max(threads, 1)
+    with ThreadPoolExecutor(threads) as executor:
+        for i in range(0, len(ranks), threads):
+            chunk = ranks[i:i + threads]
+            for rank, loaded in zip(chunk, executor.map(load, chunk)):
+                if loaded is not None:
+                    yield rank, loaded[0], loaded[1]
+
+
+def envelopeGrid(time: np.ndarray) -> np.ndarray:
+    '''
+    Returns the time grid of the envelope, spanning the given time at its time step, limited to ENVELOPE_GRID_POINTS.
+    '''
+    dt = float(np.median(np.diff(time)))
+    return np.linspace(time[0], time[-1], min(int(ceil((time[-1] - time[0]) / dt)) + 1, ENVELOPE_GRID_POINTS))
+
+
+def sweepEnvelope(resultSet: ResultSet,
+                  ranks: List[int],
+                  signal: str,
+                  group: Optional[str],
+                  percentiles: List[float],
+                  bins: int,
+                  outlierShare: float,
+                  threads: int) -> Optional[Tuple[Envelope, List[EnvelopeFlag], Dict[int, np.ndarray]]]:
+    '''
+    Computes the envelope of the signal across the ranks in three streaming passes over the ranks, interpolated onto
+    the grid of the first rank containing the signal (NaN outside the time span of each rank): the range per grid point,
+    the histogram within the range, and the share of time each rank spends outside the outer percentile band.
+    Ranks outside the band for more than outlierShare of the time are flagged. Returns the envelope, the flags and
+    the grid values of the ENVELOPE_FLAGGED_TRACES flagged ranks furthest outside, or None if no rank has the signal.
+    '''
+    envelope: Optional[Envelope] = None
+    loaded: List[int] = list()
+    for rank, time, values in streamSweep(resultSet, ranks, signal, group, threads):
+        if envelope is None:
+            envelope = Envelope(envelopeGrid(time), bins)
+        envelope.addRange(np.interp(envelope.grid, time, values, left=np.nan, right=np.nan))
+        loaded.append(rank)
+    if envelope is None:
+        return None
+    grid = envelope.grid
+
+    for _, time, values in streamSweep(resultSet, loaded, signal, group, threads):
+        envelope.addHistogram(np.interp(grid, time, values, left=np.nan, right=np.nan))
+
+    lower, upper = envelope.percentile(min(percentiles)), envelope.percentile(100.0 - min(percentiles))
+    flags: List[EnvelopeFlag] = list()
+    flagged: Dict[int, np.ndarray] = dict()
+    shares: Dict[int, float] = dict()
+    for rank, time, values in streamSweep(resultSet, loaded, signal, group, threads):
+        values = np.interp(grid, time, values, left=np.nan, right=np.nan)
+        finite = np.isfinite(values) & np.isfinite(lower)
+        if not finite.any():
+            continue
+        excursion = np.maximum(lower - values, values - upper)[finite]
+        share = float(np.count_nonzero(excursion > 0.0)) / len(excursion)
+        if share > outlierShare:
+            flags.append(EnvelopeFlag(rank, share, float(excursion.max())))
+            shares[rank] = share
+            flagged[rank] = values.astype(np.float32)
+            if len(flagged) > ENVELOPE_FLAGGED_TRACES:
+                del flagged[min(flagged.keys(), key=lambda flaggedRank: shares[flaggedRank])]
+    flags.sort(key=lambda flag: flag.outsideShare, reverse=True)
+    log(f'Envelope of "{signal}" over {int(envelope.count.max())} ranks: {len(flags)} ranks outside the '
+        f'{min(percentiles):g}-{100.0 - min(percentiles):g} percentile band.')
+    return envelope, flags, flagged
+
+
+def envelopeFigure(signal: str,
+                   envelope: Envelope,
+                   percentiles: List[float],
+                   flags: List[EnvelopeFlag],
+                   flagged: Dict[int, np.ndarray],
+                   caseDict: Optional[Dict[int, str]]) -> go.Figure:
+    '''
+    Draws the minimum to maximum range and the percentile bands as nested filled areas with the median on top,
+    and the flagged ranks as lines.
+    '''
+    figure = go.Figure()
+    bands = [(envelope.min, envelope.max, 'min-max')]
+    bands += [(envelope.percentile(p), envelope.percentile(100.0 - p), f'{p:g}-{100.0 - p:g}%') for p in sorted(percentiles)]
+    for i, (lower, upper, name) in enumerate(bands):
+        fill = ENVELOPE_FILL.format(0.15 + 0.5 * i / len(bands))
+        figure.add_trace(go.Scatter(x=envelope.grid, y=upper, line_width=0, showlegend=False, legendgroup=name,
+                                    hoverinfo='skip'))
+        figure.add_trace(go.Scatter(x=envelope.grid, y=lower, line_width=0, fill='tonexty', fillcolor=fill, name=name,
+                                    legendgroup=name))
+    figure.add_trace(go.Scatter(x=envelope.grid, y=envelope.percentile(50.0), name='median', line_color=ENVELOPE_FILL.format(1)))
+
+    colors = sample_colorscale('Reds', [0.5 + 0.5 * i / max(len(flagged) - 1, 1) for i in range(len(flagged))])
+    for flag, color in zip((flag for flag in flags if flag.rank in flagged), colors):
+        name = f'{flag.rank}: {caseDict[flag.rank]}' if caseDict is not None and flag.rank in caseDict else f'Rank {flag.rank}'
+        figure.add_trace(go.Scatter(x=envelope.grid, y=flagged[flag.rank], name=f'{name} ({100 * flag.outsideShare:.0f}% outside)',
+                                    line=dict(color=color, width=1)))
+    figure.update_layout(title=f'{signal} envelope over {int(envelope.count.max())} ranks', xaxis_title='Time[s]', height=800)
+    return figure
+
+
+def writeEnvelopeFlags(flags: List[EnvelopeFlag], path: str) -> None:
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(['rank', 'outside_share', 'max_excursion'])
+        for flag in flags:
+            writer.writerow([flag.rank, f'{flag.outsideShare:.4f}', f'{flag.maxExcursion:.6g}'])
@@ -0,0 +1,180 @@
+'''
+Study-wide overview page with a thumbnail of selected figures for every rank, each linking to the page of the rank.
+Thumbnails are drawn from the prepared traces of the rank straight into a NumPy pixel array, one pixel column at a time
+from the minimum and maximum of the samples falling in it, and written as PNG with the standard library. This keeps them
+cheap next to the Plotly pages and images, and they are drawn by the workers preparing the ranks.
+'''
+from __future__ import annotations
+from html import escape
+from os import listdir
+from os.path import join
+from typing import Collection, Dict, List, Optional, Set, Tuple
+import re
+import struct
+import zlib
+import numpy as np
+from Figure import Figure
+from figure_type import FigureType
+from traces import Trace
+
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_HEIGHT = 100
+THUMBNAIL_BACKGROUND = (255, 255, 255)
+OVERVIEW_FILE = 'overview.html'
+THUMBNAIL_PATTERN = r'^thumb_([0-9]+)_([0-9]+)\.png$'
+
+
+def thumbnailFile(rank: int, figureId: int) -> str:
+    return f'thumb_{rank}_{figureId}.png'
+
+
+def hexColor(color: str) -> Tuple[int, int, int]:
+    color = color.lstrip('#')
+    return int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+
+
+def encodePNG(pixels: np.ndarray) -> bytes:
+    '''
+    Encodes an RGB pixel array (height x width x 3, uint8) as PNG.
+    '''
+    height, width, _ = pixels.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    # Every scanline starts with filter type 0
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)), axis=1)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+def drawTrace(pixels: np.ndarray,
+              x: np.ndarray,
+              y: np.ndarray,
+              xRange: Tuple[float, float],
+              yRange: Tuple[float, float],
+              color: Tuple[int, int, int]) -> None:
+    '''
+    Draws a trace into the pixel array. Every pixel column is filled between the minimum and maximum of its samples,
+    extended to the last sample of the previous column so the line stays connected.
+    '''
+    height, width, _ = pixels.shape
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    if len(x) == 0:
+        return
+    columns = np.clip(((x - xRange[0]) / (xRange[1] - xRange[0]) * (width - 1)).round().astype(np.int64), 0, width - 1)
+    rows = np.clip(((yRange[1] - y) / (yRange[1] - yRange[0]) * (height - 1)).round().astype(np.int64), 0, height - 1)
+
+    # Samples are in time order, so each column holds a contiguous run of samples
+    starts = np.flatnonzero(np.concatenate(([True], columns[1:] != columns[:-1])))
+    used = columns[starts]
+    low = np.minimum.reduceat(rows, starts)
+    high = np.maximum.reduceat(rows, starts)
+    previous = rows[starts[1:] - 1]
+    low[1:] = np.minimum(low[1:], previous)
+    high[1:] = np.maximum(high[1:], previous)
+
+    mask = (np.arange(height)[:, None] >= low[None, :]) & (np.arange(height)[:, None] <= high[None, :])
+    columnPixels = pixels[:, used]
+    columnPixels[mask] = color
+    pixels[:, used] = columnPixels
+
+
+def traceValues(trace: Trace) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    if not trace.known:
+        return None
+    if trace.x is not None and trace.y is not None:
+        return trace.x, trace.y
+    if trace.overviewX is not None and trace.overviewY is not None:
+        return trace.overviewX, trace.overviewY
+    return None
+
+
+def rankThumbnails(figures: List[Figure],
+                   figureTraces: List[List[List[Trace]]],
+                   colors: Dict[str, List[str]],
+                   thumbnailFigures: List[int]) -> Dict[int, bytes]:
+    '''
+    Draws the thumbnails of the selected time figures of a rank from its prepared traces (per result, per figure).
+    Returns the PNG of each figure with the figure id as key.
+    '''
+    thumbnails: Dict[int, bytes] = dict()
+    for fi, figure in enumerate(figures):
+        if figure.id not in thumbnailFigures or figure.type != FigureType.TIME:
+            continue
+        traces = [(trace, values) for resultTraces in figureTraces for trace in resultTraces[fi]
+                  for values in [traceValues(trace)] if values is not None and len(values[0]) > 0]
+        if len(traces) == 0:
+            continue
+        xs = np.concatenate([x for _, (x, _) in traces])
+        ys = np.concatenate([y for _, (_, y) in traces])
+        xs, ys = xs[np.isfinite(xs)], ys[np.isfinite(ys)]
+        if len(xs) == 0 or len(ys) == 0:
+            continue
+        xRange = (float(xs.min()), float(xs.max()))
+        yRange = (float(ys.min()), float(ys.max()))
+        if xRange[1] <= xRange[0]:
+            continue
+        if yRange[1] <= yRange[0]:
+            yRange = (yRange[0] - 1.0, yRange[1] + 1.0)
+
+        pixels = np.empty((THUMBNAIL_HEIGHT, THUMBNAIL_WIDTH, 3), dtype=np.uint8)
+        pixels[:, :] = THUMBNAIL_BACKGROUND
+        for trace, (x, y) in traces:
+            drawTrace(pixels, np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), xRange, yRange,
+                      hexColor(colors[trace.resultName][trace.index]))
+        thumbnails[figure.id] = encodePNG(pixels)
+    return thumbnails
+
+
+def writeOverview(resultsDir: str,
+                  caseDict: Optional[Dict[int, str]],
+                  figureTitles: Dict[int, str],
+                  ranks: Optional[Collection[int]] = None,
+                  figureIds: Optional[Collection[int]] = None) -> int:
+    '''
+    Writes the overview page from the thumbnails in the results folder, limited to the given ranks and figures if given,
+    so thumbnails left from earlier runs with other selections are not shown. Returns the number of ranks on the page.
+    '''
+    rankSet = set(ranks) if ranks is not None else None
+    figureSet = set(figureIds) if figureIds is not None else None
+    thumbnails: Dict[int, Set[int]] = dict()
+    for file in listdir(resultsDir):
+        match = re.match(THUMBNAIL_PATTERN, file)
+        if match is None:
+            continue
+        rank, figureId = int(match.group(1)), int(match.group(2))
+        if (rankSet is None or rank in rankSet) and (figureSet is None or figureId in figureSet):
+            thumbnails.setdefault(rank, set()).add(figureId)
+
+    cards: List[str] = list()
+    for rank in sorted(thumbnails.keys()):
+        name = f'{rank}: {caseDict[rank]}' if caseDict is not None and rank in caseDict else f'Rank {rank}'
+        images = ''.join(f'<img src="{thumbnailFile(rank, figureId)}" width="{THUMBNAIL_WIDTH}" height="{THUMBNAIL_HEIGHT}" '
+                         f'title="{escape(figureTitles.get(figureId, str(figureId)))}" loading="lazy">'
+                         for figureId in sorted(thumbnails[rank]))
+        cards.append(f'<a class="thumbnail" href="{rank}.html"><div>{escape(name)}</div>{images}</a>')
+
+    titles = ', '.join(escape(figureTitles.get(figureId, str(figureId)))
+                       for figureId in sorted(set().union(*thumbnails.values())))
+    with open(join(resultsDir, OVERVIEW_FILE), 'w') as file:
+        file.write(f'''<html>
+  <head>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <link rel="stylesheet" href="mtb.css">
+    <style>
+      .thumbnails {{ display: flex; flex-wrap: wrap; gap: 8px; }}
+      .thumbnail {{ display: flex; flex-direction: column; gap: 2px; padding: 4px; border: 1px solid #ddd; color: black; text-decoration: none; font-size: 12px; }}
+      .thumbnail:hover {{ border-color: #028B76; }}
+    </style>
+  </head>
+  <body>
+    <h2>Overview of {len(cards)} ranks</h2>
+    <p>{titles}</p>
+    <div class="thumbnails">
+      {''.join(cards)}
+    </div>
+  </body>
+</html>''')
+    return len(cards)
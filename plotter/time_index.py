@@ -0,0 +1,99 @@
+'''
+Sparse time index of csv result files. The byte offset and time of every TIME_INDEX_STRIDE-th data row are recorded,
+so a time window is located by binary search and only the rows of that window are read and parsed.
+'''
+from __future__ import annotations
+from io import BytesIO
+from threading import Lock
+from typing import Dict, List, Tuple
+import numpy as np
+from archives import fileStat, openFile
+
+TIME_INDEX_STRIDE = 512
+CHUNK_SIZE = 1 << 24
+
+
+class TimeIndex:
+    def __init__(self, offsets: np.ndarray, times: np.ndarray, end: int) -> None:
+        self.offsets = offsets
+        self.times = times
+        self.end = end
+
+    def byteRange(self, t0: float, t1: float) -> Tuple[int, int]:
+        '''
+        Returns the byte range of whole rows covering the time window t0 to t1.
+        '''
+        if len(self.offsets) == 0:
+            return self.end, self.end
+        first = max(int(np.searchsorted(self.times, t0, side='right')) - 1, 0)
+        # At least one block is returned, so an empty window still parses to the columns of the file
+        last = max(int(np.searchsorted(self.times, t1, side='right')), first + 1)
+        return int(self.offsets[first]), int(self.offsets[last]) if last < len(self.offsets) else self.end
+
+
+def buildTimeIndex(csvFile: str, headerLines: int, sep: str, decimal: str) -> TimeIndex:
+    '''
+    Scans the row starts of the given csv file without parsing it and reads the time of every TIME_INDEX_STRIDE-th row.
+    '''
+    size, _ = fileStat(csvFile)
+    starts: List[np.ndarray] = list()
+    with openFile(csvFile, 'rb', mirror=True) as file:
+        for _ in range(headerLines):
+            file.readline()
+        base = file.tell()
+        starts.append(np.array([base], dtype=np.int64))
+        rows = 1
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            # Every newline starts the next row, keep the starts of every TIME_INDEX_STRIDE-th row
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10) + base + 1
+            keep = (np.arange(rows, rows + len(newlines)) % TIME_INDEX_STRIDE) == 0
+            starts.append(newlines[keep])
+            rows += len(newlines)
+            base += len(chunk)
+
+        offsets: List[int] = list()
+        times: List[float] = list()
+        for offset in np.concatenate(starts).tolist():
+            if offset >= size:
+                continue
+            file.seek(offset)
+            field = file.readline().split(sep.encode(), 1)[0].strip()
+            try:
+                times.append(float(field.replace(decimal.encode(), b'.')))
+            except ValueError:
+                continue
+            offsets.append(offset)
+    return TimeIndex(np.array(offsets, dtype=np.int64), np.array(times, dtype=np.float64), size)
+
+
+_indexes: Dict[str, Tuple[int, float, TimeIndex]] = dict()
+_indexesLock = Lock()
+
+
+def timeIndex(csvFile: str, headerLines: int, sep: str, decimal: str) -> TimeIndex:
+    '''
+    Returns the time index of the given csv file, building it on first use and whenever the file has changed.
+    '''
+    size, mtime = fileStat(csvFile)
+    with _indexesLock:
+        cached = _indexes.get(csvFile)
+    if cached is not None and cached[0] == size and cached[1] == mtime:
+        return cached[2]
+    index = buildTimeIndex(csvFile, headerLines, sep, decimal)
+    with _indexesLock:
+        _indexes[csvFile] = (size, mtime, index)
+    return index
+
+
+def readWindow(csvFile: str, headerLines: int, sep: str, decimal: str, window: Tuple[float, float]) -> BytesIO:
+    '''
+    Returns the rows of the given csv file covering the time window as a file-like object, without header.
+    The rows may extend beyond the window and must be filtered on time after parsing.
+    '''
+    start, stop = timeIndex(csvFile, headerLines, sep, decimal).byteRange(*window)
+    with openFile(csvFile, 'rb', mirror=True) as file:
+        file.seek(start)
+        return BytesIO(file.read(stop - start))
@@ -0,0 +1,105 @@
+'''
+Trace preparation shared by the HTML and image outputs. Every (result, figure, signal) trace is looked up and
+downsampled once as NumPy arrays, and the plotted time vector is computed once per result.
+'''
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import sampling_functions
+from down_sampling_method import DownSamplingMethod
+from Figure import Figure
+from figure_type import FigureType
+from Result import ResultType
+from read_and_write_functions import signalColumn
+from derived_signals import DerivedSignals, isExpression, signalAvailable
+from event_zoom import EventZoom, OVERVIEW_POINTS, windowMask
+from plotter_logging import LogLevel, log
+if TYPE_CHECKING:
+    from signal_catalog import SignalInfo
+
+
+class Trace:
+    def __init__(self, displayName: str, resultName: str, index: int) -> None:
+        self.displayName = displayName
+        self.resultName = resultName
+        self.index = index  # Position of the trace within the figure, selects the color
+        self.known = False
+        # Downsampled with the method of the figure, for layouts without event zoom
+        self.x: Optional[np.ndarray] = None
+        self.y: Optional[np.ndarray] = None
+        # Overview and full resolution zoom windows, for layouts with event zoom
+        self.overviewX: Optional[np.ndarray] = None
+        self.overviewY: Optional[np.ndarray] = None
+        self.zoomed: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.dash: Optional[str] = None
+
+
+def resultTime(typ: ResultType, data: pd.DataFrame, pfFlatTIme: float, pscadInitTime: float) -> np.ndarray:
+    '''
+    Returns the plotted time vector of the given result, with the initialisation time removed.
+    '''
+    timeColName = 'time' if typ == ResultType.EMT else data.columns[0]
+    timeoffset = pfFlatTIme if typ == ResultType.RMS else pscadInitTime
+    return data[timeColName].to_numpy(dtype=np.float64) - timeoffset  # type: ignore
+
+
+def downsample(figure: Figure, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if figure.down_sampling_method == DownSamplingMethod.GRADIENT:
+        return sampling_functions.downsample_based_on_gradient(x, y, figure.gradient_threshold)  # type: ignore
+    elif figure.down_sampling_method == DownSamplingMethod.AMOUNT:
+        return sampling_functions.down_sample(x, y)  # type: ignore
+    return x, y
+
+
+def prepareTraces(typ: ResultType,
+                  data: pd.DataFrame,
+                  time: np.ndarray,
+                  signals: Dict[str, SignalInfo],
+                  derived: DerivedSignals,
+                  figures: List[Figure],
+                  resultName: str,
+                  file: str,  # Only for error messages
+                  plain: bool = True,
+                  zoom: Optional[EventZoom] = None,
+                  logUnknown: bool = True) -> List[List[Trace]]:
+    '''
+    Prepares the traces of the given result for each figure. Traces downsampled with the figure method are prepared
+    if plain is set, overview and zoom window traces if zoom is given. Signals missing from the result are logged if logUnknown is set.
+    Spectrum and harmonics figures get no traces here, see spectrum.py.
+    '''
+    signalKey = typ.name.lower()
+    figureTraces: List[List[Trace]] = list()
+    for figure in figures:
+        traces: List[Trace] = list()
+        if figure.type != FigureType.TIME:
+            figureTraces.append(traces)
+            continue
+        for sig in range(1, 4):
+            rawSigName, sigColumn = signalColumn(typ, getattr(figure, f'{signalKey}_signal_{sig}'))
+
+            if isExpression(rawSigName):
+                displayName = f'{resultName}:{rawSigName}'
+            else:
+                displayName = f'{resultName}:{rawSigName.split(" ")[0]}'
+
+            if signalAvailable(rawSigName, signals):
+                trace = Trace(displayName, resultName, len(traces))
+                trace.known = True
+                values = derived.get(rawSigName) if isExpression(rawSigName) else data[sigColumn]  # type: ignore
+                y = np.ascontiguousarray(pd.to_numeric(values, errors='coerce').to_numpy())  # type: ignore
+                if plain:
+                    trace.x, trace.y = downsample(figure, time, y)
+                if zoom is not None:
+                    trace.zoomed = [(time[mask], y[mask]) for mask in (windowMask(time, window) for window in zoom.windows())]
+                    if figure.down_sampling_method == DownSamplingMethod.NO_DOWN_SAMPLING:
+                        trace.overviewX, trace.overviewY = time, y
+                    else:
+                        trace.overviewX, trace.overviewY = sampling_functions.down_sample(time, y, OVERVIEW_POINTS)  # type: ignore
+                traces.append(trace)
+            elif sigColumn != '':
+                if logUnknown:
+                    log(f'Signal "{rawSigName}" not recognized in resultfile: {file}', level=LogLevel.WARNING)
+                traces.append(Trace(f'{displayName} (Unknown)', resultName, len(traces)))
+        figureTraces.append(traces)
+    return figureTraces
@@ -0,0 +1,259 @@
+'''
+Validation of the PowerFactory RMS results against the PSCAD EMT results. The EMT and RMS signals of the figures marked
+for validation in the figure setup (validate column) are paired by position, compensated for the initialisation time of
+each simulator and resampled onto a common grid. Figures comparing instantaneous EMT waveforms with RMS magnitudes are
+not marked, as their deviation is meaningless.
+The time axis is split into windows at the case events (pre-fault, fault, post-fault) and the deviation of the RMS
+signal from the EMT signal is evaluated per window and signal against the tolerances of the config.
+'''
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import csv
+import numpy as np
+from Case import Case
+from Figure import Figure
+from Result import ResultType, Result
+from read_configs import ReadConfig
+from read_and_write_functions import signalColumn
+from result_set import ResultSet
+from derived_signals import DerivedSignals, isExpression, requiredColumns, signalAvailable
+from recordings import uniqueTime
+from traces import resultTime
+from plotter_logging import LogLevel, log, logRank
+
+VALIDATION_FILE = 'validation.csv'
+
+
+class ValidationMetric:
+    def __init__(self,
+                 rank: int,
+                 figure: Figure,
+                 emtSignal: str,
+                 rmsSignal: str,
+                 emtResult: str,
+                 rmsResult: str,
+                 window: str,
+                 start: float,
+                 end: float,
+                 meanError: float,
+                 meanAbsError: float,
+                 maxAbsError: float,
+                 passed: bool) -> None:
+        self.rank = rank
+        self.figure = figure
+        self.emtSignal = emtSignal
+        self.rmsSignal = rmsSignal
+        self.emtResult = emtResult
+        self.rmsResult = rmsResult
+        self.window = window
+        self.start = start
+        self.end = end
+        self.meanError = meanError  # Mean of RMS minus EMT
+        self.meanAbsError = meanAbsError
+        self.maxAbsError = maxAbsError
+        self.passed = passed
+
+
+def caseWindowBoundaries(case: Case) -> List[Tuple[float, str]]:
+    '''
+    Returns the start times and names of the validation windows following the events of the given case.
+    A fault starts a fault window and its clearance a post-fault window.
+    '''
+    boundaries: Dict[float, str] = dict()
+    for eventType, eventTime, _, eventX2 in case.Events:
+        if eventType.lower() == 'nan' or not np.isfinite(eventTime):
+            continue
+        if eventType == 'Clear fault':
+            boundaries.setdefault(eventTime, 'post-fault')
+        elif eventType.count('fault') > 0:
+            boundaries.setdefault(eventTime, 'fault')
+            if isinstance(eventX2, float) and eventX2 > 0.0:
+                boundaries.setdefault(eventTime + eventX2, 'post-fault')
+        else:
+            boundaries.setdefault(eventTime, f'after {eventType}')
+    return sorted(boundaries.items())
+
+
+def validationWindows(boundaries: List[Tuple[float, str]], start: float, end: float) -> List[Tuple[str, float, float]]:
+    '''
+    Splits the time span start to end at the given window boundaries. Returns name, start and end of each window.
+    '''
+    boundaries = [(time, name) for time, name in boundaries if start < time < end]
+    if len(boundaries) == 0:
+        return [('all', start, end)]
+    firstName = 'pre-fault' if boundaries[0][1] == 'fault' else 'pre-event'
+    names = [firstName] + [name for _, name in boundaries]
+    edges = [start] + [time for time, _ in boundaries] + [end]
+    # Repeated names of later windows are numbered, e.g. the windows of a second fault
+    counts: Dict[str, int] = dict()
+    windows: List[Tuple[str, float, float]] = list()
+    for name, windowStart, windowEnd in zip(names, edges[:-1], edges[1:]):
+        counts[name] = counts.get(name, 0) + 1
+        windows.append((name if counts[name] == 1 else f'{name} {counts[name]}', windowStart, windowEnd))
+    return windows
+
+
+def windowMetrics(grid: np.ndarray,
+                  deviation: np.ndarray,
+                  windows: List[Tuple[str, float, float]],
+                  transientTime: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Computes mean error, mean absolute error and maximum absolute error of the deviations (signals x grid) in each window,
+    leaving out the first transientTime seconds of each window. Returns arrays of shape windows x signals.
+    '''
+    starts = np.searchsorted(grid, [windowStart + transientTime for _, windowStart, _ in windows], side='left')
+    ends = np.searchsorted(grid, [windowEnd for _, _, windowEnd in windows], side='left')
+    ends[-1] = len(grid)
+    shape = (len(windows), deviation.shape[0])
+    meanError, meanAbsError, maxAbsError = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    # Window sums from cumulative sums over the grid
+    finite = np.isfinite(deviation)
+    values = np.where(finite, deviation, 0.0)
+    zero = np.zeros((deviation.shape[0], 1))
+    sums = np.concatenate((zero, np.cumsum(values, axis=1)), axis=1)
+    absSums = np.concatenate((zero, np.cumsum(np.abs(values), axis=1)), axis=1)
+    counts = np.concatenate((zero, np.cumsum(finite, axis=1)), axis=1)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if end <= start:
+            continue
+        n = counts[:, end] - counts[:, start]
+        valid = n > 0
+        meanError[i, valid] = (sums[valid, end] - sums[valid, start]) / n[valid]
+        meanAbsError[i, valid] = (absSums[valid, end] - absSums[valid, start]) / n[valid]
+        maxAbsError[i, valid] = np.max(np.abs(values[valid, start:end]), axis=1)
+    return meanError, meanAbsError, maxAbsError
+
+
+def pairResults(resultList: List[Result]) -> List[Tuple[Result, Result]]:
+    '''
+    Pairs each RMS result of a rank with the EMT result of the same group, or the first EMT result of the rank.
+    '''
+    emtResults = [result for result in resultList if result.typ == ResultType.EMT]
+    if len(emtResults) == 0:
+        return []
+    pairs: List[Tuple[Result, Result]] = list()
+    for rmsResult in (result for result in resultList if result.typ == ResultType.RMS):
+        sameGroup = [result for result in emtResults if result.group == rmsResult.group]
+        pairs.append((sameGroup[0] if len(sameGroup) > 0 else emtResults[0], rmsResult))
+    return pairs
+
+
+def signalPairs(figures: List[Figure], emtResult: Result, rmsResult: Result) -> List[Tuple[Figure, str, str]]:
+    '''
+    Returns the EMT and RMS signals of the figures marked for validation available in both results, paired by their
+    position in the figure.
+    '''
+    pairs: List[Tuple[Figure, str, str]] = list()
+    for figure in figures:
+        if not figure.validate:
+            continue
+        for sig in range(1, 4):
+            emtSignal = getattr(figure, f'emt_signal_{sig}')
+            rmsSignal = getattr(figure, f'rms_signal_{sig}')
+            if emtSignal == '' or rmsSignal == '':
+                continue
+            if signalAvailable(signalColumn(ResultType.EMT, emtSignal)[0], emtResult.signals) and \
+                    signalAvailable(signalColumn(ResultType.RMS, rmsSignal)[0], rmsResult.signals):
+                pairs.append((figure, emtSignal, rmsSignal))
+    return pairs
+
+
+def loadSignals(resultSet: ResultSet, result: Result, signals: List[str]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    '''
+    Loads the given signals of a result. Returns the plotted time and the values of each signal.
+    '''
+    data = resultSet.view(result).data(requiredColumns(result, signals))
+    derived = DerivedSignals(result.typ, data)
+    time = resultTime(result.typ, data, resultSet.pfFlatTime, resultSet.pscadInitTime)
+    values: List[np.ndarray] = list()
+    for signal in signals:
+        rawSigName, sigColumn = signalColumn(result.typ, signal)
+        series = derived.get(rawSigName) if isExpression(rawSigName) else data[sigColumn]
+        values.append(series.to_numpy(dtype=np.float64))  # type: ignore
+    return time, values
+
+
+def validateRank(rank: int,
+                 resultSet: ResultSet,
+                 figures: List[Figure],
+                 boundaries: List[Tuple[float, str]],
+                 config: ReadConfig) -> List[ValidationMetric]:
+    '''
+    Validates the RMS results of the given rank against its EMT results.
+    '''
+    metrics: List[ValidationMetric] = list()
+    with logRank(rank):
+        for emtResult, rmsResult in pairResults(resultSet.resultDict.get(rank, [])):
+            pairs = signalPairs(figures, emtResult, rmsResult)
+            if len(pairs) == 0:
+                log(f'No signals to validate between {emtResult.shorthand} and {rmsResult.shorthand}. Comparable figures are '
+                    'marked in the validate column of the figure setup.', level=LogLevel.WARNING)
+                continue
+            emtTime, emtValues = loadSignals(resultSet, emtResult, [emtSignal for _, emtSignal, _ in pairs])
+            rmsTime, rmsValues = loadSignals(resultSet, rmsResult, [rmsSignal for _, _, rmsSignal in pairs])
+
+            # Common grid after the initialisation of both simulators
+            start = max(0.0, float(emtTime[0]), float(rmsTime[0]))
+            end = min(float(emtTime[-1]), float(rmsTime[-1]))
+            if end - start < config.validationStep:
+                log(f'No overlap in time between {emtResult.shorthand} and {rmsResult.shorthand}.', level=LogLevel.WARNING)
+                continue
+            grid = np.arange(start, end, config.validationStep)
+            deviation = np.empty((len(pairs), len(grid)))
+            for i, (emt, rms) in enumerate(zip(emtValues, rmsValues)):
+                emtX, emtY = uniqueTime(emtTime, emt)
+                rmsX, rmsY = uniqueTime(rmsTime, rms)
+                if len(emtX) == 0 or len(rmsX) == 0:
+                    deviation[i] = np.nan
+                    continue
+                deviation[i] = np.interp(grid, rmsX, rmsY) - np.interp(grid, emtX, emtY)
+
+            windows = validationWindows(boundaries, start, end)
+            meanError, meanAbsError, maxAbsError = windowMetrics(grid, deviation, windows, config.validationTransientTime)
+            for w, (window, windowStart, windowEnd) in enumerate(windows):
+                for s, (figure, emtSignal, rmsSignal) in enumerate(pairs):
+                    # Windows without samples after the transient time are not evaluated
+                    if np.isnan(meanAbsError[w, s]):
+                        continue
+                    passed = bool(meanAbsError[w, s] <= config.validationMeanTolerance and
+                                  maxAbsError[w, s] <= config.validationMaxTolerance)
+                    metrics.append(ValidationMetric(rank, figure, emtSignal, rmsSignal, emtResult.shorthand, rmsResult.shorthand,
+                                                    window, windowStart, windowEnd, float(meanError[w, s]),
+                                                    float(meanAbsError[w, s]), float(maxAbsError[w, s]), passed))
+        failed = sum(not metric.passed for metric in metrics)
+        if len(metrics) > 0:
+            log(f'Validation {"passed" if failed == 0 else "failed"}: {failed} of {len(metrics)} checks failed.',
+                level=LogLevel.INFO if failed == 0 else LogLevel.WARNING)
+    return metrics
+
+
+def validateRanks(ranks: List[int],
+                  resultSet: ResultSet,
+                  figureDict: Dict[int, List[Figure]],
+                  windowDict: Optional[Dict[int, List[Tuple[float, str]]]],
+                  config: ReadConfig) -> List[ValidationMetric]:
+    '''
+    Validates the given ranks in parallel. Ranks without case events are validated as a single window.
+    '''
+    with ThreadPoolExecutor(max(config.threads, 1)) as executor:
+        rankMetrics = executor.map(
+            lambda rank: validateRank(rank, resultSet, figureDict[rank],
+                                      windowDict.get(rank, []) if windowDict is not None else [], config),
+            ranks)
+        return [metric for metrics in rankMetrics for metric in metrics]
+
+
+def writeValidation(metrics: List[ValidationMetric], path: str) -> None:
+    '''
+    Writes the pass/fail table of the validation metrics.
+    '''
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(['rank', 'figure', 'emt_signal', 'rms_signal', 'emt_result', 'rms_result', 'window', 'start', 'end',
+                         'mean_error', 'mean_abs_error', 'max_abs_error', 'result'])
+        for metric in metrics:
+            writer.writerow([metric.rank, metric.figure.title, metric.emtSignal, metric.rmsSignal, metric.emtResult,
+                             metric.rmsResult, metric.window, f'{metric.start:.4f}', f'{metric.end:.4f}',
+                             f'{metric.meanError:.6g}', f'{metric.meanAbsError:.6g}', f'{metric.maxAbsError:.6g}',
+                             'PASS' if metric.passed else 'FAIL'])